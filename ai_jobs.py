@@ -0,0 +1,262 @@
+import os
+import re
+import logging
+import threading
+from datetime import datetime, timedelta
+import markdown
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from app import app, db
+from models import User, Question, Answer, AIJob
+from ai_service import request_ai_answer, FALLBACK_ANSWER
+from vector_service import passage_db
+from notifications import notify
+import counters
+
+JOB_STATUSES = ('pending', 'running', 'done', 'failed')
+ERROR_CHARS = 500  # Longest error message kept on a job
+
+class AIJobQueue:
+    """Database-backed queue of Stellar answers, worked off by a fixed pool of threads.
+    
+    Jobs live in the ai_job table, so they survive restarts and can be
+    shared by several processes: a worker claims a job with a conditional
+    UPDATE and only runs it if that UPDATE won. However many mentions
+    arrive, a process never makes more than `workers` Gemini calls at once.
+    """
+    def __init__(self, workers=None, max_attempts=None, retry_delay=None, poll_interval=None,
+                 job_timeout=None):
+        self.workers = workers if workers is not None else int(os.environ.get('AI_JOB_WORKERS', 2))
+        self.max_attempts = max_attempts if max_attempts is not None else \
+            int(os.environ.get('AI_JOB_MAX_ATTEMPTS', 3))
+        # First retry waits this long, then the delay doubles with every attempt
+        self.retry_delay = retry_delay if retry_delay is not None else \
+            float(os.environ.get('AI_JOB_RETRY_DELAY', 30))
+        self.poll_interval = poll_interval if poll_interval is not None else \
+            float(os.environ.get('AI_JOB_POLL_INTERVAL', 5))
+        # Running jobs older than this are assumed lost with their process and run again
+        self.job_timeout = job_timeout if job_timeout is not None else \
+            float(os.environ.get('AI_JOB_TIMEOUT', 300))
+        
+        self._wakeup = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+    
+    def dedupe_key(self, question_id):
+        return f"question:{question_id}"
+    
+    def enqueue(self, question_id, title, prompt, user_id):
+        """Queue a Stellar answer for a question.
+        
+        A question has at most one pending job: asking again before it has
+        started just refreshes that job with the latest text.
+        """
+        dedupe_key = self.dedupe_key(question_id)
+        for _ in range(3):
+            job = AIJob.query.filter_by(dedupe_key=dedupe_key).first()
+            if job is None:
+                job = AIJob(question_id=question_id, dedupe_key=dedupe_key)
+                db.session.add(job)
+            job.title = title
+            job.prompt = prompt
+            job.user_id = user_id
+            try:
+                db.session.commit()
+                break
+            except IntegrityError:
+                # Another request queued the same question first; refresh its job instead
+                db.session.rollback()
+        else:
+            logging.error(f"Could not queue AI job for question {question_id}")
+            return None
+        
+        self.start()
+        self._wakeup.set()
+        return job
+    
+    def start(self):
+        """Start the worker pool if it is not running yet"""
+        with self._lock:
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._worker_loop,
+                                          name=f"ai-job-worker-{len(self._threads)}")
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+    
+    def _worker_loop(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                with app.app_context():
+                    worked = self.work_one()
+            except Exception as e:
+                logging.error(f"Error in AI job worker: {e}")
+                worked = False
+            if not worked:
+                self._wakeup.wait(timeout=self.poll_interval)
+    
+    def work_one(self):
+        """Claim and run the next due job, returning False if there was none"""
+        job = self.claim_next()
+        if job is None:
+            return False
+        self.run_job(job)
+        return True
+    
+    def claim_next(self):
+        """Atomically take the oldest due job, returning it or None"""
+        now = datetime.utcnow()
+        self.requeue_stale(now)
+        candidates = db.session.execute(
+            db.select(AIJob.id)
+              .where(AIJob.status == 'pending', AIJob.run_after <= now)
+              .order_by(AIJob.run_after, AIJob.id)
+              .limit(self.workers + 1)
+        ).scalars().all()
+        
+        for job_id in candidates:
+            # Clearing the dedupe key lets new mentions queue a fresh job while this one runs
+            claimed = db.session.execute(
+                db.update(AIJob)
+                  .where(AIJob.id == job_id, AIJob.status == 'pending')
+                  .values(status='running', dedupe_key=None, started_at=now,
+                          attempts=AIJob.attempts + 1, updated_at=now)
+            )
+            db.session.commit()
+            if claimed.rowcount == 1:
+                return db.session.get(AIJob, job_id)
+        return None
+    
+    def requeue_stale(self, now):
+        """Put back jobs whose worker died mid-run"""
+        stale = AIJob.query.filter(
+            AIJob.status == 'running', AIJob.started_at < now - timedelta(seconds=self.job_timeout)
+        ).all()
+        for job in stale:
+            self.requeue(job, now)
+    
+    def requeue(self, job, run_after):
+        """Return a claimed job to pending, taking back its question's dedupe key.
+        
+        If a new mention queued a job for the question meanwhile, that job
+        has the latest text and this one is dropped, so the question still
+        gets a single answer.
+        """
+        last_error = job.last_error
+        dedupe_key = self.dedupe_key(job.question_id)
+        for _ in range(3):
+            holder = db.session.scalar(
+                db.select(AIJob.id).where(AIJob.dedupe_key == dedupe_key, AIJob.id != job.id)
+            )
+            job.last_error = last_error
+            if holder is None:
+                job.status = 'pending'
+                job.dedupe_key = dedupe_key
+                job.run_after = run_after
+            else:
+                job.status = 'done'
+                job.last_error = f"Superseded by job {holder}"
+            try:
+                db.session.commit()
+                return
+            except IntegrityError:
+                # A mention queued a job between the check and the commit; look again
+                db.session.rollback()
+        logging.error(f"Could not requeue AI job {job.id}")
+    
+    def run_job(self, job):
+        # Strip HTML tags for AI processing
+        clean_title = re.sub(r'<[^>]+>', '', job.title)
+        clean_prompt = re.sub(r'<[^>]+>', '', job.prompt)
+        try:
+            content = request_ai_answer(clean_title, clean_prompt)
+        except Exception as e:
+            logging.warning(f"AI job {job.id} failed on attempt {job.attempts}: {e}")
+            self.job_failed(job, e)
+            return
+        self.post_answer(job, content)
+    
+    def job_failed(self, job, error):
+        """Schedule a retry with exponential backoff, or give up after max_attempts"""
+        if job.attempts < self.max_attempts:
+            job.last_error = str(error)[:ERROR_CHARS]
+            self.requeue(job, datetime.utcnow() + timedelta(seconds=self.retry_delay * 2 ** (job.attempts - 1)))
+        else:
+            # Let the asker know rather than leaving them waiting
+            self.post_answer(job, FALLBACK_ANSWER, status='failed', error=str(error)[:ERROR_CHARS])
+    
+    def post_answer(self, job, content, status='done', error=None):
+        """Finish a job with Stellar's answer and notify the asker.
+        
+        The job is finished by an UPDATE that only matches while this worker
+        still holds it (running, same attempt), in the same commit as the
+        answer. A worker whose job was requeued as stale and claimed again
+        therefore drops its answer, and a job is never answered twice.
+        Returns whether this worker finished the job.
+        """
+        finished = db.session.execute(
+            db.update(AIJob)
+              .where(AIJob.id == job.id, AIJob.status == 'running', AIJob.attempts == job.attempts)
+              .values(status=status, last_error=error, updated_at=datetime.utcnow())
+              .execution_options(synchronize_session=False)
+        ).rowcount
+        if finished != 1:
+            db.session.rollback()
+            logging.warning(f"AI job {job.id} was taken over by another worker; dropping attempt {job.attempts}")
+            return False
+        
+        if db.session.get(Question, job.question_id) is None:
+            db.session.commit()
+            return True
+        
+        # Create AI user if it doesn't exist
+        stellar_user = User.query.filter_by(username='Stellar').first()
+        if not stellar_user:
+            stellar_user = User(
+                username='Stellar',
+                email='stellar@stackit.ai',
+                password_hash='no_login',
+                role='ai'
+            )
+            db.session.add(stellar_user)
+            db.session.flush()
+        
+        # Convert markdown to HTML
+        ai_answer_html = markdown.markdown(content, extensions=['codehilite', 'fenced_code'])
+        
+        db.session.add(Answer(
+            content=ai_answer_html,
+            question_id=job.question_id,
+            user_id=stellar_user.id
+        ))
+        counters.answer_added(job.question_id)
+        notify(job.user_id, "Stellar answered your question!", f"/question/{job.question_id}")
+        db.session.commit()
+        passage_db.update_question(job.question_id)
+        return True
+    
+    def retry(self, job_id):
+        """Run a failed job again from scratch"""
+        job = db.session.get(AIJob, job_id)
+        if job is None or job.status != 'failed':
+            return False
+        job.attempts = 0
+        self.requeue(job, datetime.utcnow())
+        self.start()
+        self._wakeup.set()
+        return True
+    
+    def stats(self):
+        """Return the number of jobs in each status"""
+        counts = dict(db.session.execute(
+            db.select(AIJob.status, func.count(AIJob.id)).group_by(AIJob.status)
+        ).all())
+        return {status: counts.get(status, 0) for status in JOB_STATUSES}
+    
+    def recent_jobs(self, limit=20):
+        return AIJob.query.order_by(AIJob.id.desc()).limit(limit).all()
+
+# Global instance
+ai_job_queue = AIJobQueue()
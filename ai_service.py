@@ -1,28 +1,203 @@
 import os
+import re
 import json
+import time
+import hashlib
 import logging
-from google import genai
-from google.genai import types
+import threading
+from collections import OrderedDict
 from dotenv import load_dotenv
+from llm_backends import CircuitBreaker, create_backend
 
+# Before any settings below are read, so they can come from .env too
 load_dotenv()
 
+_backend = None
+_backend_lock = threading.Lock()
 
-api_key = os.environ.get("GEMINI_API_KEY")
+def get_backend():
+    """Create the configured model backend on first use.
+    
+    AI_BACKEND picks 'gemini' (the default) or 'stub', a deterministic
+    local model for tests and benchmarks.
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                name = os.environ.get('AI_BACKEND', 'gemini')
+                api_key = os.environ.get("GEMINI_API_KEY")
+                if name == 'gemini' and not api_key:
+                    logging.error("GEMINI_API_KEY not found in environment variables. Please create a .env file and add it.")
+                _backend = create_backend(name, api_key=api_key,
+                                          timeout=float(os.environ.get('AI_TIMEOUT', 30)),
+                                          token_delay=float(os.environ.get('AI_STUB_TOKEN_DELAY', 0.05)))
+    return _backend
+
+# Stop calling a failing model for a while instead of tying up every worker
+circuit_breaker = CircuitBreaker(int(os.environ.get('AI_BREAKER_FAILURES', 5)),
+                                 float(os.environ.get('AI_BREAKER_RESET', 30)))
 
+class _Flight:
+    """One upstream call that identical concurrent requests wait on"""
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
 
-if not api_key:
-    logging.error("GEMINI_API_KEY not found in environment variables. Please create a .env file and add it.")
+class ResponseCache:
+    """Bounded LRU cache of model answers with a TTL and single-flight coalescing.
+    
+    Answers are keyed on a hash of the normalized prompt. While a prompt is
+    being answered, identical requests wait for that call instead of making
+    their own. With `semantic_threshold` set, a miss may also be served by a
+    cached answer whose prompt is at least that similar, using the question
+    index's encoder. Waiters give up after `follow_timeout` seconds and
+    make the call themselves, so a stuck leader cannot hold them forever.
+    """
+    def __init__(self, max_entries, ttl, semantic_threshold=None, follow_timeout=120):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.semantic_threshold = semantic_threshold
+        self.follow_timeout = follow_timeout
+        self._entries = OrderedDict()  # key -> (expires_at, answer, space, vector)
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+    
+    def normalize(self, question_title, question_description):
+        text = re.sub(r'<[^>]+>', ' ', f"{question_title}\n{question_description}")
+        return ' '.join(text.lower().split())
+    
+    def key(self, prompt):
+        return hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+    
+    def begin(self, prompt):
+        """Return (answer, flight, leader) for a prompt.
+        
+        `answer` is set on a cache hit. Otherwise the caller either leads
+        the flight, and must call `finish` with its result, or should wait
+        for the leader with `follow`.
+        """
+        key = self.key(prompt)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1], None, False
+            if entry is not None:
+                del self._entries[key]
+            
+            flight = self._inflight.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                return None, flight, False
+            flight = self._inflight[key] = _Flight()
+        
+        try:
+            answer = self.semantic_lookup(prompt)
+        except Exception as e:
+            logging.warning(f"Semantic cache lookup failed: {e}")
+            answer = None
+        except BaseException:
+            # Never leave a flight behind that nobody will finish
+            self.finish(prompt, flight, error=RuntimeError("Request was abandoned"), store=False)
+            raise
+        if answer is not None:
+            self.finish(prompt, flight, answer, store=False)
+            return answer, None, False
+        with self._lock:
+            self.misses += 1
+        return None, flight, True
+    
+    def follow(self, flight):
+        """Wait for the leader's answer; None if it took longer than `follow_timeout`"""
+        if not flight.done.wait(timeout=self.follow_timeout):
+            return None
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+    
+    def finish(self, prompt, flight, answer=None, error=None, store=True):
+        """Publish the leader's result to waiting requests and cache it"""
+        if error is None and store and answer:
+            try:
+                self.put(prompt, answer)
+            except Exception as e:
+                logging.warning(f"Could not cache AI answer: {e}")
+        flight.result, flight.error = answer, error
+        with self._lock:
+            self._inflight.pop(self.key(prompt), None)
+        flight.done.set()
+    
+    def put(self, prompt, answer):
+        if self.max_entries <= 0:
+            return
+        embedded = self.embed(prompt) if self.semantic_threshold else None
+        space, vector = embedded or (None, None)
+        with self._lock:
+            key = self.key(prompt)
+            self._entries[key] = (time.monotonic() + self.ttl, answer, space, vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def embed(self, prompt):
+        # Imported here so the AI service does not load the index unless semantic hits are on
+        from vector_service import vector_db
+        return vector_db.embed(prompt)
+    
+    def semantic_lookup(self, prompt):
+        """Return a cached answer for a similar enough prompt, or None"""
+        if not self.semantic_threshold:
+            return None
+        embedded = self.embed(prompt)
+        if embedded is None:
+            return None
+        space, vector = embedded
+        
+        now = time.monotonic()
+        with self._lock:
+            candidates = [(entry[1], entry[3]) for entry in self._entries.values()
+                          if entry[0] > now and entry[2] == space]
+        best_answer, best_score = None, self.semantic_threshold
+        for answer, cached_vector in candidates:
+            score = (cached_vector @ vector.T).toarray()[0, 0]
+            if score >= best_score:
+                best_answer, best_score = answer, score
+        if best_answer is not None:
+            with self._lock:
+                self.semantic_hits += 1
+        return best_answer
+    
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'semantic_hits': self.semantic_hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced
+            }
 
+semantic_threshold = float(os.environ.get('AI_CACHE_SEMANTIC_THRESHOLD', 0))
+response_cache = ResponseCache(int(os.environ.get('AI_CACHE_SIZE', 256)),
+                               float(os.environ.get('AI_CACHE_TTL', 3600)),
+                               semantic_threshold=semantic_threshold or None,
+                               follow_timeout=float(os.environ.get('AI_CACHE_FOLLOW_TIMEOUT', 120)))
 
-client = genai.Client(api_key=api_key)
+FALLBACK_ANSWER = """I apologize, but I'm currently unable to generate a response due to a technical issue. 
+Please try mentioning me again later, or feel free to ask the community for help!
 
-def generate_ai_answer(question_title, question_description):
-    """
-    Generate an AI answer for a question using Gemini 2.5 Flash
-    """
-    try:
-        prompt = f"""You are Stellar, an AI assistant helping users on a Q&A forum called StackIt.
+Error: AI service temporarily unavailable."""
+
+def build_prompt(question_title, question_description):
+    return f"""You are Stellar, an AI assistant helping users on a Q&A forum called StackIt.
 Please provide a helpful, accurate, and detailed answer to the following question.
 
 Question Title: {question_title}
@@ -36,20 +211,77 @@ Please provide a comprehensive answer that:
 5. Is professional and helpful in tone
 
 Keep your response focused and relevant to the question asked."""
-        
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=prompt
-        )
-        
-        return response.text or "I apologize, but I'm unable to generate a response at the moment."
+
+def request_ai_answer(question_title, question_description):
+    """
+    Ask the model backend for an answer, raising if the call fails.
+    Answers are served from the response cache when possible.
+    """
+    prompt = response_cache.normalize(question_title, question_description)
+    answer, flight, leader = response_cache.begin(prompt)
+    if leader:
+        try:
+            answer = call_model(question_title, question_description)
+        except BaseException as e:
+            response_cache.finish(prompt, flight, error=e if isinstance(e, Exception) else
+                                  RuntimeError("Request was abandoned"))
+            raise
+        response_cache.finish(prompt, flight, answer)
+    elif answer is None:
+        answer = response_cache.follow(flight)
+        if answer is None:
+            # The leader is taking too long; answer this request on its own
+            answer = call_model(question_title, question_description)
+    
+    return answer or "I apologize, but I'm unable to generate a response at the moment."
+
+def call_model(question_title, question_description):
+    return circuit_breaker.call(get_backend().generate, build_prompt(question_title, question_description))
+
+def stream_ai_answer(question_title, question_description):
+    """
+    Yield the answer in chunks as the model produces them, raising if the call fails.
+    Cached answers, and answers another request is already producing, arrive in one chunk.
+    """
+    prompt = response_cache.normalize(question_title, question_description)
+    answer, flight, leader = response_cache.begin(prompt)
+    if answer is not None:
+        yield answer
+        return
+    if not leader:
+        answer = response_cache.follow(flight)
+        if answer is None:
+            # The leader is taking too long; stream this request on its own
+            yield from stream_model(question_title, question_description)
+        else:
+            yield answer
+        return
+    
+    chunks = []
+    try:
+        for text in stream_model(question_title, question_description):
+            chunks.append(text)
+            yield text
+    except BaseException as e:
+        # Also covers the client going away mid-stream (GeneratorExit)
+        response_cache.finish(prompt, flight, error=e if isinstance(e, Exception) else
+                              RuntimeError("Streaming request was abandoned"))
+        raise
+    response_cache.finish(prompt, flight, ''.join(chunks))
+
+def stream_model(question_title, question_description):
+    return circuit_breaker.stream(get_backend().stream, build_prompt(question_title, question_description))
+
+def generate_ai_answer(question_title, question_description):
+    """
+    Generate an AI answer for a question using Gemini 2.5 Flash
+    """
+    try:
+        return request_ai_answer(question_title, question_description)
     
     except Exception as e:
         logging.error(f"Error generating AI answer: {e}")
-        return """I apologize, but I'm currently unable to generate a response due to a technical issue. 
-Please try mentioning me again later, or feel free to ask the community for help!
-
-Error: AI service temporarily unavailable."""
+        return FALLBACK_ANSWER
 
 def check_stellar_mention(text):
     """
@@ -47,6 +47,20 @@ with app.app_context():
     import models
     db.create_all()
     
+    # Older databases predate the denormalized counter columns
+    from counters import upgrade_counters
+    upgrade_counters()
+    
+    # create_all() skips tables that already exist, and with them any new indexes;
+    # some of these cover the counter columns, so they come after the upgrade
+    for model in (models.Question, models.Tag, models.Notification):
+        for index in model.__table__.indexes:
+            index.create(db.engine, checkfirst=True)
+    
+    # Create (and on first run fill) the full-text search table
+    from fulltext import search_index
+    search_index.setup()
+    
     # Create default admin user if it doesn't exist
     from models import User
     from werkzeug.security import generate_password_hash
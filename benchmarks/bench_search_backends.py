@@ -0,0 +1,83 @@
+"""Compare vector search backends against the exact brute-force reference.
+
+Builds a synthetic forum-like corpus (Zipfian vocabulary), fits the same
+TF-IDF settings the app uses, and reports per-query latency and recall@k
+of each backend relative to brute force. Run from the repository root:
+    
+    python benchmarks/bench_search_backends.py --docs 100000 --queries 200
+"""
+import argparse
+import os
+import sys
+import time
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from search_backends import create_index
+
+def synthetic_corpus(n_docs, vocabulary_size, words_per_doc, rng):
+    vocabulary = np.array([f"term{i}" for i in range(vocabulary_size)])
+    weights = 1.0 / np.arange(1, vocabulary_size + 1)
+    weights /= weights.sum()
+    words = rng.choice(vocabulary, size=(n_docs, words_per_doc), p=weights)
+    return [' '.join(row) for row in words]
+
+def top_k_rows(index, query_vectors, top_k, min_similarity):
+    scores = index.score(query_vectors, top_k, min_similarity)
+    results = []
+    for i in range(query_vectors.shape[0]):
+        rows = scores.indices[scores.indptr[i]:scores.indptr[i + 1]]
+        values = scores.data[scores.indptr[i]:scores.indptr[i + 1]]
+        keep = values > min_similarity
+        rows, values = rows[keep], values[keep]
+        order = np.argsort(-values, kind='stable')[:top_k]
+        results.append(set(rows[order].tolist()))
+    return results
+
+def measure(index, query_vectors, top_k, min_similarity):
+    start = time.perf_counter()
+    results = [top_k_rows(index, query_vectors[i], top_k, min_similarity)[0]
+               for i in range(query_vectors.shape[0])]
+    elapsed = time.perf_counter() - start
+    return results, elapsed / query_vectors.shape[0]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--docs', type=int, default=50000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--vocabulary', type=int, default=20000)
+    parser.add_argument('--words', type=int, default=60)
+    parser.add_argument('--top-k', type=int, default=5)
+    parser.add_argument('--min-similarity', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    
+    rng = np.random.default_rng(args.seed)
+    documents = synthetic_corpus(args.docs, args.vocabulary, args.words, rng)
+    # Queries are short snippets of existing documents, like a chat message
+    queries = [' '.join(rng.choice(documents[i].split(), size=8))
+               for i in rng.integers(0, args.docs, size=args.queries)]
+    
+    vectorizer = TfidfVectorizer(max_features=5000, stop_words='english', ngram_range=(1, 2))
+    matrix = vectorizer.fit_transform(documents)
+    query_vectors = vectorizer.transform(queries)
+    print(f"corpus: {matrix.shape[0]} docs, {matrix.nnz} non-zeros; "
+          f"{args.queries} queries, top_k={args.top_k}, min_similarity={args.min_similarity}")
+    
+    exact, exact_latency = measure(create_index('exact', matrix), query_vectors,
+                                   args.top_k, args.min_similarity)
+    print(f"{'backend':<24}{'ms/query':>10}{'speedup':>10}{'recall@k':>10}")
+    print(f"{'exact':<24}{exact_latency * 1000:>10.2f}{1.0:>10.1f}{1.0:>10.3f}")
+    
+    for prune_factor in (1.0, 1.5, 2.0, 4.0):
+        index = create_index('maxscore', matrix, prune_factor=prune_factor)
+        results, latency = measure(index, query_vectors, args.top_k, args.min_similarity)
+        found = sum(len(got & want) for got, want in zip(results, exact))
+        wanted = sum(len(want) for want in exact)
+        recall = found / wanted if wanted else 1.0
+        label = f"maxscore (prune {prune_factor:g})"
+        print(f"{label:<24}{latency * 1000:>10.2f}{exact_latency / latency:>10.1f}{recall:>10.3f}")
+
+if __name__ == '__main__':
+    main()
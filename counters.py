@@ -0,0 +1,385 @@
+import os
+import re
+import time
+import atexit
+import logging
+import threading
+from collections import OrderedDict
+import click
+from sqlalchemy import inspect, text, func, or_, bindparam, event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app import app, db
+from models import User, Question, Answer, Vote, Tag, Notification, question_tags
+
+# Columns added after the first release; create_all() does not add columns to existing tables
+COUNTER_COLUMNS = {
+    'question': {
+        'answer_count': 'INTEGER NOT NULL DEFAULT 0',
+        'accepted_answer_id': 'INTEGER'
+    },
+    'answer': {
+        'upvotes': 'INTEGER NOT NULL DEFAULT 0',
+        'downvotes': 'INTEGER NOT NULL DEFAULT 0'
+    },
+    'tag': {
+        'question_count': 'INTEGER NOT NULL DEFAULT 0'
+    },
+    'user': {
+        'unread_notifications': 'INTEGER NOT NULL DEFAULT 0'
+    }
+}
+
+def add_missing_columns():
+    """Add counter columns missing from an older database, returning whether any were added"""
+    inspector = inspect(db.engine)
+    quote = db.engine.dialect.identifier_preparer.quote  # "user" is a reserved word on PostgreSQL
+    added = False
+    for table, columns in COUNTER_COLUMNS.items():
+        existing = {column['name'] for column in inspector.get_columns(table)}
+        for name, definition in columns.items():
+            if name not in existing:
+                db.session.execute(text(f"ALTER TABLE {quote(table)} ADD COLUMN {name} {definition}"))
+                added = True
+    if added:
+        db.session.commit()
+    return added
+
+# The helpers below change counters with SQL expressions (col = col + n) in the
+# caller's transaction, so they commit or roll back together with the change
+# they count and concurrent requests cannot lose updates.
+
+def answer_added(question_id):
+    db.session.execute(
+        db.update(Question).where(Question.id == question_id)
+          .values(answer_count=Question.answer_count + 1)
+    )
+
+def answer_removed(answer):
+    values = {'answer_count': Question.answer_count - 1}
+    if answer.is_accepted:
+        values['accepted_answer_id'] = None
+    db.session.execute(db.update(Question).where(Question.id == answer.question_id).values(**values))
+
+def vote_changed(answer_id, old_type, new_type):
+    """Apply a vote being cast, switched or withdrawn (old_type/new_type are 'up', 'down' or None).
+    
+    Returns the answer's (score, upvotes, downvotes) after the change.
+    """
+    up = (new_type == 'up') - (old_type == 'up')
+    down = (new_type == 'down') - (old_type == 'down')
+    if not up and not down:
+        return db.session.execute(
+            db.select(Answer.score, Answer.upvotes, Answer.downvotes).where(Answer.id == answer_id)
+        ).first()
+    return db.session.execute(
+        db.update(Answer).where(Answer.id == answer_id)
+          .values(upvotes=Answer.upvotes + up,
+                  downvotes=Answer.downvotes + down,
+                  score=Answer.score + up - down)
+          .returning(Answer.score, Answer.upvotes, Answer.downvotes)
+          .execution_options(synchronize_session=False)
+    ).first()
+
+def toggle_vote(user_id, answer_id, vote_type, attempts=3):
+    """Cast, switch or withdraw (clicking the same vote again) a user's vote on an answer.
+    
+    The vote row is only changed if it is still in the state it was read
+    in, so two concurrent clicks can never both count; the one that loses
+    re-reads and applies its click to the new state. Returns the user's
+    vote afterwards ('up', 'down' or None) and the answer's
+    (score, upvotes, downvotes), committed.
+    """
+    for _ in range(attempts):
+        existing = db.session.execute(
+            db.select(Vote.id, Vote.vote_type).where(Vote.user_id == user_id, Vote.answer_id == answer_id)
+        ).first()
+        old_type = existing.vote_type if existing else None
+        new_type = None if old_type == vote_type else vote_type
+        try:
+            if existing is None:
+                db.session.execute(db.insert(Vote).values(user_id=user_id, answer_id=answer_id, vote_type=new_type))
+                applied = True
+            elif new_type is None:
+                applied = db.session.execute(
+                    db.delete(Vote).where(Vote.id == existing.id, Vote.vote_type == old_type)
+                      .execution_options(synchronize_session=False)
+                ).rowcount == 1
+            else:
+                applied = db.session.execute(
+                    db.update(Vote).where(Vote.id == existing.id, Vote.vote_type == old_type)
+                      .values(vote_type=new_type)
+                      .execution_options(synchronize_session=False)
+                ).rowcount == 1
+        except IntegrityError:
+            # Another request inserted this user's vote first
+            applied = False
+        if applied:
+            counts = vote_changed(answer_id, old_type, new_type)
+            db.session.commit()
+            return new_type, counts
+        db.session.rollback()
+    raise RuntimeError(f"Vote on answer {answer_id} kept conflicting with concurrent votes")
+
+def tags_changed(old_tag_ids, new_tag_ids):
+    """Apply a question's tags changing from one set of ids to another (empty sets for new or deleted questions)"""
+    added = set(new_tag_ids) - set(old_tag_ids)
+    removed = set(old_tag_ids) - set(new_tag_ids)
+    if added:
+        db.session.execute(db.update(Tag).where(Tag.id.in_(added))
+                             .values(question_count=Tag.question_count + 1))
+    if removed:
+        db.session.execute(db.update(Tag).where(Tag.id.in_(removed))
+                             .values(question_count=Tag.question_count - 1))
+    if added or removed:
+        # Dropping the cache now would let another request re-read the old counts before we commit
+        db.session.info['tag_stats_stale'] = True
+
+@event.listens_for(Session, 'after_commit')
+def invalidate_committed_tag_stats(session):
+    if session.info.pop('tag_stats_stale', False):
+        tag_stats.invalidate()
+
+@event.listens_for(Session, 'after_rollback')
+def discard_rolled_back_tag_stats(session):
+    session.info.pop('tag_stats_stale', None)
+
+def notification_added(user_id):
+    """Count a new unread notification, returning the user's unread count"""
+    return db.session.execute(
+        db.update(User).where(User.id == user_id)
+          .values(unread_notifications=User.unread_notifications + 1)
+          .returning(User.unread_notifications)
+          .execution_options(synchronize_session=False)
+    ).scalar()
+
+def notifications_read(user_id, count):
+    """Uncount notifications just marked read, returning the user's unread count"""
+    return db.session.execute(
+        db.update(User).where(User.id == user_id)
+          .values(unread_notifications=User.unread_notifications - count)
+          .returning(User.unread_notifications)
+          .execution_options(synchronize_session=False)
+    ).scalar()
+
+def reconcile_counters():
+    """Recompute every counter from the source tables, returning (questions, answers, tags, users) repaired"""
+    answer_count = db.select(func.count(Answer.id)) \
+                     .where(Answer.question_id == Question.id) \
+                     .scalar_subquery()
+    accepted_answer_id = db.select(Answer.id) \
+                           .where(Answer.question_id == Question.id, Answer.is_accepted == True) \
+                           .order_by(Answer.id) \
+                           .limit(1) \
+                           .scalar_subquery()
+    questions = db.session.execute(
+        db.update(Question)
+          .where(or_(Question.answer_count != answer_count,
+                     Question.accepted_answer_id.is_distinct_from(accepted_answer_id)))
+          .values(answer_count=answer_count, accepted_answer_id=accepted_answer_id)
+          .execution_options(synchronize_session=False)
+    ).rowcount
+    
+    upvotes = db.select(func.count(Vote.id)) \
+                .where(Vote.answer_id == Answer.id, Vote.vote_type == 'up') \
+                .scalar_subquery()
+    downvotes = db.select(func.count(Vote.id)) \
+                  .where(Vote.answer_id == Answer.id, Vote.vote_type == 'down') \
+                  .scalar_subquery()
+    answers = db.session.execute(
+        db.update(Answer)
+          .where(or_(Answer.upvotes != upvotes, Answer.downvotes != downvotes,
+                     Answer.score.is_distinct_from(upvotes - downvotes)))
+          .values(upvotes=upvotes, downvotes=downvotes, score=upvotes - downvotes)
+          .execution_options(synchronize_session=False)
+    ).rowcount
+    
+    question_count = db.select(func.count(question_tags.c.question_id)) \
+                       .where(question_tags.c.tag_id == Tag.id) \
+                       .scalar_subquery()
+    tags = db.session.execute(
+        db.update(Tag)
+          .where(Tag.question_count != question_count)
+          .values(question_count=question_count)
+          .execution_options(synchronize_session=False)
+    ).rowcount
+    
+    unread = db.select(func.count(Notification.id)) \
+               .where(Notification.user_id == User.id, Notification.is_read == False) \
+               .scalar_subquery()
+    users = db.session.execute(
+        db.update(User)
+          .where(User.unread_notifications != unread)
+          .values(unread_notifications=unread)
+          .execution_options(synchronize_session=False)
+    ).rowcount
+    
+    db.session.commit()
+    tag_stats.invalidate()
+    return questions, answers, tags, users
+
+@app.cli.command('reconcile-counters')
+def reconcile_counters_command():
+    """Repair drift in the denormalized answer and vote counters."""
+    questions, answers, tags, users = reconcile_counters()
+    click.echo(f"Repaired counters on {questions} questions, {answers} answers, {tags} tags and {users} users.")
+
+def upgrade_counters():
+    """Bring an older database up to date: add the counter columns and fill them in"""
+    if add_missing_columns():
+        questions, answers, tags, users = reconcile_counters()
+        logging.info(f"Counter columns added; filled in {questions} questions, {answers} answers, "
+                     f"{tags} tags and {users} users")
+
+class TagStats:
+    """The most used tags, read from Tag.question_count and cached in memory.
+    
+    Every page shows the popular tags, so the list is only re-read (one
+    indexed ORDER BY ... LIMIT) after a tag count changes in this process
+    or, to pick up changes made by other processes, after `ttl` seconds.
+    """
+    def __init__(self, size=10, ttl=None):
+        self.size = size
+        self.ttl = ttl if ttl is not None else float(os.environ.get('TAG_STATS_TTL', 60))
+        self._top = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+    
+    def top(self):
+        """Return [(name, question_count)] for the most used tags, most used first"""
+        top = self._top
+        if top is None or time.monotonic() - self._loaded_at > self.ttl:
+            with self._lock:
+                top = db.session.execute(
+                    db.select(Tag.name, Tag.question_count)
+                      .where(Tag.question_count > 0)
+                      .order_by(Tag.question_count.desc(), Tag.id)
+                      .limit(self.size)
+                ).all()
+                top = [tuple(row) for row in top]
+                self._top, self._loaded_at = top, time.monotonic()
+        return top
+    
+    def invalidate(self):
+        self._top = None
+
+class SiteStats:
+    """Community totals for the home page header, counted at most once every `ttl` seconds.
+    
+    The numbers are only a rough sense of scale, so a minute-old count is
+    fine and saves three full-table COUNTs on every home page view.
+    """
+    def __init__(self, ttl=None):
+        self.ttl = ttl if ttl is not None else float(os.environ.get('SITE_STATS_TTL', 60))
+        self._totals = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+    
+    def totals(self):
+        """Return (questions, answers, users)"""
+        totals = self._totals
+        if totals is None or time.monotonic() - self._loaded_at > self.ttl:
+            with self._lock:
+                totals = tuple(db.session.scalar(db.select(func.count()).select_from(model))
+                               for model in (Question, Answer, User))
+                self._totals, self._loaded_at = totals, time.monotonic()
+        return totals
+
+# User agents whose page views are not counted
+BOT_AGENTS = re.compile(r'bot|crawl|spider|slurp|preview|fetch|curl|wget|python-requests|headless', re.IGNORECASE)
+
+class ViewCounter:
+    """Question view counts gathered in memory and written in periodic batches.
+    
+    Page views only touch a dict; a background thread flushes it every
+    `flush_interval` seconds with one executemany UPDATE ... SET views =
+    views + n, so reads stop producing a write transaction each. Counts
+    are eventually consistent and each process flushes its own buffer.
+    Views from bots, and repeat views by the same viewer within
+    `dedupe_window` seconds, are not counted.
+    """
+    max_viewers = 50000  # Recent (viewer, question) pairs remembered for deduplication
+    
+    def __init__(self, flush_interval=None, dedupe_window=None):
+        self.flush_interval = flush_interval if flush_interval is not None else \
+            float(os.environ.get('VIEW_FLUSH_INTERVAL', 10))
+        self.dedupe_window = dedupe_window if dedupe_window is not None else \
+            float(os.environ.get('VIEW_DEDUPE_WINDOW', 600))
+        self._pending = {}  # question_id -> views not yet written
+        self._recent = OrderedDict()  # (viewer, question_id) -> when last counted
+        self._lock = threading.Lock()
+        self._thread = None
+    
+    def record(self, question_id, viewer, user_agent=''):
+        """Count a view unless it comes from a bot or repeats a recent one; returns whether it counted"""
+        if user_agent and BOT_AGENTS.search(user_agent):
+            return False
+        now = time.monotonic()
+        with self._lock:
+            key = (viewer, question_id)
+            seen = self._recent.get(key)
+            if seen is not None and now - seen < self.dedupe_window:
+                return False
+            self._recent[key] = now
+            self._recent.move_to_end(key)
+            while len(self._recent) > self.max_viewers:
+                self._recent.popitem(last=False)
+            self._pending[question_id] = self._pending.get(question_id, 0) + 1
+        self.start()
+        return True
+    
+    def pending(self, question_id):
+        """Views of a question counted here but not written yet"""
+        return self._pending.get(question_id, 0)
+    
+    def flush(self):
+        """Write buffered views in one batched UPDATE, returning how many questions were updated"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        table = Question.__table__
+        try:
+            db.session.execute(
+                table.update().where(table.c.id == bindparam('question_id'))
+                     # A view is not an edit, so updated_at keeps its value
+                     .values(views=func.coalesce(table.c.views, 0) + bindparam('added'),
+                             updated_at=table.c.updated_at),
+                [{'question_id': question_id, 'added': added} for question_id, added in pending.items()]
+            )
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logging.warning(f"Could not write view counts, keeping them for the next flush: {e}")
+            with self._lock:
+                for question_id, added in pending.items():
+                    self._pending[question_id] = self._pending.get(question_id, 0) + added
+            return 0
+        return len(pending)
+    
+    def start(self):
+        """Start the flush thread if it is not running yet"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._flush_loop, name='view-counter')
+            self._thread.daemon = True
+            self._thread.start()
+    
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush_in_app()
+    
+    def flush_in_app(self):
+        with app.app_context():
+            self.flush()
+
+# Global instances
+tag_stats = TagStats()
+site_stats = SiteStats()
+view_counter = ViewCounter()
+# Views still buffered at shutdown are written rather than lost
+atexit.register(view_counter.flush_in_app)
@@ -0,0 +1,221 @@
+import re
+import html
+import logging
+import click
+from markupsafe import Markup, escape
+from sqlalchemy import text, Integer, Float, literal, or_
+from sqlalchemy.exc import OperationalError
+from app import app, db
+from models import Question
+
+SNIPPET_WORDS = 24
+# Highlight markers put around matches by the database; escaped text can never contain them
+MARK_START, MARK_END = '\x02', '\x03'
+
+def plain_text(value):
+    """Strip tags and entities from posted HTML"""
+    return html.unescape(re.sub(r'<[^>]+>', ' ', value or ''))
+
+def highlight(snippet):
+    """Escape a snippet and turn the match markers into <mark> tags"""
+    return Markup(str(escape(snippet)).replace(MARK_START, '<mark>').replace(MARK_END, '</mark>'))
+
+class SQLiteFTSBackend:
+    """SQLite FTS5 table of question text, ranked with bm25 (titles weigh 10x bodies)"""
+    name = 'fts5'
+    
+    def create(self):
+        db.session.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS question_fts "
+            "USING fts5(title, body, tokenize='porter unicode61')"
+        ))
+        db.session.commit()
+    
+    def count(self):
+        return db.session.execute(text("SELECT count(*) FROM question_fts")).scalar()
+    
+    def match_query(self, query):
+        # Quote every word so user input is never parsed as FTS5 syntax; all words must match
+        words = re.findall(r'\w+', query)
+        # An empty phrase matches nothing, which is the right answer for a query of punctuation
+        return ' '.join(f'"{word}"' for word in words) or '""'
+    
+    def matches(self, query):
+        return text(
+            "SELECT rowid AS question_id, -bm25(question_fts, 10.0, 1.0) AS rank "
+            "FROM question_fts WHERE question_fts MATCH :query"
+        ).bindparams(query=self.match_query(query)).columns(question_id=Integer, rank=Float)
+    
+    def snippets(self, query, question_ids):
+        rows = db.session.execute(text(
+            "SELECT rowid, snippet(question_fts, 1, :start, :end, '...', :words) FROM question_fts "
+            "WHERE question_fts MATCH :query AND rowid IN (SELECT value FROM json_each(:ids))"
+        ), {'start': MARK_START, 'end': MARK_END, 'words': SNIPPET_WORDS,
+            'query': self.match_query(query), 'ids': str(list(question_ids))})
+        return dict(rows.all())
+    
+    def upsert(self, question_id, title, body):
+        db.session.execute(text("DELETE FROM question_fts WHERE rowid = :id"), {'id': question_id})
+        db.session.execute(text("INSERT INTO question_fts (rowid, title, body) VALUES (:id, :title, :body)"),
+                           {'id': question_id, 'title': title, 'body': body})
+    
+    def delete(self, question_id):
+        db.session.execute(text("DELETE FROM question_fts WHERE rowid = :id"), {'id': question_id})
+    
+    def clear(self):
+        db.session.execute(text("DELETE FROM question_fts"))
+
+class PostgresFTSBackend:
+    """A tsvector column with a GIN index, ranked with ts_rank_cd (titles weigh more than bodies)"""
+    name = 'tsvector'
+    
+    def __init__(self, config='english'):
+        self.config = config
+    
+    def create(self):
+        db.session.execute(text(
+            "CREATE TABLE IF NOT EXISTS question_fts ("
+            "question_id INTEGER PRIMARY KEY REFERENCES question (id) ON DELETE CASCADE, "
+            "body TEXT NOT NULL, document TSVECTOR NOT NULL)"
+        ))
+        db.session.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_question_fts_document ON question_fts USING GIN (document)"
+        ))
+        db.session.commit()
+    
+    def count(self):
+        return db.session.execute(text("SELECT count(*) FROM question_fts")).scalar()
+    
+    def matches(self, query):
+        # websearch_to_tsquery accepts any user input: quotes, "or" and -exclusions
+        return text(
+            "SELECT question_id, ts_rank_cd(document, websearch_to_tsquery(CAST(:config AS regconfig), :query)) "
+            "AS rank FROM question_fts "
+            "WHERE document @@ websearch_to_tsquery(CAST(:config AS regconfig), :query)"
+        ).bindparams(config=self.config, query=query).columns(question_id=Integer, rank=Float)
+    
+    def snippets(self, query, question_ids):
+        options = f"StartSel={MARK_START}, StopSel={MARK_END}, MaxWords={SNIPPET_WORDS}, MinWords=10"
+        rows = db.session.execute(text(
+            "SELECT question_id, ts_headline(CAST(:config AS regconfig), body, "
+            "websearch_to_tsquery(CAST(:config AS regconfig), :query), :options) "
+            "FROM question_fts WHERE question_id = ANY(:ids)"
+        ), {'config': self.config, 'query': query, 'options': options, 'ids': list(question_ids)})
+        return dict(rows.all())
+    
+    def upsert(self, question_id, title, body):
+        db.session.execute(text(
+            "INSERT INTO question_fts (question_id, body, document) VALUES (:id, :body, "
+            "setweight(to_tsvector(CAST(:config AS regconfig), :title), 'A') || "
+            "setweight(to_tsvector(CAST(:config AS regconfig), :body), 'B')) "
+            "ON CONFLICT (question_id) DO UPDATE SET body = excluded.body, document = excluded.document"
+        ), {'id': question_id, 'title': title, 'body': body, 'config': self.config})
+    
+    def delete(self, question_id):
+        db.session.execute(text("DELETE FROM question_fts WHERE question_id = :id"), {'id': question_id})
+    
+    def clear(self):
+        db.session.execute(text("DELETE FROM question_fts"))
+
+class LikeBackend:
+    """Unranked substring matching, for databases without a full-text engine"""
+    name = 'like'
+    
+    def create(self):
+        pass
+    
+    def count(self):
+        return 0
+    
+    def matches(self, query):
+        return db.select(Question.id.label('question_id'), literal(0.0).label('rank')) \
+                 .where(or_(Question.title.contains(query), Question.description.contains(query)))
+    
+    def snippets(self, query, question_ids):
+        rows = db.session.execute(db.select(Question.id, Question.description).where(Question.id.in_(question_ids)))
+        return {question_id: ' '.join(plain_text(description).split()[:SNIPPET_WORDS])
+                for question_id, description in rows}
+    
+    def upsert(self, question_id, title, body):
+        pass
+    
+    def delete(self, question_id):
+        pass
+    
+    def clear(self):
+        pass
+
+class FullTextIndex:
+    """Full-text search over question titles and descriptions.
+    
+    The backend is picked from the database dialect on first use. Its
+    table holds the plain text of every question and is written in the
+    same transaction as the question itself, so callers must call
+    `update_question` / `delete_question` before they commit.
+    """
+    def __init__(self):
+        self._backend = None
+    
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = create_search_backend(db.engine.dialect.name)
+        return self._backend
+    
+    def setup(self):
+        """Create the search table, filling it in if it is new"""
+        try:
+            self.backend.create()
+        except OperationalError as e:
+            # SQLite builds without FTS5
+            db.session.rollback()
+            logging.warning(f"Full-text search unavailable, falling back to LIKE: {e}")
+            self._backend = LikeBackend()
+            return
+        if self.backend.count() == 0 and Question.query.first() is not None:
+            logging.info(f"Indexed {self.rebuild()} questions for full-text search")
+    
+    def matches(self, query):
+        """Return a subquery of (question_id, rank) for questions matching a search; higher ranks first"""
+        return self.backend.matches(query).subquery('search_matches')
+    
+    def snippets(self, query, question_ids):
+        """Return highlighted body snippets for some matching questions, keyed by id"""
+        if not question_ids:
+            return {}
+        return {question_id: highlight(snippet)
+                for question_id, snippet in self.backend.snippets(query, question_ids).items()}
+    
+    def update_question(self, question):
+        self.backend.upsert(question.id, plain_text(question.title), plain_text(question.description))
+    
+    def delete_question(self, question_id):
+        self.backend.delete(question_id)
+    
+    def rebuild(self):
+        """Re-index every question, returning how many there were"""
+        self.backend.clear()
+        count = 0
+        for question_id, title, description in db.session.execute(
+                db.select(Question.id, Question.title, Question.description)).yield_per(500):
+            self.backend.upsert(question_id, plain_text(title), plain_text(description))
+            count += 1
+        db.session.commit()
+        return count
+
+def create_search_backend(dialect):
+    """Return the full-text backend for a database dialect"""
+    if dialect == 'sqlite':
+        return SQLiteFTSBackend()
+    if dialect == 'postgresql':
+        return PostgresFTSBackend()
+    return LikeBackend()
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """Re-index every question for full-text search."""
+    count = search_index.rebuild()
+    click.echo(f"Indexed {count} questions with the {search_index.backend.name} backend.")
+
+# Global instance
+search_index = FullTextIndex()
@@ -0,0 +1,229 @@
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+import zlib
+import numpy as np
+
+FORMAT_NAME = 'stackit-vector-index'
+FORMAT_VERSION = 1
+JOURNAL_SEGMENT = re.compile(r'^journal\.(\d+)\.log$')
+
+class IndexFormatError(Exception):
+    """Raised when an on-disk index is missing, corrupt or written by another format version"""
+    pass
+
+def _crc32(path, chunk_size=1 << 20):
+    """Checksum a file without reading it into memory at once"""
+    crc = 0
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+def _write_file(path, write):
+    with open(path, 'wb') as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    return {'file': os.path.basename(path), 'size': os.path.getsize(path), 'crc32': _crc32(path)}
+
+def _check_file(build_dir, entry, verify):
+    path = os.path.join(build_dir, entry['file'])
+    if not os.path.exists(path):
+        raise IndexFormatError(f"Missing index file {entry['file']}")
+    if os.path.getsize(path) != entry['size']:
+        raise IndexFormatError(f"Index file {entry['file']} has the wrong size")
+    if verify and _crc32(path) != entry['crc32']:
+        raise IndexFormatError(f"Checksum mismatch in index file {entry['file']}")
+    return path
+
+def current_build(root):
+    """Return the name of the build CURRENT points at, or None"""
+    try:
+        with open(os.path.join(root, 'CURRENT')) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def build_attributes(root):
+    """Return {build name: attributes} for every build on disk with a readable header"""
+    builds_dir = os.path.join(root, 'builds')
+    try:
+        names = os.listdir(builds_dir)
+    except FileNotFoundError:
+        return {}
+    attributes = {}
+    for name in names:
+        try:
+            with open(os.path.join(builds_dir, name, 'header.json')) as f:
+                attributes[name] = json.load(f).get('attributes', {})
+        except (OSError, ValueError):
+            # Still being written, or being removed
+            continue
+    return attributes
+
+def write_index(root, arrays, documents, attributes, keep=2):
+    """Write a new index build and atomically make it current.
+    
+    `arrays` are stored as raw buffers that readers memory-map, `documents`
+    as separate JSON files, and `attributes` inline in the header. Older
+    builds beyond `keep` are removed; processes that still map them keep
+    their pages until they move on.
+    """
+    builds_dir = os.path.join(root, 'builds')
+    name = f"{int(time.time() * 1000)}-{os.getpid()}"
+    build_dir = os.path.join(builds_dir, name)
+    os.makedirs(build_dir)
+    
+    header = {
+        'format': FORMAT_NAME,
+        'version': FORMAT_VERSION,
+        'attributes': attributes,
+        'arrays': {},
+        'documents': {}
+    }
+    for key, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        entry = _write_file(os.path.join(build_dir, f"{key}.bin"), array.tofile)
+        entry.update({'dtype': array.dtype.str, 'shape': list(array.shape)})
+        header['arrays'][key] = entry
+    for key, document in documents.items():
+        payload = json.dumps(document).encode('utf-8')
+        header['documents'][key] = _write_file(os.path.join(build_dir, f"{key}.json"),
+                                               lambda f: f.write(payload))
+    
+    _write_file(os.path.join(build_dir, 'header.json'),
+                lambda f: f.write(json.dumps(header, indent=2).encode('utf-8')))
+    
+    # Point CURRENT at the finished build with a single rename
+    tmp_current = os.path.join(root, f"CURRENT.{os.getpid()}.tmp")
+    _write_file(tmp_current, lambda f: f.write(name.encode('utf-8')))
+    os.replace(tmp_current, os.path.join(root, 'CURRENT'))
+    
+    for old in sorted(os.listdir(builds_dir))[:-keep]:
+        shutil.rmtree(os.path.join(builds_dir, old), ignore_errors=True)
+    return name
+
+def read_index(root, verify=True):
+    """Open the current build, returning (name, arrays, documents, attributes).
+    
+    Arrays are read-only memory maps, so every process opening the same
+    build shares one copy through the page cache.
+    """
+    name = current_build(root)
+    if name is None:
+        raise IndexFormatError(f"No index build found in {root}")
+    build_dir = os.path.join(root, 'builds', name)
+    
+    try:
+        with open(os.path.join(build_dir, 'header.json')) as f:
+            header = json.load(f)
+    except (OSError, ValueError) as e:
+        raise IndexFormatError(f"Unreadable index header: {e}")
+    if header.get('format') != FORMAT_NAME:
+        raise IndexFormatError("Not a vector index build")
+    if header.get('version') != FORMAT_VERSION:
+        raise IndexFormatError(f"Unsupported index format version {header.get('version')}")
+    
+    arrays = {}
+    for key, entry in header['arrays'].items():
+        path = _check_file(build_dir, entry, verify)
+        shape = tuple(entry['shape'])
+        if entry['size'] == 0:
+            # Empty files cannot be memory-mapped
+            arrays[key] = np.empty(shape, dtype=np.dtype(entry['dtype']))
+        else:
+            arrays[key] = np.memmap(path, dtype=np.dtype(entry['dtype']), mode='r', shape=shape)
+    
+    documents = {}
+    for key, entry in header['documents'].items():
+        path = _check_file(build_dir, entry, verify)
+        with open(path, encoding='utf-8') as f:
+            documents[key] = json.load(f)
+    
+    return name, arrays, documents, header['attributes']
+
+class IndexJournal:
+    """Append-only log of changed question ids, shared by every process using an index directory.
+    
+    The log is split into numbered segments. A build starts a new segment
+    before it reads the database, so that segment and the later ones hold
+    every change the build may have missed; nothing is ever truncated, so
+    a change appended by one process cannot be lost to another's rotation.
+    Each line names the process that wrote it, so processes tailing the
+    log can skip their own changes.
+    """
+    def __init__(self, root):
+        self.root = root
+        self.writer = uuid.uuid4().hex[:12]
+    
+    def path(self, number):
+        return os.path.join(self.root, f"journal.{number:08d}.log")
+    
+    def segments(self):
+        """Return [(number, path)] for the journal segments, oldest first"""
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return []
+        numbers = sorted(int(match.group(1)) for match in map(JOURNAL_SEGMENT.match, names) if match)
+        return [(number, self.path(number)) for number in numbers]
+    
+    def latest(self):
+        segments = self.segments()
+        return segments[-1][0] if segments else 0
+    
+    def start_segment(self):
+        """Start a new segment for changes from now on, returning its number"""
+        os.makedirs(self.root, exist_ok=True)
+        number = self.latest() + 1
+        open(self.path(number), 'a').close()
+        return number
+    
+    def append(self, question_id):
+        number = self.latest() or self.start_segment()
+        with open(self.path(number), 'a') as f:
+            f.write(f"{self.writer} {question_id}\n")
+    
+    def read(self, position):
+        """Return the (writer, question_id) entries after a position, and the position after them.
+        
+        A position is (segment number, byte offset); (n, 0) is the start of
+        segment n. Lines from before writers were recorded have writer None.
+        """
+        segment, offset = position
+        entries = []
+        for number, path in self.segments():
+            if number < segment:
+                continue
+            if number > segment:
+                segment, offset = number, 0
+            try:
+                with open(path, 'rb') as f:
+                    f.seek(offset)
+                    data = f.read()
+            except FileNotFoundError:
+                continue
+            # A line still being written is picked up next time
+            complete = data[:data.rfind(b'\n') + 1]
+            offset += len(complete)
+            for line in complete.decode('utf-8').splitlines():
+                fields = line.split()
+                if fields:
+                    entries.append((fields[0] if len(fields) > 1 else None, int(fields[-1])))
+        return entries, (segment, offset)
+    
+    def discard_before(self, segment):
+        """Remove the segments older than `segment`"""
+        for number, path in self.segments():
+            if number < segment:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
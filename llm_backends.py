@@ -0,0 +1,152 @@
+import time
+import hashlib
+import threading
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a backend that has been failing"""
+    pass
+
+class GeminiBackend:
+    """Google Gemini through the genai SDK.
+    
+    The client is created on first use and shared by every call. Each
+    request gets `timeout` seconds; streams must also finish within it.
+    """
+    name = 'gemini'
+    
+    def __init__(self, model='gemini-2.5-flash', api_key=None, timeout=30.0):
+        self.model = model
+        self.api_key = api_key
+        self.timeout = timeout
+        self._client = None
+        self._lock = threading.Lock()
+    
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from google import genai
+                    from google.genai import types
+                    self._client = genai.Client(
+                        api_key=self.api_key,
+                        http_options=types.HttpOptions(timeout=int(self.timeout * 1000))
+                    )
+        return self._client
+    
+    def generate(self, prompt):
+        response = self.client.models.generate_content(model=self.model, contents=prompt)
+        return response.text
+    
+    def stream(self, prompt):
+        deadline = time.monotonic() + self.timeout
+        for chunk in self.client.models.generate_content_stream(model=self.model, contents=prompt):
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Model response took longer than {self.timeout}s")
+            if chunk.text:
+                yield chunk.text
+
+class StubBackend:
+    """Deterministic local model for tests and benchmarks: the reply depends only on the prompt"""
+    name = 'stub'
+    
+    def __init__(self, token_delay=0.0):
+        self.token_delay = token_delay
+    
+    def reply(self, prompt):
+        digest = hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:12]
+        return (f"This is a **local test reply** from Stellar (stub {digest}). "
+                f"Your prompt was {len(prompt)} characters long. "
+                "Set AI_BACKEND=gemini to get real answers.")
+    
+    def generate(self, prompt):
+        return ''.join(self.stream(prompt))
+    
+    def stream(self, prompt):
+        for word in self.reply(prompt).split(' '):
+            if self.token_delay:
+                time.sleep(self.token_delay)
+            yield word + ' '
+
+class CircuitBreaker:
+    """Fails fast once a backend keeps failing.
+    
+    After `failure_threshold` failures in a row the circuit opens and calls
+    raise CircuitOpenError without touching the backend. Every
+    `reset_timeout` seconds one trial call is let through; its success
+    closes the circuit again.
+    """
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+    
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+    
+    def before_call(self):
+        with self._lock:
+            if self.opened_at is None:
+                return
+            if time.monotonic() - self.opened_at >= self.reset_timeout and not self._trial:
+                self._trial = True
+                return
+            raise CircuitOpenError(f"Model backend unavailable after {self.failures} failures")
+    
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+    
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial = False
+    
+    def release(self):
+        """Give up a trial call that ended without an outcome"""
+        with self._lock:
+            self._trial = False
+    
+    def call(self, function, *args):
+        self.before_call()
+        try:
+            result = function(*args)
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success()
+        return result
+    
+    def stream(self, function, *args):
+        """Like `call`, for a generator function; the outcome is known once it is exhausted"""
+        self.before_call()
+        try:
+            yield from function(*args)
+        except Exception:
+            self.record_failure()
+            raise
+        except BaseException:
+            # The consumer went away mid-stream
+            self.release()
+            raise
+        self.record_success()
+
+def create_backend(name, api_key=None, timeout=30.0, token_delay=0.0):
+    """Return the model backend for a name ('gemini' or 'stub')"""
+    if name == 'gemini':
+        return GeminiBackend(api_key=api_key, timeout=timeout)
+    if name == 'stub':
+        return StubBackend(token_delay=token_delay)
+    raise ValueError(f"Unknown AI backend: {name}")
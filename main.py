@@ -1,5 +1,15 @@
 from app import app
 import routes
+from ai_jobs import ai_job_queue
+from notifications import notification_archiver
+
+@app.before_request
+def start_background_workers():
+    """Start the workers once this process serves requests; CLI commands never do, so they run none"""
+    # Pick up AI jobs queued before a restart
+    ai_job_queue.start()
+    # Keep old read notifications out of the hot table
+    notification_archiver.start()
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000)
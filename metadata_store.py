@@ -0,0 +1,199 @@
+import array
+from datetime import datetime, timedelta
+import numpy as np
+
+EPOCH = datetime(1970, 1, 1)
+
+# Numeric columns and their storage dtype
+NUMERIC_FIELDS = {
+    'id': np.int64,
+    'created_at': np.int64,  # Microseconds since the epoch (naive UTC, like the models)
+    'views': np.int64,
+    'answer_count': np.int32
+}
+# Text columns, each stored as one UTF-8 blob plus row offsets into it
+TEXT_FIELDS = ('title', 'description', 'author', 'tags')
+FIELDS = tuple(NUMERIC_FIELDS) + TEXT_FIELDS
+
+# Answer passages: several rows per question, keyed on the question id
+PASSAGE_NUMERIC_FIELDS = {
+    'question_id': np.int64,
+    'answer_id': np.int64,
+    'score': np.int32,
+    'is_accepted': np.int8
+}
+PASSAGE_TEXT_FIELDS = ('title', 'content')
+
+def _encode(field, value):
+    if field == 'created_at':
+        return (datetime.fromisoformat(value) - EPOCH) // timedelta(microseconds=1)
+    if field == 'tags':
+        # Tags are split on commas when posted, so they never contain one
+        return ','.join(value)
+    return value
+
+def _decode(field, value):
+    if field == 'created_at':
+        return (EPOCH + timedelta(microseconds=int(value))).isoformat()
+    if field == 'tags':
+        return value.split(',') if value else []
+    if field == 'is_accepted':
+        return bool(value)
+    if isinstance(value, np.integer):
+        return int(value)
+    return value
+
+class MetadataSchema:
+    """Names the numeric and text columns of a store and the field rows are keyed on"""
+    def __init__(self, numeric_fields, text_fields, key='id'):
+        self.numeric_fields = numeric_fields
+        self.text_fields = text_fields
+        self.fields = tuple(numeric_fields) + tuple(text_fields)
+        self.key = key
+
+QUESTION_SCHEMA = MetadataSchema(NUMERIC_FIELDS, TEXT_FIELDS)
+PASSAGE_SCHEMA = MetadataSchema(PASSAGE_NUMERIC_FIELDS, PASSAGE_TEXT_FIELDS, key='question_id')
+
+class MetadataBuilder:
+    """Accumulates metadata rows into compact columns as they stream in"""
+    def __init__(self, schema=QUESTION_SCHEMA):
+        self.schema = schema
+        self.numeric = {field: array.array('q') for field in schema.numeric_fields}
+        self.blobs = {field: bytearray() for field in schema.text_fields}
+        self.offsets = {field: array.array('q', [0]) for field in schema.text_fields}
+    
+    def __len__(self):
+        return len(self.numeric[self.schema.key])
+    
+    def add(self, info):
+        for field in self.schema.numeric_fields:
+            self.numeric[field].append(_encode(field, info[field]))
+        for field in self.schema.text_fields:
+            self.blobs[field] += _encode(field, info[field]).encode('utf-8')
+            self.offsets[field].append(len(self.blobs[field]))
+    
+    def columns(self):
+        columns = {field: np.array(values, dtype=self.schema.numeric_fields[field])
+                   for field, values in self.numeric.items()}
+        for field in self.schema.text_fields:
+            columns[f"{field}_blob"] = np.frombuffer(bytes(self.blobs[field]), dtype=np.uint8)
+            columns[f"{field}_offsets"] = np.array(self.offsets[field], dtype=np.int64)
+        return columns
+    
+    def build(self):
+        return MetadataStore(self.columns(), self.schema)
+
+class MetadataStore:
+    """Columnar question metadata, row-aligned with the vector matrix.
+    
+    Ids, timestamps and counters are NumPy arrays and text lives in
+    offset-indexed UTF-8 blobs, so a saved store is a handful of buffers
+    that every worker memory-maps instead of a list of dicts per process.
+    Rows written since the store was built are kept as plain dicts in
+    `pending` until the next merge; like the vectors' delta segment, that
+    list is only ever appended to.
+    """
+    def __init__(self, columns, schema=QUESTION_SCHEMA):
+        self.columns = columns
+        self.schema = schema
+        self.n_base = len(columns[schema.key])
+        self.pending = []
+        self._tag_rows = None  # tag -> base rows carrying it, built on first use
+    
+    def __len__(self):
+        return self.n_base + len(self.pending)
+    
+    def get(self, row, fields=None):
+        """Return a row as a dict holding the requested fields (all by default)"""
+        fields = fields or self.schema.fields
+        if row >= self.n_base:
+            info = self.pending[row - self.n_base]
+            return {field: info[field] for field in fields}
+        return {field: self.value(field, row) for field in fields}
+    
+    def value(self, field, row):
+        if field in self.schema.numeric_fields:
+            return _decode(field, self.columns[field][row])
+        offsets = self.columns[f"{field}_offsets"]
+        raw = self.columns[f"{field}_blob"][offsets[row]:offsets[row + 1]]
+        return _decode(field, raw.tobytes().decode('utf-8'))
+    
+    def numeric_values(self, field, rows):
+        """Return a numeric field for many rows as an array, without decoding row by row"""
+        values = np.empty(len(rows), dtype=self.schema.numeric_fields[field])
+        base = rows < self.n_base
+        values[base] = self.columns[field][rows[base]]
+        for i in np.flatnonzero(~base).tolist():
+            values[i] = _encode(field, self.pending[rows[i] - self.n_base][field])
+        return values
+    
+    def tag_rows(self, tag):
+        """Return the base rows carrying a tag"""
+        if self._tag_rows is None:
+            tag_rows = {}
+            for row in range(self.n_base):
+                for name in self.value('tags', row):
+                    tag_rows.setdefault(name, []).append(row)
+            self._tag_rows = {name: np.array(rows, dtype=np.int64) for name, rows in tag_rows.items()}
+        return self._tag_rows.get(tag, np.empty(0, dtype=np.int64))
+    
+    def filter_mask(self, n_rows, tag=None, created_after=None):
+        """Return a boolean mask over the first `n_rows` rows of those matching every filter.
+        
+        Base rows are tested with array operations (tags through a per-tag
+        row index); only the few pending rows are looked at one by one.
+        """
+        keep = np.ones(n_rows, dtype=bool)
+        base = min(self.n_base, n_rows)
+        if created_after is not None:
+            cutoff = _encode('created_at', created_after.isoformat())
+            keep[:base] &= self.columns['created_at'][:base] >= cutoff
+        if tag is not None:
+            tagged = np.zeros(base, dtype=bool)
+            rows = self.tag_rows(tag)
+            tagged[rows[rows < base]] = True
+            keep[:base] &= tagged
+        for row in range(base, n_rows):
+            info = self.pending[row - self.n_base]
+            if created_after is not None and _encode('created_at', info['created_at']) < cutoff:
+                keep[row] = False
+            if tag is not None and tag not in info['tags']:
+                keep[row] = False
+        return keep
+    
+    def ids(self):
+        """Return the key (the question id) of every row"""
+        key = self.schema.key
+        pending_ids = np.array([info[key] for info in self.pending], dtype=np.int64)
+        return np.concatenate([self.columns[key], pending_ids])
+    
+    def append(self, info):
+        self.pending.append(info)
+    
+    def merged(self, n_rows):
+        """Return a store with the first `n_rows` rows all held in columns"""
+        pending = self.pending[:n_rows - self.n_base]
+        if not pending:
+            return self
+        builder = MetadataBuilder(self.schema)
+        for info in pending:
+            builder.add(info)
+        extra = builder.columns()
+        
+        columns = {field: np.concatenate([self.columns[field], extra[field]])
+                   for field in self.schema.numeric_fields}
+        for field in self.schema.text_fields:
+            blob = self.columns[f"{field}_blob"]
+            columns[f"{field}_blob"] = np.concatenate([blob, extra[f"{field}_blob"]])
+            columns[f"{field}_offsets"] = np.concatenate([self.columns[f"{field}_offsets"],
+                                                          extra[f"{field}_offsets"][1:] + len(blob)])
+        return MetadataStore(columns, self.schema)
+    
+    def arrays(self):
+        """Return the columns keyed for saving alongside the index"""
+        return {f"meta_{name}": column for name, column in self.columns.items()}
+    
+    @classmethod
+    def from_arrays(cls, arrays, schema=QUESTION_SCHEMA):
+        columns = {name[len('meta_'):]: column for name, column in arrays.items() if name.startswith('meta_')}
+        return cls(columns, schema)
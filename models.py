@@ -11,6 +11,8 @@ class User(UserMixin, db.Model):
     role = db.Column(db.String(20), default='user')  # user, admin, ai
     reputation = db.Column(db.Integer, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Denormalized from the notification table; kept in step by counters.py
+    unread_notifications = db.Column(db.Integer, default=0, nullable=False)
     
     # Relationships
     questions = db.relationship('Question', backref='author', lazy=True, foreign_keys='Question.user_id')
@@ -23,6 +25,8 @@ class Tag(db.Model):
     name = db.Column(db.String(50), unique=True, nullable=False)
     description = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Denormalized from question_tags; kept in step by counters.py
+    question_count = db.Column(db.Integer, default=0, nullable=False, index=True)
 
 # Association table for many-to-many relationship between questions and tags
 question_tags = db.Table('question_tags',
@@ -39,19 +43,24 @@ class Question(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     is_edited = db.Column(db.Boolean, default=False)
+    # Denormalized from the answer table; kept in step by counters.py
+    answer_count = db.Column(db.Integer, default=0, nullable=False)
+    accepted_answer_id = db.Column(db.Integer, nullable=True)
+    
+    # One index per feed ordering, so keyset pagination can seek straight to a page
+    __table_args__ = (
+        db.Index('ix_question_created_at_id', 'created_at', 'id'),
+        db.Index('ix_question_views_id', 'views', 'id'),
+        db.Index('ix_question_answer_count_id', 'answer_count', 'id'),
+    )
     
     # Relationships
     answers = db.relationship('Answer', backref='question', lazy=True, cascade='all, delete-orphan')
+    ai_jobs = db.relationship('AIJob', backref='question', lazy=True, cascade='all, delete-orphan')
     tags = db.relationship('Tag', secondary=question_tags, lazy='subquery',
                           backref=db.backref('questions', lazy=True))
-    
-    @property
-    def accepted_answer(self):
-        return Answer.query.filter_by(question_id=self.id, is_accepted=True).first()
-    
-    @property
-    def answer_count(self):
-        return Answer.query.filter_by(question_id=self.id).count()
+    accepted_answer = db.relationship('Answer', primaryjoin='foreign(Question.accepted_answer_id) == Answer.id',
+                                      uselist=False, viewonly=True)
 
 class Answer(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -64,14 +73,9 @@ class Answer(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     is_edited = db.Column(db.Boolean, default=False)
     parent_answer_id = db.Column(db.Integer, db.ForeignKey('answer.id'), nullable=True)
-    
-    @property
-    def upvotes(self):
-        return Vote.query.filter_by(answer_id=self.id, vote_type='up').count()
-    
-    @property
-    def downvotes(self):
-        return Vote.query.filter_by(answer_id=self.id, vote_type='down').count()
+    # Denormalized from the vote table; score is upvotes - downvotes
+    upvotes = db.Column(db.Integer, default=0, nullable=False)
+    downvotes = db.Column(db.Integer, default=0, nullable=False)
 
 class Vote(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -89,3 +93,43 @@ class Notification(db.Model):
     link = db.Column(db.String(200))
     is_read = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        # The feed pages by id per user; unread lookups and mark-read go through the second index
+        db.Index('ix_notification_user_id_id', 'user_id', 'id'),
+        db.Index('ix_notification_user_read_created', 'user_id', 'is_read', 'created_at'),
+    )
+
+class NotificationArchive(db.Model):
+    """Read notifications moved out of the notification table once past retention"""
+    id = db.Column(db.Integer, primary_key=True)  # Same id as the original notification
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    message = db.Column(db.Text, nullable=False)
+    link = db.Column(db.String(200))
+    created_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class AIJob(db.Model):
+    """A queued Stellar answer, worked off by the AI job queue"""
+    id = db.Column(db.Integer, primary_key=True)
+    question_id = db.Column(db.Integer, db.ForeignKey('question.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)  # Who to notify
+    title = db.Column(db.String(200), nullable=False)
+    prompt = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), default='pending', nullable=False)  # pending, running, done, failed
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    last_error = db.Column(db.Text)
+    # Set while the job is pending so a question has at most one waiting job
+    dedupe_key = db.Column(db.String(64), unique=True, nullable=True)
+    run_after = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    started_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (db.Index('ix_ai_job_status_run_after', 'status', 'run_after'),)
+
+class RateLimitBucket(db.Model):
+    """Token bucket state shared across worker processes (RATE_LIMIT_STORAGE=database)"""
+    key = db.Column(db.String(100), primary_key=True)
+    tokens = db.Column(db.Float, nullable=False)
+    updated_at = db.Column(db.Float, nullable=False)  # Seconds since the epoch
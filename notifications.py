@@ -0,0 +1,174 @@
+import os
+import time
+import queue
+import logging
+import threading
+from datetime import datetime, timedelta
+import click
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app import app, db
+from models import Notification, NotificationArchive
+import counters
+
+class NotificationHub:
+    """In-process publish/subscribe of notification events, one queue per open stream.
+    
+    Events are handed out only after the transaction that produced them
+    commits, so a stream never announces a notification that was rolled
+    back. Streams are short long-polls: each ends after `stream_timeout`
+    seconds and the browser reopens it, so a tab only holds a request
+    thread briefly and streams held by other worker processes catch up
+    from the stored unread count when they reconnect.
+    """
+    max_queued = 100  # Events kept for a stream that is not reading
+    
+    def __init__(self, stream_timeout=None):
+        self.stream_timeout = stream_timeout if stream_timeout is not None else \
+            float(os.environ.get('NOTIFICATION_STREAM_TIMEOUT', 25))
+        self._subscribers = {}  # user_id -> set of queues
+        self._lock = threading.Lock()
+    
+    def subscribe(self, user_id):
+        subscription = queue.Queue(maxsize=self.max_queued)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+    
+    def unsubscribe(self, user_id, subscription):
+        with self._lock:
+            subscriptions = self._subscribers.get(user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscribers[user_id]
+    
+    def publish(self, user_id, event_name, data):
+        with self._lock:
+            subscriptions = list(self._subscribers.get(user_id, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.put_nowait((event_name, data))
+            except queue.Full:
+                # A stalled stream misses events; the count is sent again when it reconnects
+                pass
+    
+    def connections(self):
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscribers.values())
+    
+    def publish_after_commit(self, user_id, event_name, data):
+        """Publish once the current transaction commits; dropped if it rolls back"""
+        db.session.info.setdefault('notification_events', []).append((user_id, event_name, data))
+
+def notify(user_id, message, link=None):
+    """Add a notification in the current transaction, counting it as unread and pushing it on commit"""
+    notification = Notification(user_id=user_id, message=message, link=link, created_at=datetime.utcnow())
+    db.session.add(notification)
+    unread = counters.notification_added(user_id)
+    notification_hub.publish_after_commit(user_id, 'notification', {
+        'message': message,
+        'link': link,
+        'created_at': notification.created_at.strftime('%Y-%m-%d %H:%M'),
+        'unread': unread
+    })
+    return notification
+
+def mark_read(user_id, up_to_id=None):
+    """Mark a user's notifications read in one UPDATE, returning the unread count (None if none were unread).
+    
+    With `up_to_id` only notifications up to that id are marked, so ones
+    that arrived after the page was drawn stay unread. The user's other
+    open tabs are told the new count on commit.
+    """
+    statement = db.update(Notification).where(Notification.user_id == user_id, Notification.is_read == False)
+    if up_to_id is not None:
+        statement = statement.where(Notification.id <= up_to_id)
+    # Only rows still unread are counted, so concurrent requests cannot uncount one twice
+    marked = db.session.execute(
+        statement.values(is_read=True).execution_options(synchronize_session=False)
+    ).rowcount
+    if not marked:
+        return None
+    unread = counters.notifications_read(user_id, marked)
+    notification_hub.publish_after_commit(user_id, 'unread', {'unread': unread})
+    return unread
+
+@event.listens_for(Session, 'after_commit')
+def publish_committed_events(session):
+    for user_id, event_name, data in session.info.pop('notification_events', []):
+        notification_hub.publish(user_id, event_name, data)
+
+@event.listens_for(Session, 'after_rollback')
+def discard_rolled_back_events(session):
+    session.info.pop('notification_events', None)
+
+class NotificationArchiver:
+    """Moves read notifications older than `retention_days` to notification_archive.
+    
+    Rows move in batches of `batch_size`, each one short transaction, so
+    the hot table stays small without a long lock. Runs every `interval`
+    seconds once started (0 disables the thread), or from the
+    archive-notifications command.
+    """
+    def __init__(self, retention_days=None, interval=None, batch_size=1000):
+        self.retention_days = retention_days if retention_days is not None else \
+            float(os.environ.get('NOTIFICATION_RETENTION_DAYS', 30))
+        self.interval = interval if interval is not None else \
+            float(os.environ.get('NOTIFICATION_ARCHIVE_INTERVAL', 3600))
+        self.batch_size = batch_size
+        self._thread = None
+    
+    def archive(self):
+        """Archive everything past retention, returning how many notifications moved"""
+        cutoff = datetime.utcnow() - timedelta(days=self.retention_days)
+        notifications = Notification.__table__
+        moved = 0
+        while True:
+            ids = db.session.execute(
+                db.select(notifications.c.id)
+                  .where(notifications.c.is_read == True, notifications.c.created_at < cutoff)
+                  .order_by(notifications.c.id)
+                  .limit(self.batch_size)
+            ).scalars().all()
+            if not ids:
+                return moved
+            db.session.execute(
+                db.insert(NotificationArchive).from_select(
+                    ['id', 'user_id', 'message', 'link', 'created_at', 'archived_at'],
+                    db.select(notifications.c.id, notifications.c.user_id, notifications.c.message,
+                              notifications.c.link, notifications.c.created_at, db.literal(datetime.utcnow()))
+                      .where(notifications.c.id.in_(ids))
+                )
+            )
+            db.session.execute(notifications.delete().where(notifications.c.id.in_(ids)))
+            db.session.commit()
+            moved += len(ids)
+    
+    def start(self):
+        if self.interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._thread = threading.Thread(target=self._archive_loop, name='notification-archiver')
+        self._thread.daemon = True
+        self._thread.start()
+    
+    def _archive_loop(self):
+        while True:
+            try:
+                with app.app_context():
+                    moved = self.archive()
+                if moved:
+                    logging.info(f"Archived {moved} read notifications")
+            except Exception as e:
+                logging.error(f"Error archiving notifications: {e}")
+            time.sleep(self.interval)
+
+@app.cli.command('archive-notifications')
+def archive_notifications_command():
+    """Move read notifications past retention to the archive table."""
+    moved = notification_archiver.archive()
+    click.echo(f"Archived {moved} notifications older than {notification_archiver.retention_days:g} days.")
+
+# Global instances
+notification_hub = NotificationHub()
+notification_archiver = NotificationArchiver()
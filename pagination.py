@@ -0,0 +1,138 @@
+import json
+import base64
+import binascii
+from datetime import datetime
+import numpy as np
+from sqlalchemy import or_, and_, func
+from app import db
+from models import Question
+
+# Orderings the question feeds can page through, newest/largest first; the id breaks ties
+SORT_KEYS = {
+    'recent': (Question.created_at, Question.id),
+    'views': (Question.views, Question.id),
+    'answers': (Question.answer_count, Question.id)
+}
+COUNT_LIMIT = 1000  # Estimated totals stop counting here
+
+def encode_cursor(sort, direction, values):
+    """Pack a page boundary into an opaque, URL-safe token"""
+    values = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    payload = json.dumps({'s': sort, 'd': direction, 'k': values}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(token, sort, columns):
+    """Return (direction, values) from a token, or None if it is malformed or for another ordering"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        direction, values = payload['d'], payload['k']
+        if payload['s'] != sort or direction not in ('next', 'prev') or len(values) != len(columns):
+            return None
+        return direction, [datetime.fromisoformat(value) if isinstance(getattr(column, 'type', None), db.DateTime)
+                           else value
+                           for column, value in zip(columns, values)]
+    except (ValueError, TypeError, KeyError, binascii.Error):
+        return None
+
+def _beyond(columns, values, backwards):
+    """Rows strictly after (or before, going backwards) a boundary in descending key order"""
+    conditions = []
+    for i, (column, value) in enumerate(zip(columns, values)):
+        ties = [earlier == earlier_value for earlier, earlier_value in zip(columns[:i], values[:i])]
+        conditions.append(and_(*ties, column > value if backwards else column < value))
+    return or_(*conditions)
+
+class KeysetPage:
+    """One page of a feed plus the tokens for its neighbours.
+    
+    `total` is None unless counting was asked for; an estimated total
+    stops at COUNT_LIMIT, and `total_exact` says whether it got there.
+    """
+    def __init__(self, items, next_cursor=None, prev_cursor=None, total=None, total_exact=True):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.total = total
+        self.total_exact = total_exact
+    
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+    
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+def count_rows(query, count):
+    """Count a query's rows ('exact'), or up to COUNT_LIMIT of them ('estimate'); returns (total, exact)"""
+    query = query.order_by(None)
+    if count == 'exact':
+        return query.count(), True
+    total = db.session.scalar(db.select(func.count()).select_from(query.limit(COUNT_LIMIT).subquery()))
+    return total, total < COUNT_LIMIT
+
+def paginate_ranked(sort, ids, scores, cursor=None, per_page=10):
+    """Return a KeysetPage of ids from an in-memory ranking, best (score, id) first.
+    
+    Uses the same cursors as keyset_paginate, so pages stay put while the
+    ranking is recomputed for every request. Items are the page's ids.
+    """
+    boundary = decode_cursor(cursor, sort, ('score', 'id')) if cursor else None
+    if boundary is None:
+        start, end = 0, min(per_page, len(ids))
+    else:
+        direction, (score, key) = boundary
+        # The ranking is sorted, so rows past the boundary form a suffix (or, going back, a prefix)
+        if direction == 'next':
+            start = len(ids) - int(np.count_nonzero((scores < score) | ((scores == score) & (ids < key))))
+            end = min(start + per_page, len(ids))
+        else:
+            end = int(np.count_nonzero((scores > score) | ((scores == score) & (ids > key))))
+            start = max(end - per_page, 0)
+    
+    page = KeysetPage(ids[start:end].tolist(), total=len(ids))
+    if end > start:
+        if end < len(ids):
+            page.next_cursor = encode_cursor(sort, 'next', [float(scores[end - 1]), int(ids[end - 1])])
+        if start > 0:
+            page.prev_cursor = encode_cursor(sort, 'prev', [float(scores[start]), int(ids[start])])
+    return page
+
+def keyset_paginate(query, sort='recent', cursor=None, per_page=10, count=None, keys=None):
+    """Return a KeysetPage of a question query ordered by SORT_KEYS[sort].
+    
+    Instead of an OFFSET, a page starts from the key of the row its
+    cursor points past, so every page is one index seek of per_page + 1
+    rows however deep it is. Unknown or stale cursors give the first page.
+    Orderings outside SORT_KEYS pass their key expressions in `keys`,
+    ending in a unique column.
+    """
+    columns = keys or SORT_KEYS[sort]
+    boundary = decode_cursor(cursor, sort, columns) if cursor else None
+    direction = boundary[0] if boundary else 'next'
+    backwards = direction == 'prev'
+    
+    seek = query.filter(_beyond(columns, boundary[1], backwards)) if boundary else query
+    ordering = [column.asc() if backwards else column.desc() for column in columns]
+    # Key values are selected alongside each row, so keys need not be columns of the row itself
+    rows = seek.add_columns(*[column.label(f"key_{i}") for i, column in enumerate(columns)]) \
+               .order_by(None).order_by(*ordering).limit(per_page + 1).all()
+    
+    # The extra row only tells us whether there is more in this direction
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+    # Coming back from a later page means there is a next one, and vice versa
+    has_next = more or backwards
+    has_prev = more if backwards else boundary is not None
+    
+    page = KeysetPage([row[0] for row in rows])
+    if rows:
+        if has_next:
+            page.next_cursor = encode_cursor(sort, 'next', list(rows[-1][1:]))
+        if has_prev:
+            page.prev_cursor = encode_cursor(sort, 'prev', list(rows[0][1:]))
+    if count:
+        page.total, page.total_exact = count_rows(query, count)
+    return page
@@ -0,0 +1,156 @@
+import os
+import math
+import time
+import threading
+from sqlalchemy import case
+from sqlalchemy.exc import IntegrityError
+from app import db
+from models import RateLimitBucket
+
+def refilled(tokens, updated_at, now, capacity, rate):
+    """Tokens in a bucket after refilling at `rate` per second since `updated_at`"""
+    return min(capacity, tokens + max(now - updated_at, 0.0) * rate)
+
+class MemoryBucketStore:
+    """Token buckets held in this process; each worker process enforces its own limits.
+    
+    Full buckets are pruned once the store grows past `max_keys`, and again
+    only after it has doubled from what the last prune kept, so the O(n)
+    scan is paid once per n new keys rather than on every take.
+    """
+    max_keys = 10000
+    
+    def __init__(self):
+        self._buckets = {}  # key -> [tokens, updated_at, capacity, rate]
+        self._kept = 0      # Buckets left by the last prune
+        self._lock = threading.Lock()
+    
+    def take(self, key, capacity, rate, cost=1.0):
+        """Take `cost` tokens if the bucket has them, returning (allowed, retry_after)"""
+        now = time.time()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            tokens = capacity if bucket is None else refilled(bucket[0], bucket[1], now, capacity, rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = [min(tokens, capacity), now, capacity, rate]
+            if len(self._buckets) > max(self.max_keys, 2 * self._kept):
+                self.prune(now)
+        return allowed, 0.0 if allowed else (cost - tokens) / rate
+    
+    def prune(self, now):
+        # Buckets that have refilled completely carry no state worth keeping; each
+        # is judged by its own limit, since several limits share the store
+        for key, (tokens, updated_at, capacity, rate) in list(self._buckets.items()):
+            if refilled(tokens, updated_at, now, capacity, rate) >= capacity:
+                del self._buckets[key]
+        self._kept = len(self._buckets)
+
+class DatabaseBucketStore:
+    """Token buckets in the rate_limit_bucket table, shared by every worker process.
+    
+    A take is one conditional UPDATE that refills the bucket and spends
+    from it only WHERE enough tokens are left, so the database applies it
+    atomically and concurrent workers never double-spend (a SELECT then
+    UPDATE would not be atomic on SQLite, which ignores FOR UPDATE).
+    """
+    def __init__(self):
+        self.table = RateLimitBucket.__table__
+    
+    def take(self, key, capacity, rate, cost=1.0):
+        for _ in range(2):
+            try:
+                return self._take(key, capacity, rate, cost)
+            except IntegrityError:
+                # Another worker created the bucket first; take from that one
+                continue
+        return self._take(key, capacity, rate, cost)
+    
+    def _refilled(self, now, capacity, rate):
+        """SQL for the bucket's tokens after refilling, the same sum as refilled()"""
+        elapsed = case((self.table.c.updated_at < now, now - self.table.c.updated_at), else_=0.0)
+        tokens = self.table.c.tokens + elapsed * rate
+        return case((tokens > capacity, capacity), else_=tokens)
+    
+    def _take(self, key, capacity, rate, cost):
+        now = time.time()
+        tokens = self._refilled(now, capacity, rate)
+        left = tokens - cost
+        with db.engine.begin() as connection:
+            spent = connection.execute(
+                db.update(self.table)
+                  .where(self.table.c.key == key, tokens >= cost)
+                  .values(tokens=case((left > capacity, capacity), else_=left), updated_at=now)
+            ).rowcount
+            if spent:
+                return True, 0.0
+            row = connection.execute(
+                db.select(self.table.c.tokens, self.table.c.updated_at).where(self.table.c.key == key)
+            ).first()
+            if row is None:
+                # A new bucket starts full
+                allowed = capacity >= cost
+                connection.execute(db.insert(self.table).values(
+                    key=key, tokens=min(capacity - cost, capacity) if allowed else capacity, updated_at=now))
+                return allowed, 0.0 if allowed else (cost - capacity) / rate
+        # Too few tokens; the row is only read to say how long until there are enough
+        return False, max(cost - refilled(row.tokens, row.updated_at, now, capacity, rate), 0.0) / rate
+
+class RateLimiter:
+    """Per-user and global token buckets in front of the AI endpoints.
+    
+    Each request takes a token from its user's bucket and one from the
+    global bucket. A user's bucket holds `user_burst` tokens and refills at
+    `user_per_minute`; the global bucket bounds the whole site the same
+    way. `concurrency` additionally caps requests holding a model call in
+    this process, so AI traffic cannot occupy every worker thread.
+    """
+    def __init__(self, store=None, user_burst=None, user_per_minute=None, global_burst=None,
+                 global_per_minute=None, concurrency=None, admission_wait=None):
+        self.store = store or create_store(os.environ.get('RATE_LIMIT_STORAGE', 'memory'))
+        self.user_burst = user_burst if user_burst is not None else float(os.environ.get('AI_USER_BURST', 5))
+        self.user_per_minute = user_per_minute if user_per_minute is not None else \
+            float(os.environ.get('AI_USER_PER_MINUTE', 10))
+        self.global_burst = global_burst if global_burst is not None else float(os.environ.get('AI_GLOBAL_BURST', 30))
+        self.global_per_minute = global_per_minute if global_per_minute is not None else \
+            float(os.environ.get('AI_GLOBAL_PER_MINUTE', 120))
+        self.concurrency = concurrency if concurrency is not None else int(os.environ.get('AI_CHAT_CONCURRENCY', 4))
+        # How long a request may wait for a free slot before it is turned away
+        self.admission_wait = admission_wait if admission_wait is not None else \
+            float(os.environ.get('AI_ADMISSION_WAIT', 0.5))
+        self._slots = threading.BoundedSemaphore(self.concurrency)
+        self.rejected = 0
+    
+    def admit(self, user_id):
+        """Spend a token for a user's AI request, returning (allowed, retry_after seconds)"""
+        allowed, retry_after = self.store.take(f"user:{user_id}", self.user_burst, self.user_per_minute / 60)
+        if allowed:
+            allowed, retry_after = self.store.take('global', self.global_burst, self.global_per_minute / 60)
+            if not allowed:
+                # Give the user's token back; the site is busy, not the user
+                self.store.take(f"user:{user_id}", self.user_burst, self.user_per_minute / 60, cost=-1.0)
+        if not allowed:
+            self.rejected += 1
+        return allowed, math.ceil(retry_after)
+    
+    def acquire_slot(self):
+        """Wait briefly for a free model-call slot; returns False if none freed up"""
+        if self._slots.acquire(timeout=self.admission_wait):
+            return True
+        self.rejected += 1
+        return False
+    
+    def release_slot(self):
+        self._slots.release()
+
+def create_store(storage):
+    """Return the bucket store for RATE_LIMIT_STORAGE ('memory' or 'database')"""
+    if storage == 'memory':
+        return MemoryBucketStore()
+    if storage == 'database':
+        return DatabaseBucketStore()
+    raise ValueError(f"Unknown rate limit storage: {storage}")
+
+# Global instance
+ai_rate_limiter = RateLimiter()
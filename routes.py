@@ -1,70 +1,68 @@
 import re
-from flask import render_template, request, redirect, url_for, flash, jsonify, abort
+from flask import render_template, request, redirect, url_for, flash, jsonify, abort, Response, stream_with_context
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
-from sqlalchemy import or_, desc, func
+from sqlalchemy import desc
+from sqlalchemy.orm import joinedload
 from datetime import datetime
 from app import app, db
-from models import User, Question, Answer, Tag, Vote, Notification, question_tags
+from models import User, Question, Answer, Tag, Vote, Notification
 from forms import LoginForm, RegisterForm, QuestionForm, AnswerForm, SearchForm
-from ai_service import generate_ai_answer, check_stellar_mention
-from vector_service import vector_db
-import markdown
+from ai_service import generate_ai_answer, stream_ai_answer, check_stellar_mention, response_cache, circuit_breaker
+from vector_service import vector_db, passage_db
+from ai_jobs import ai_job_queue
+from rate_limits import ai_rate_limiter
+from pagination import keyset_paginate, paginate_ranked, SORT_KEYS
+from fulltext import search_index
+from notifications import notify, mark_read, notification_hub
+from user_directory import user_directory, MAX_PREFIX_RESULTS
+import counters
 import json
+import time
+import queue
+
+def feed_order(sort_by, matches):
+    """Return the (sort, keys) to page a feed by: relevance needs a search, anything unknown is recent"""
+    if sort_by == 'relevance' and matches is not None:
+        return 'relevance', (matches.c.rank, Question.id)
+    return (sort_by if sort_by in SORT_KEYS else 'recent'), None
 
 @app.route('/')
 def index():
     try:
-        page = request.args.get('page', 1, type=int)
+        cursor = request.args.get('cursor')
         search_query = request.args.get('search', '')
         tag_filter = request.args.get('tag', '')
-        sort_by = request.args.get('sort', 'recent')
+        sort_by = request.args.get('sort', 'relevance' if search_query else 'recent')
         
-        query = Question.query
+        # Authors are loaded with the page, not with a query per row
+        query = Question.query.options(joinedload(Question.author))
+        matches = None
         
         # Apply search filter
         if search_query:
-            query = query.filter(
-                or_(Question.title.contains(search_query),
-                    Question.description.contains(search_query))
-            )
+            matches = search_index.matches(search_query)
+            query = query.join(matches, matches.c.question_id == Question.id)
         
         # Apply tag filter
         if tag_filter:
             query = query.join(Question.tags).filter(Tag.name == tag_filter)
         
         # Apply sorting
-        if sort_by == 'recent':
-            query = query.order_by(desc(Question.created_at))
-        elif sort_by == 'unanswered':
-            query = query.filter(~Question.answers.any())
+        if sort_by == 'unanswered':
+            query = query.filter(Question.answer_count == 0)
         
-        questions = query.paginate(
-            page=page, per_page=10, error_out=False
-        )
-        
-        # Get popular tags with question count
-        try:
-            popular_tags = db.session.query(Tag, func.count(question_tags.c.question_id).label('question_count')) \
-                                     .join(question_tags) \
-                                     .group_by(Tag.id) \
-                                     .order_by(desc('question_count')) \
-                                     .limit(10).all()
-        except Exception:
-            # Fallback to simple tag query if join fails
-            popular_tags = [(tag, 0) for tag in Tag.query.limit(10).all()]
+        sort, keys = feed_order(sort_by, matches)
+        questions = keyset_paginate(query, sort=sort, cursor=cursor, per_page=10, keys=keys)
         
         # Get community stats
-        total_questions = Question.query.count()
-        total_answers = Answer.query.count()
-        total_users = User.query.count()
+        total_questions, total_answers, total_users = counters.site_stats.totals()
         
         return render_template('index.html',
                              questions=questions,
                              search_query=search_query,
                              tag_filter=tag_filter,
                              sort_by=sort_by,
-                             popular_tags=popular_tags,
                              total_questions=total_questions,
                              total_answers=total_answers,
                              total_users=total_users)
@@ -126,6 +124,7 @@ def register():
         )
         db.session.add(user)
         db.session.commit()
+        user_directory.add(user)
         
         flash('Registration successful! You can now log in.', 'success')
         return redirect(url_for('login'))
@@ -161,18 +160,18 @@ def ask_question():
             question.tags.append(tag)
         
         db.session.add(question)
+        db.session.flush()
+        counters.tags_changed([], [tag.id for tag in question.tags])
+        search_index.update_question(question)
         db.session.commit()
         
         # Update vector database
         vector_db.update_question(question.id)
         
-        # Check for @Stellar mention - generate AI response in background
+        # Check for @Stellar mention - queue an AI response for the job workers
         if check_stellar_mention(form.description.data):
-            from threading import Thread
-            thread = Thread(target=generate_background_ai_response, 
-                          args=(question.id, form.title.data, form.description.data, current_user.id))
-            thread.daemon = True
-            thread.start()
+            if admit_stellar_request():
+                ai_job_queue.enqueue(question.id, form.title.data, form.description.data, current_user.id)
         
         flash('Your question has been posted!', 'success')
         return redirect(url_for('question_detail', id=question.id))
@@ -183,10 +182,10 @@ def ask_question():
 def question_detail(id):
     question = Question.query.get_or_404(id)
     
-    # Increment view count (only for non-authors to avoid inflating own views)
+    # Count the view (only for non-authors to avoid inflating own views); written in batches
     if not current_user.is_authenticated or current_user.id != question.user_id:
-        question.views += 1
-        db.session.commit()
+        viewer = f"user:{current_user.id}" if current_user.is_authenticated else f"ip:{request.remote_addr}"
+        counters.view_counter.record(id, viewer, request.headers.get('User-Agent', ''))
     
     # Get answers ordered by score and acceptance
     answers = Answer.query.filter_by(question_id=id).order_by(
@@ -195,6 +194,14 @@ def question_detail(id):
     
     form = AnswerForm()
     
+    # The current user's votes, so the page can show which arrows are pressed
+    user_votes = {}
+    if current_user.is_authenticated and answers:
+        user_votes = dict(db.session.execute(
+            db.select(Vote.answer_id, Vote.vote_type)
+              .where(Vote.user_id == current_user.id, Vote.answer_id.in_([answer.id for answer in answers]))
+        ).all())
+    
     # FIX: Check for stellar mention in the route and pass boolean to template
     stellar_was_mentioned = check_stellar_mention(question.description)
     
@@ -202,6 +209,8 @@ def question_detail(id):
                          question=question, 
                          answers=answers, 
                          form=form,
+                         user_votes=user_votes,
+                         views=(question.views or 0) + counters.view_counter.pending(id),
                          stellar_was_mentioned=stellar_was_mentioned)
 
 @app.route('/question/<int:id>/answer', methods=['POST'])
@@ -217,56 +226,44 @@ def post_answer(id):
             user_id=current_user.id
         )
         db.session.add(answer)
+        counters.answer_added(id)
         
         # Create notification for question author
         if question.user_id != current_user.id:
-            notification = Notification(
-                user_id=question.user_id,
-                message=f"{current_user.username} answered your question: {question.title}",
-                link=f"/question/{id}"
-            )
-            db.session.add(notification)
+            notify(question.user_id, f"{current_user.username} answered your question: {question.title}",
+                   f"/question/{id}")
         
         db.session.commit()
+        passage_db.update_question(id)
         flash('Your answer has been posted!', 'success')
     
     return redirect(url_for('question_detail', id=id))
 
-@app.route('/vote/<int:answer_id>/<vote_type>')
+@app.route('/vote/<int:answer_id>/<vote_type>', methods=['GET', 'POST'])
 @login_required
 def vote_answer(answer_id, vote_type):
     if vote_type not in ['up', 'down']:
         abort(400)
     
-    answer = Answer.query.get_or_404(answer_id)
-    existing_vote = Vote.query.filter_by(
-        user_id=current_user.id, 
-        answer_id=answer_id
-    ).first()
-    
-    if existing_vote:
-        if existing_vote.vote_type == vote_type:
-            # Remove vote if clicking the same vote type
-            db.session.delete(existing_vote)
-        else:
-            # Change vote type
-            existing_vote.vote_type = vote_type
-    else:
-        # Create new vote
-        vote = Vote(
-            user_id=current_user.id,
-            answer_id=answer_id,
-            vote_type=vote_type
-        )
-        db.session.add(vote)
+    question_id = db.session.scalar(db.select(Answer.question_id).where(Answer.id == answer_id))
+    if question_id is None:
+        abort(404)
     
-    # Update answer score
-    upvotes = Vote.query.filter_by(answer_id=answer_id, vote_type='up').count()
-    downvotes = Vote.query.filter_by(answer_id=answer_id, vote_type='down').count()
-    answer.score = upvotes - downvotes
+    # Clicking the same vote again withdraws it; counters change by a delta, never a recount
+    user_vote, counts = counters.toggle_vote(current_user.id, answer_id, vote_type)
+    # Chat ranks passages partly by their answer's score
+    passage_db.update_question(question_id)
     
-    db.session.commit()
-    return redirect(url_for('question_detail', id=answer.question_id))
+    # Scripts vote with POST and update the page in place; plain links get the page again
+    if request.method == 'POST':
+        return jsonify({
+            'answer_id': answer_id,
+            'score': counts.score,
+            'upvotes': counts.upvotes,
+            'downvotes': counts.downvotes,
+            'vote': user_vote
+        })
+    return redirect(url_for('question_detail', id=question_id))
 
 @app.route('/accept/<int:answer_id>')
 @login_required
@@ -288,17 +285,14 @@ def accept_answer(answer_id):
     
     # Accept this answer
     answer.is_accepted = True
+    question.accepted_answer_id = answer.id
     
     # Create notification for answer author
     if answer.user_id != current_user.id:
-        notification = Notification(
-            user_id=answer.user_id,
-            message=f"Your answer was accepted on: {question.title}",
-            link=f"/question/{question.id}"
-        )
-        db.session.add(notification)
+        notify(answer.user_id, f"Your answer was accepted on: {question.title}", f"/question/{question.id}")
     
     db.session.commit()
+    passage_db.update_question(question.id)
     flash('Answer accepted!', 'success')
     return redirect(url_for('question_detail', id=question.id))
 
@@ -307,82 +301,74 @@ def accept_answer(answer_id):
 @app.route('/notifications')
 @login_required
 def notifications():
-    notifications = Notification.query.filter_by(
-        user_id=current_user.id
-    ).order_by(desc(Notification.created_at)).limit(20).all()
-    
-    # Mark all as read
-    for notification in notifications:
-        notification.is_read = True
+    """A page of the user's notifications, newest first; `cursor` continues from an earlier page"""
+    page = keyset_paginate(Notification.query.filter_by(user_id=current_user.id), sort='notifications',
+                           cursor=request.args.get('cursor'), per_page=20, keys=(Notification.id,))
+    
+    return jsonify({
+        'notifications': [{
+            'id': n.id,
+            'message': n.message,
+            'link': n.link,
+            'is_read': n.is_read,
+            'created_at': n.created_at.strftime('%Y-%m-%d %H:%M')
+        } for n in page.items],
+        'next_cursor': page.next_cursor,
+        'unread': current_user.unread_notifications
+    })
+
+@app.route('/notifications/read', methods=['POST'])
+@login_required
+def read_notifications():
+    """Mark notifications read, all of them or those up to the `up_to` id the page has seen"""
+    data = request.get_json(silent=True) or request.form
+    up_to_id = data.get('up_to')
+    if up_to_id is not None:
+        try:
+            up_to_id = int(up_to_id)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'up_to must be a notification id'}), 400
+    unread = mark_read(current_user.id, up_to_id)
     db.session.commit()
-    
-    return jsonify([{
-        'id': n.id,
-        'message': n.message,
-        'link': n.link,
-        'created_at': n.created_at.strftime('%Y-%m-%d %H:%M')
-    } for n in notifications])
+    return jsonify({'unread': unread if unread is not None else current_user.unread_notifications})
 
 @app.route('/notifications/count')
 @login_required
 def notification_count():
-    count = Notification.query.filter_by(
-        user_id=current_user.id, 
-        is_read=False
-    ).count()
-    return jsonify({'count': count})
-
-def generate_background_ai_response(question_id, title, description, user_id):
-    """Generate AI response in background thread"""
+    return jsonify({'count': current_user.unread_notifications})
+
+def notification_events(user_id, unread):
+    """Yield a user's notifications as Server-Sent Events until the stream times out.
+    
+    Waiting costs no queries: the count sent first comes from the user row
+    the request loaded anyway, and later events come from the hub.
+    """
+    subscription = notification_hub.subscribe(user_id)
     try:
-        import threading
-        import time
-        import re
-        
-        def ai_response_task():
-            with app.app_context():
-                # Create AI user if it doesn't exist
-                stellar_user = User.query.filter_by(username='Stellar').first()
-                if not stellar_user:
-                    stellar_user = User(
-                        username='Stellar',
-                        email='stellar@stackit.ai',
-                        password_hash='no_login',
-                        role='ai'
-                    )
-                    db.session.add(stellar_user)
-                    db.session.commit()
-                
-                # Strip HTML tags for AI processing
-                clean_description = re.sub(r'<[^>]+>', '', description)
-                clean_title = re.sub(r'<[^>]+>', '', title)
-                
-                ai_answer_content = generate_ai_answer(clean_title, clean_description)
-                # Convert markdown to HTML
-                ai_answer_html = markdown.markdown(ai_answer_content, extensions=['codehilite', 'fenced_code'])
-                
-                ai_answer = Answer(
-                    content=ai_answer_html,
-                    question_id=question_id,
-                    user_id=stellar_user.id
-                )
-                db.session.add(ai_answer)
-                
-                # Create notification for the user
-                notification = Notification(
-                    user_id=user_id,
-                    message=f"Stellar answered your question!",
-                    link=f"/question/{question_id}"
-                )
-                db.session.add(notification)
-                db.session.commit()
-        
-        thread = threading.Thread(target=ai_response_task)
-        thread.daemon = True
-        thread.start()
-        
-    except Exception as e:
-        app.logger.error(f"Error in background AI response: {e}")
+        yield sse_event('unread', {'unread': unread})
+        deadline = time.monotonic() + notification_hub.stream_timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                event, data = subscription.get(timeout=remaining)
+            except queue.Empty:
+                break
+            yield sse_event(event, data)
+    finally:
+        notification_hub.unsubscribe(user_id, subscription)
+
+@app.route('/notifications/stream')
+@login_required
+def notification_stream():
+    """Push notifications and unread counts to the page as a long-poll the browser reopens"""
+    user_id = current_user.id
+    unread = current_user.unread_notifications
+    # Give the database connection back; an idle stream must not hold one from the pool
+    db.session.close()
+    return Response(stream_with_context(notification_events(user_id, unread)), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/profile/<username>')
 def profile(username):
@@ -402,7 +388,27 @@ def admin():
     questions = Question.query.order_by(desc(Question.created_at)).limit(20).all()
     answers = Answer.query.order_by(desc(Answer.created_at)).limit(20).all()
     
-    return render_template('admin.html', users=users, questions=questions, answers=answers)
+    return render_template('admin.html', users=users, questions=questions, answers=answers,
+                         index_generation=vector_db.generation,
+                         cache_stats=vector_db.context_cache.stats(),
+                         ai_job_stats=ai_job_queue.stats(),
+                         ai_jobs=ai_job_queue.recent_jobs(),
+                         ai_cache_stats=response_cache.stats(),
+                         ai_breaker_state=circuit_breaker.state,
+                         ai_rejected=ai_rate_limiter.rejected)
+
+@app.route('/admin/ai_jobs/<int:id>/retry')
+@login_required
+def admin_retry_ai_job(id):
+    """Retry a failed AI job (admin only)"""
+    if current_user.role != 'admin':
+        abort(403)
+    
+    if ai_job_queue.retry(id):
+        flash('AI job queued for another attempt.', 'success')
+    else:
+        flash('Only failed AI jobs can be retried.', 'warning')
+    return redirect(url_for('admin'))
 
 @app.route('/delete_question/<int:id>', methods=['POST'])
 @login_required
@@ -413,11 +419,14 @@ def delete_question(id):
     if current_user.id != question.user_id and current_user.role != 'admin':
         abort(403)
     
+    counters.tags_changed([tag.id for tag in question.tags], [])
     db.session.delete(question)
+    search_index.delete_question(id)
     db.session.commit()
     
     # Update vector database
     vector_db.delete_question(id)
+    passage_db.delete_question(id)
     
     flash('Question deleted successfully.', 'success')
     return redirect(url_for('index'))
@@ -429,8 +438,15 @@ def admin_delete_question(id):
         abort(403)
     
     question = Question.query.get_or_404(id)
+    counters.tags_changed([tag.id for tag in question.tags], [])
     db.session.delete(question)
+    search_index.delete_question(id)
     db.session.commit()
+    
+    # Update vector database
+    vector_db.delete_question(id)
+    passage_db.delete_question(id)
+    
     flash('Question deleted.', 'success')
     return redirect(url_for('admin'))
 
@@ -443,48 +459,116 @@ def ai_chat_page():
 @app.route('/ai_chat', methods=['POST'])
 @login_required
 def ai_chat():
-    """AI Chat endpoint with vector database context"""
+    """AI Chat endpoint with vector database context.
+    
+    With "stream": true in the request body (or an Accept: text/event-stream
+    header) the reply is sent as Server-Sent Events: a "context" event as
+    soon as retrieval is done, then "token" events as the model produces
+    text, then "done".
+    """
     data = request.get_json()
     message = data.get('message', '')
     
     if not message:
         return jsonify({'error': 'No message provided'}), 400
     
+    # Turn excess AI traffic away quickly so it cannot hold up page rendering
+    allowed, retry_after = ai_rate_limiter.admit(current_user.id)
+    if not allowed:
+        return ai_busy_response("You're sending messages too quickly. Please wait a moment and try again.",
+                                429, retry_after)
+    if not ai_rate_limiter.acquire_slot():
+        return ai_busy_response("Stellar is busy right now. Please try again in a moment.", 503, 1)
+    
+    if data.get('stream') or request.accept_mimetypes.best == 'text/event-stream':
+        response = Response(stream_with_context(stream_chat_events(message)), mimetype='text/event-stream',
+                            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+        response.call_on_close(ai_rate_limiter.release_slot)
+        return response
+    
     try:
-        # Get relevant context from vector database
-        context = vector_db.get_context_for_chat(message, max_context=3)
-        
-        # Prepare context for AI
-        context_text = ""
-        if context:
-            context_text = "\n\nRelevant forum discussions:\n"
-            for item in context:
-                context_text += f"- Question: {item['title']}\n  Description: {item['description']}\n"
-                if item['answers']:
-                    context_text += f"  Answers: {item['answers'][0][:100]}...\n"
-                context_text += f"  Link: {item['link']}\n\n"
-        
-        # Generate AI response with context
-        prompt = f"""You are Stellar, an AI assistant for the StackIt Q&A forum. 
-User question: {message}
-
-{context_text}
-
-Please provide a helpful response. If you reference any of the forum discussions above, 
-mention that you're referring to existing forum content. Be conversational and helpful."""
-        
+        prompt, context, passages = build_chat_prompt(message)
         ai_response = generate_ai_answer("Chat Question", prompt)
         
         return jsonify({
             'response': ai_response,
-            'context': context
+            'context': context,
+            'passages': passages
         })
         
     except Exception as e:
+        app.logger.error(f"Error in AI chat: {e}")
         return jsonify({
             'response': 'Sorry, I encountered an error while processing your request. Please try again.',
-            'context': []
+            'context': [],
+            'passages': []
         })
+    finally:
+        ai_rate_limiter.release_slot()
+
+def ai_busy_response(message, status, retry_after):
+    response = jsonify({'error': message, 'retry_after': retry_after})
+    response.status_code = status
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+def admit_stellar_request():
+    """Check the AI rate limits for a @Stellar request, telling the user if it was dropped"""
+    allowed, retry_after = ai_rate_limiter.admit(current_user.id)
+    if not allowed:
+        flash(f'Stellar is handling too many requests and will not answer this one. '
+              f'Try mentioning @Stellar again in {retry_after} seconds.', 'warning')
+    return allowed
+
+def build_chat_prompt(message):
+    """Return (prompt, context, passages) for a chat message"""
+    # Get relevant questions and answer passages from the vector indexes
+    context = vector_db.get_context_for_chat(message, max_context=3)
+    passages = passage_db.get_passages_for_chat(message)
+    
+    # Prepare context for AI
+    context_text = ""
+    if context:
+        context_text = "\n\nRelevant forum discussions:\n"
+        for item in context:
+            context_text += f"- Question: {item['title']}\n  Description: {item['description']}\n"
+            context_text += f"  Link: {item['link']}\n\n"
+    if passages:
+        context_text += "\nRelevant answers:\n"
+        for passage in passages:
+            accepted = " (accepted answer)" if passage['is_accepted'] else ""
+            context_text += f"- On \"{passage['title']}\"{accepted}: {passage['content']}\n"
+            context_text += f"  Link: {passage['link']}\n\n"
+    
+    # Generate AI response with context
+    prompt = f"""You are Stellar, an AI assistant for the StackIt Q&A forum. 
+User question: {message}
+
+{context_text}
+
+Please provide a helpful response. If you reference any of the forum discussions above, 
+mention that you're referring to existing forum content. Be conversational and helpful."""
+    
+    return prompt, context, passages
+
+def sse_event(event, data):
+    """Format one Server-Sent Event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def stream_chat_events(message):
+    """Yield the chat reply as Server-Sent Events"""
+    try:
+        prompt, context, passages = build_chat_prompt(message)
+        
+        # Retrieval is done; let the page show related discussions while the model works
+        yield sse_event('context', {'context': context, 'passages': passages})
+        
+        for text in stream_ai_answer("Chat Question", prompt):
+            yield sse_event('token', {'text': text})
+    except Exception as e:
+        app.logger.error(f"Error streaming AI chat response: {e}")
+        yield sse_event('error', {'text': 'Sorry, I encountered an error while processing your request. Please try again.'})
+    yield sse_event('done', {})
 
 @app.route('/rebuild_index')
 @login_required
@@ -493,11 +577,11 @@ def rebuild_index():
     if current_user.role != 'admin':
         abort(403)
     
-    success = vector_db.build_index()
-    if success:
-        flash('Vector database index rebuilt successfully!', 'success')
-    else:
-        flash('Failed to rebuild index.', 'error')
+    # The rebuild runs on the background builder; searches keep using the
+    # current index until the new one is swapped in.
+    vector_db.request_rebuild()
+    passage_db.request_rebuild()
+    flash(f'Vector database rebuild scheduled (current index generation {vector_db.generation}).', 'success')
     
     return redirect(url_for('admin'))
 
@@ -510,17 +594,27 @@ def admin_delete_answer(id):
     
     answer = Answer.query.get_or_404(id)
     question_id = answer.question_id
+    counters.answer_removed(answer)
     db.session.delete(answer)
     db.session.commit()
+    passage_db.update_question(question_id)
     flash('Answer deleted successfully.', 'success')
     return redirect(url_for('admin'))
 
 @app.route('/api/users')
 @login_required
 def api_users():
-    """API endpoint for user mentions"""
-    users = User.query.with_entities(User.username, User.role).all()
-    return jsonify([{'username': u.username, 'role': u.role} for u in users])
+    """API endpoint for user mentions: users whose name starts with `prefix`, at most `limit` of them"""
+    prefix = request.args.get('prefix', '').strip().lstrip('@')
+    limit = min(max(request.args.get('limit', 10, type=int), 1), MAX_PREFIX_RESULTS)
+    users = user_directory.search(prefix, limit) if prefix else []
+    
+    response = jsonify([{'username': username, 'role': role} for username, role in users])
+    # Lookups repeat as people type and backspace; let the browser reuse them briefly
+    response.cache_control.private = True
+    response.cache_control.max_age = 60
+    response.add_etag()
+    return response.make_conditional(request)
 
 @app.route('/edit_question/<int:id>', methods=['GET', 'POST'])
 @login_required
@@ -539,6 +633,7 @@ def edit_question(id):
         question.updated_at = datetime.utcnow()
         
         # Update tags
+        old_tag_ids = [tag.id for tag in question.tags]
         question.tags.clear()
         tag_names = [tag.strip() for tag in form.tags.data.split(',') if tag.strip()]
         for tag_name in tag_names:
@@ -548,8 +643,12 @@ def edit_question(id):
                 db.session.add(tag)
             question.tags.append(tag)
         
+        db.session.flush()
+        counters.tags_changed(old_tag_ids, [tag.id for tag in question.tags])
+        search_index.update_question(question)
         db.session.commit()
         vector_db.update_question(question.id)
+        passage_db.update_question(question.id)
         flash('Question updated successfully!', 'success')
         return redirect(url_for('question_detail', id=question.id))
     
@@ -574,6 +673,7 @@ def edit_answer(id):
         answer.is_edited = True
         answer.updated_at = datetime.utcnow()
         db.session.commit()
+        passage_db.update_question(answer.question_id)
         flash('Answer updated successfully!', 'success')
         return redirect(url_for('question_detail', id=answer.question_id))
     
@@ -594,27 +694,26 @@ def reply_answer(id):
             parent_answer_id=parent_answer.id
         )
         db.session.add(reply)
+        counters.answer_added(parent_answer.question_id)
         
         # Notify the original answer author
         if parent_answer.user_id != current_user.id:
-            notification = Notification(
-                user_id=parent_answer.user_id,
-                message=f"{current_user.username} replied to your answer",
-                link=url_for('question_detail', id=parent_answer.question_id)
-            )
-            db.session.add(notification)
+            notify(parent_answer.user_id, f"{current_user.username} replied to your answer",
+                   url_for('question_detail', id=parent_answer.question_id))
+        
+        db.session.commit()
         
-        # If replying to Stellar, trigger AI response
-        if parent_answer.author.username == 'Stellar':
+        # If replying to Stellar, queue an AI response
+        if parent_answer.author.username == 'Stellar' and admit_stellar_request():
             question = Question.query.get(parent_answer.question_id)
-            generate_background_ai_response(
+            ai_job_queue.enqueue(
                 question.id, 
                 question.title, 
                 form.content.data, 
                 current_user.id
             )
         
-        db.session.commit()
+        passage_db.update_question(parent_answer.question_id)
         flash('Reply posted successfully!', 'success')
     
     return redirect(url_for('question_detail', id=parent_answer.question_id))
@@ -629,53 +728,66 @@ def search():
     # Get parameters from URL or form
     query = request.args.get('q', '') or (form.query.data if form.validate_on_submit() else '')
     tag_filter = request.args.get('tag', '')
-    sort_by = request.args.get('sort', 'recent')  # recent, views, answers, unanswered
+    sort_by = request.args.get('sort', 'relevance' if query else 'recent')  # relevance, recent, views, answers, unanswered
     date_filter = request.args.get('date', '')  # today, week, month
-    page = request.args.get('page', 1, type=int)
-    
-    if query or tag_filter:
+    mode = request.args.get('mode', 'keyword')  # keyword, semantic
+    cursor = request.args.get('cursor')
+    total_mode = 'exact' if request.args.get('total') == 'exact' else 'estimate'
+    total_exact = True
+    snippets = {}
+    
+    created_after = None
+    if date_filter:
+        from datetime import datetime, timedelta
+        now = datetime.utcnow()
+        if date_filter == 'today':
+            created_after = now - timedelta(days=1)
+        elif date_filter == 'week':
+            created_after = now - timedelta(weeks=1)
+        elif date_filter == 'month':
+            created_after = now - timedelta(days=30)
+    
+    if mode == 'semantic' and query:
+        # Rank by vector similarity; the tag and date filters are applied inside the index
+        question_ids, similarities = vector_db.ranked_matches(query, tag=tag_filter or None,
+                                                              created_after=created_after)
+        questions = paginate_ranked('semantic', question_ids, similarities, cursor=cursor, per_page=10)
+        found = {question.id: question for question in
+                 Question.query.options(joinedload(Question.author)).filter(Question.id.in_(questions.items))}
+        questions.items = [found[question_id] for question_id in questions.items if question_id in found]
+        total_results = questions.total
+    elif query or tag_filter:
         # Build base query
-        search_query = Question.query
+        search_query = Question.query.options(joinedload(Question.author))
+        matches = None
         
         # Apply text search
         if query:
-            search_query = search_query.filter(
-                or_(Question.title.contains(query),
-                    Question.description.contains(query))
-            )
+            matches = search_index.matches(query)
+            search_query = search_query.join(matches, matches.c.question_id == Question.id)
         
         # Apply tag filter
         if tag_filter:
             search_query = search_query.join(Question.tags).filter(Tag.name == tag_filter)
         
         # Apply date filter
-        if date_filter:
-            from datetime import datetime, timedelta
-            now = datetime.utcnow()
-            if date_filter == 'today':
-                search_query = search_query.filter(Question.created_at >= now - timedelta(days=1))
-            elif date_filter == 'week':
-                search_query = search_query.filter(Question.created_at >= now - timedelta(weeks=1))
-            elif date_filter == 'month':
-                search_query = search_query.filter(Question.created_at >= now - timedelta(days=30))
+        if created_after:
+            search_query = search_query.filter(Question.created_at >= created_after)
         
         # Apply sorting
-        if sort_by == 'recent':
-            search_query = search_query.order_by(desc(Question.created_at))
-        elif sort_by == 'views':
-            search_query = search_query.order_by(desc(Question.views))
-        elif sort_by == 'answers':
-            search_query = search_query.outerjoin(Answer).group_by(Question.id).order_by(desc(func.count(Answer.id)))
-        elif sort_by == 'unanswered':
-            search_query = search_query.filter(~Question.answers.any()).order_by(desc(Question.created_at))
-        
-        # Get total count
-        total_results = search_query.count()
-        
-        # Paginate results
-        questions = search_query.paginate(
-            page=page, per_page=10, error_out=False
-        )
+        if sort_by == 'unanswered':
+            search_query = search_query.filter(Question.answer_count == 0)
+        
+        # Paginate results; the total is only counted up to COUNT_LIMIT unless asked for exactly
+        sort, keys = feed_order(sort_by, matches)
+        questions = keyset_paginate(search_query, sort=sort, cursor=cursor, per_page=10,
+                                    count=total_mode, keys=keys)
+        total_results = questions.total
+        total_exact = questions.total_exact
+        
+        # Highlighted snippets for just the questions on this page
+        if query:
+            snippets = search_index.snippets(query, [question.id for question in questions.items])
     
     # Get all tags for filter dropdown
     all_tags = Tag.query.order_by(Tag.name).all()
@@ -688,30 +800,24 @@ def search():
                          form=form, 
                          questions=questions, 
                          total_results=total_results,
+                         total_exact=total_exact,
+                         snippets=snippets,
                          query=query,
                          tag_filter=tag_filter,
                          sort_by=sort_by,
                          date_filter=date_filter,
+                         mode=mode,
                          all_tags=all_tags)
 
 @app.context_processor
 def inject_template_vars():
     unread_count = 0
     if current_user.is_authenticated:
-        unread_count = Notification.query.filter_by(user_id=current_user.id, is_read=False).count()
-    
-    # Get popular tags with question count
-    try:
-        popular_tags = db.session.query(Tag, func.count(question_tags.c.question_id).label('question_count')) \
-                                 .join(question_tags) \
-                                 .group_by(Tag.id) \
-                                 .order_by(desc('question_count')) \
-                                 .limit(10).all()
-    except Exception:
-        # Fallback to simple tag query if join fails
-        popular_tags = [(tag, 0) for tag in Tag.query.limit(10).all()]
+        # Stored on the user row, which is loaded for the request anyway
+        unread_count = current_user.unread_notifications
     
     return {
         'unread_notification_count': unread_count,
-        'popular_tags': popular_tags
+        # (name, question count) pairs, served from memory between tag changes
+        'popular_tags': counters.tag_stats.top()
     }
@@ -0,0 +1,121 @@
+import numpy as np
+from scipy import sparse
+
+class ExactIndex:
+    """Brute-force scoring of every row: the reference other backends are measured against"""
+    name = 'exact'
+    
+    def __init__(self, matrix):
+        self.matrix = matrix
+    
+    def score(self, query_vectors, top_k, min_similarity=0.0, excluded_rows=None):
+        """Return a sparse (queries x rows) matrix of exact scores"""
+        return (self.matrix @ query_vectors.T).T.tocsr()
+
+class MaxScoreIndex:
+    """Term-at-a-time search over posting lists with MaxScore early termination.
+    
+    Query terms are processed in order of their best possible contribution.
+    Once the remaining terms together could no longer lift an unseen row
+    past the current k-th best score (or `min_similarity`), their posting
+    lists are only probed for rows that are already candidates instead of
+    being scanned. With `prune_factor` 1.0 results are exact; larger values
+    stop scanning earlier, trading recall for latency.
+    """
+    name = 'maxscore'
+    
+    def __init__(self, matrix, prune_factor=1.0):
+        if prune_factor < 1.0:
+            raise ValueError("prune_factor must be at least 1.0")
+        self.n_rows = matrix.shape[0]
+        self.postings = sparse.csc_matrix(matrix)
+        self.postings.sort_indices()
+        self.term_max = self.postings.max(axis=0).toarray().ravel()
+        self.prune_factor = prune_factor
+    
+    def score(self, query_vectors, top_k, min_similarity=0.0, excluded_rows=None):
+        """Return a sparse (queries x rows) matrix holding scores for candidate rows only"""
+        query_vectors = sparse.csr_matrix(query_vectors)
+        if excluded_rows is None:
+            excluded_rows = np.empty(0, dtype=np.int64)
+        
+        indptr = [0]
+        all_rows, all_scores = [], []
+        for i in range(query_vectors.shape[0]):
+            terms = query_vectors.indices[query_vectors.indptr[i]:query_vectors.indptr[i + 1]]
+            weights = query_vectors.data[query_vectors.indptr[i]:query_vectors.indptr[i + 1]]
+            rows, scores = self.search_one(terms, weights, top_k, min_similarity, excluded_rows)
+            all_rows.append(rows)
+            all_scores.append(scores)
+            indptr.append(indptr[-1] + len(rows))
+        
+        return sparse.csr_matrix(
+            (np.concatenate(all_scores) if all_scores else np.empty(0),
+             np.concatenate(all_rows) if all_rows else np.empty(0, dtype=np.int64),
+             np.array(indptr)),
+            shape=(query_vectors.shape[0], self.n_rows)
+        )
+    
+    def posting(self, term):
+        start, end = self.postings.indptr[term], self.postings.indptr[term + 1]
+        return self.postings.indices[start:end], self.postings.data[start:end]
+    
+    def search_one(self, terms, weights, top_k, min_similarity, excluded_rows):
+        """Return (rows, scores) for one query's candidate rows"""
+        if not len(terms):
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        bounds = weights * self.term_max[terms]
+        order = np.argsort(-bounds, kind='stable')
+        terms, weights, bounds = terms[order], weights[order], bounds[order]
+        # remaining[i] is the most any row can gain from terms after i
+        remaining = np.append(np.cumsum(bounds[::-1])[::-1][1:], 0.0)
+        
+        rows = np.empty(0, dtype=np.int64)
+        scores = np.empty(0)
+        row_parts, score_parts = [], []
+        essential = len(terms)
+        for i, (term, weight) in enumerate(zip(terms, weights)):
+            posting_rows, posting_weights = self.posting(term)
+            row_parts.append(posting_rows)
+            score_parts.append(posting_weights * weight)
+            
+            # Cheap check first: no candidate can score more than the bounds seen so far
+            if remaining[i] > max(bounds[:i + 1].sum(), min_similarity) * self.prune_factor:
+                continue
+            rows, scores = self.accumulate(row_parts, score_parts)
+            if remaining[i] <= self.threshold(rows, scores, top_k, min_similarity, excluded_rows) * self.prune_factor:
+                essential = i + 1
+                break
+        else:
+            rows, scores = self.accumulate(row_parts, score_parts)
+        
+        # Non-essential terms can only add to rows that are already candidates
+        for term, weight in zip(terms[essential:], weights[essential:]):
+            posting_rows, posting_weights = self.posting(term)
+            if not len(posting_rows) or not len(rows):
+                continue
+            positions = np.minimum(np.searchsorted(posting_rows, rows), len(posting_rows) - 1)
+            hits = posting_rows[positions] == rows
+            scores[hits] += weight * posting_weights[positions[hits]]
+        
+        return rows, scores
+    
+    def accumulate(self, row_parts, score_parts):
+        rows, inverse = np.unique(np.concatenate(row_parts), return_inverse=True)
+        return rows, np.bincount(inverse, weights=np.concatenate(score_parts), minlength=len(rows))
+    
+    def threshold(self, rows, scores, top_k, min_similarity, excluded_rows):
+        """Score a row must beat to make the results, from the partial scores so far"""
+        if len(excluded_rows):
+            scores = scores[~np.isin(rows, excluded_rows)]
+        if len(scores) < top_k:
+            return min_similarity
+        return max(min_similarity, np.partition(scores, len(scores) - top_k)[len(scores) - top_k])
+
+def create_index(backend, matrix, prune_factor=1.0):
+    """Build the search index for a backend name ('exact' or 'maxscore')"""
+    if backend == 'exact':
+        return ExactIndex(matrix)
+    if backend == 'maxscore':
+        return MaxScoreIndex(matrix, prune_factor=prune_factor)
+    raise ValueError(f"Unknown vector search backend: {backend}")
@@ -13,41 +13,62 @@ function initializeNotifications() {
         return;
     }
     
-    updateNotificationCount();
     loadNotifications();
     
-    // Update notification count every 30 seconds
-    setInterval(updateNotificationCount, 30000);
+    // The server pushes new notifications; browsers without EventSource poll every 30 seconds
+    if (window.EventSource) {
+        subscribeToNotifications();
+    } else {
+        updateNotificationCount();
+        setInterval(updateNotificationCount, 30000);
+    }
     
     // Load notifications when dropdown is opened
     const notificationDropdown = document.getElementById('notificationDropdown');
     if (notificationDropdown) {
         notificationDropdown.addEventListener('click', function() {
-            loadNotifications();
+            loadNotifications(true);
         });
     }
 }
 
+// Listen for pushed notifications; EventSource reconnects by itself when the stream ends
+function subscribeToNotifications() {
+    const source = new EventSource('/notifications/stream');
+    
+    source.addEventListener('unread', event => {
+        setNotificationCount(JSON.parse(event.data).unread);
+    });
+    
+    source.addEventListener('notification', event => {
+        const notification = JSON.parse(event.data);
+        setNotificationCount(notification.unread);
+        showToast('New notification', notification.message, 'info');
+    });
+}
+
 // Update notification count badge
 function updateNotificationCount() {
     fetch('/notifications/count')
         .then(response => response.json())
-        .then(data => {
-            const badge = document.getElementById('notificationCount');
-            if (badge) {
-                if (data.count > 0) {
-                    badge.textContent = data.count > 99 ? '99+' : data.count;
-                    badge.style.display = 'inline';
-                } else {
-                    badge.style.display = 'none';
-                }
-            }
-        })
+        .then(data => setNotificationCount(data.count))
         .catch(error => console.error('Error fetching notification count:', error));
 }
 
-// Load notifications dropdown content
-function loadNotifications() {
+function setNotificationCount(count) {
+    const badge = document.getElementById('notificationCount');
+    if (badge) {
+        if (count > 0) {
+            badge.textContent = count > 99 ? '99+' : count;
+            badge.style.display = 'inline';
+        } else {
+            badge.style.display = 'none';
+        }
+    }
+}
+
+// Load notifications dropdown content; opening the dropdown marks what it shows as read
+function loadNotifications(markRead) {
     fetch('/notifications')
         .then(response => response.json())
         .then(data => {
@@ -57,28 +78,16 @@ function loadNotifications() {
             // Clear existing content
             notificationList.innerHTML = '<li><h6 class="dropdown-header">Notifications</h6></li>';
             
-            if (data.length === 0) {
+            if (data.notifications.length === 0) {
                 notificationList.innerHTML += '<li><p class="dropdown-item-text text-muted">No notifications</p></li>';
                 return;
             }
             
-            data.forEach(notification => {
-                const item = document.createElement('li');
-                item.innerHTML = `
-                    <a class="dropdown-item" href="${notification.link || '#'}">
-                        <div class="notification-item">
-                            <p class="mb-1 small">${escapeHtml(notification.message)}</p>
-                            <small class="text-muted">${notification.created_at}</small>
-                        </div>
-                    </a>
-                `;
-                notificationList.appendChild(item);
-            });
+            appendNotifications(notificationList, data);
             
-            // Add "View All" link if there are notifications
-            if (data.length > 0) {
-                notificationList.innerHTML += '<li><hr class="dropdown-divider"></li>';
-                notificationList.innerHTML += '<li><a class="dropdown-item text-center" href="#"><small>View All Notifications</small></a></li>';
+            // Newer notifications than the ones shown stay unread
+            if (markRead && data.unread > 0) {
+                markNotificationsRead(data.notifications[0].id);
             }
         })
         .catch(error => {
@@ -90,6 +99,50 @@ function loadNotifications() {
         });
 }
 
+function appendNotifications(notificationList, data) {
+    data.notifications.forEach(notification => {
+        const item = document.createElement('li');
+        item.innerHTML = `
+            <a class="dropdown-item${notification.is_read ? '' : ' fw-semibold'}" href="${notification.link || '#'}">
+                <div class="notification-item">
+                    <p class="mb-1 small">${escapeHtml(notification.message)}</p>
+                    <small class="text-muted">${notification.created_at}</small>
+                </div>
+            </a>
+        `;
+        notificationList.appendChild(item);
+    });
+    
+    // Older notifications are fetched a page at a time
+    if (data.next_cursor) {
+        const more = document.createElement('li');
+        more.innerHTML = '<hr class="dropdown-divider"><button type="button" class="dropdown-item text-center"><small>Older notifications</small></button>';
+        more.querySelector('button').addEventListener('click', function(event) {
+            event.stopPropagation();
+            more.remove();
+            fetch(`/notifications?cursor=${encodeURIComponent(data.next_cursor)}`)
+                .then(response => response.json())
+                .then(older => appendNotifications(notificationList, older))
+                .catch(error => console.error('Error loading notifications:', error));
+        });
+        notificationList.appendChild(more);
+    }
+}
+
+function markNotificationsRead(upToId) {
+    fetch('/notifications/read', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'Accept': 'application/json'
+        },
+        body: JSON.stringify({up_to: upToId})
+    })
+    .then(response => response.json())
+    .then(data => setNotificationCount(data.unread))
+    .catch(error => console.error('Error marking notifications read:', error));
+}
+
 // Initialize Bootstrap tooltips
 function initializeTooltips() {
     const tooltipTriggerList = [].slice.call(document.querySelectorAll('[data-bs-toggle="tooltip"]'));
@@ -138,31 +191,43 @@ function escapeHtml(text) {
 
 // Vote functionality with visual feedback
 function handleVote(button, answerId, voteType) {
-    const scoreElement = button.closest('.vote-section').querySelector('.vote-score');
-    const originalScore = parseInt(scoreElement.textContent);
+    const voteSection = button.closest('.vote-section');
+    const scoreElement = voteSection.querySelector('.vote-score');
     
-    // Add loading state
+    // Ignore repeat clicks while a vote is in flight
+    if (button.classList.contains('loading')) {
+        return;
+    }
     button.classList.add('loading');
     
-    // Make vote request
+    // The server applies the vote as a delta and answers with the new totals
     fetch(`/vote/${answerId}/${voteType}`, {
         method: 'POST',
         headers: {
-            'Content-Type': 'application/json',
+            'Accept': 'application/json'
         }
     })
     .then(response => {
-        if (response.ok) {
-            
-            const newScore = voteType === 'up' ? originalScore + 1 : originalScore - 1;
-            scoreElement.textContent = newScore;
-            
-            // Add visual feedback
-            scoreElement.classList.add('fade-in');
-            setTimeout(() => scoreElement.classList.remove('fade-in'), 300);
-        } else {
+        if (response.redirected) {
+            // Session expired: the vote was bounced to the login page
+            window.location.href = response.url;
+            return null;
+        }
+        if (!response.ok) {
             throw new Error('Vote failed');
         }
+        return response.json();
+    })
+    .then(data => {
+        if (!data) return;
+        scoreElement.textContent = data.score;
+        voteSection.querySelectorAll('[data-vote]').forEach(voteButton => {
+            voteButton.classList.toggle('active', voteButton.dataset.vote === data.vote);
+        });
+        
+        // Add visual feedback
+        scoreElement.classList.add('fade-in');
+        setTimeout(() => scoreElement.classList.remove('fade-in'), 300);
     })
     .catch(error => {
         console.error('Error voting:', error);
@@ -1,3 +1,6 @@
+// Most users fetched for one @mention prefix; the server caps this too
+const MENTION_LIMIT = 10;
+
 class MentionAutocomplete {
     constructor(quill) {
         this.quill = quill;
@@ -8,15 +11,14 @@ class MentionAutocomplete {
             quill.container.parentNode.appendChild(this.container);
         }
         this.dropdown = null;
-        this.users = [];
+        this.results = new Map();  // Lowercase prefix -> matching users, as returned by the server
+        this.lookupTimer = null;
         this.mentionStartIndex = -1;
         
         this.init();
     }
 
-    async init() {
-        await this.loadUsers();
-        
+    init() {
         this.quill.on('text-change', (delta, oldDelta, source) => {
             if (source === 'user') {
                 this.handleInput();
@@ -40,14 +42,23 @@ class MentionAutocomplete {
         this.quill.keyboard.addBinding({ key: 'Escape' }, this.hideDropdown.bind(this));
     }
 
-    async loadUsers() {
-        try {
-            const response = await fetch('/api/users');
-            if (!response.ok) throw new Error('Failed to load users');
-            this.users = await response.json();
-        } catch (error) {
-            console.error('Could not load users for mentions:', error);
+    async findUsers(query) {
+        const prefix = query.toLowerCase();
+        if (this.results.has(prefix)) return this.results.get(prefix);
+        
+        // A shorter prefix that matched fewer users than the limit already holds every match
+        for (let length = prefix.length - 1; length > 0; length--) {
+            const shorter = this.results.get(prefix.substring(0, length));
+            if (shorter && shorter.length < MENTION_LIMIT) {
+                return shorter.filter(user => user.username.toLowerCase().startsWith(prefix));
+            }
         }
+        
+        const response = await fetch(`/api/users?prefix=${encodeURIComponent(query)}&limit=${MENTION_LIMIT}`);
+        if (!response.ok) throw new Error('Failed to load users');
+        const users = await response.json();
+        this.results.set(prefix, users);
+        return users;
     }
 
     handleInput() {
@@ -72,10 +83,33 @@ class MentionAutocomplete {
         }
 
         this.mentionStartIndex = atIndex;
-        const filteredUsers = this.users.filter(user => user.username.toLowerCase().startsWith(query.toLowerCase()));
+        if (query.length === 0) {
+            this.hideDropdown();
+            return;
+        }
+        
+        // Wait for a pause in typing before asking the server
+        clearTimeout(this.lookupTimer);
+        this.lookupTimer = setTimeout(() => this.lookup(query), 150);
+    }
+
+    async lookup(query) {
+        let users;
+        try {
+            users = await this.findUsers(query);
+        } catch (error) {
+            console.error('Could not load users for mentions:', error);
+            return;
+        }
+        
+        // Ignore answers for a word the user has already moved past
+        const selection = this.quill.getSelection();
+        if (!selection || this.quill.getText(this.mentionStartIndex, selection.index - this.mentionStartIndex) !== '@' + query) {
+            return;
+        }
         
-        if (filteredUsers.length > 0) {
-            this.showDropdown(filteredUsers);
+        if (users.length > 0) {
+            this.showDropdown(users);
         } else {
             this.hideDropdown();
         }
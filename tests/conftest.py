@@ -0,0 +1,57 @@
+import os
+import sys
+import uuid
+import tempfile
+import pytest
+from werkzeug.security import generate_password_hash
+
+# Point the app at throwaway storage and the local model before it is imported
+_storage = tempfile.mkdtemp(prefix='stackit-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_storage, 'test.db')}"
+os.environ['VECTOR_INDEX_DIR'] = os.path.join(_storage, 'vector_index')
+os.environ['PASSAGE_INDEX_DIR'] = os.path.join(_storage, 'passage_index')
+os.environ['AI_BACKEND'] = 'stub'
+os.environ['AI_STUB_TOKEN_DELAY'] = '0'
+os.environ['NOTIFICATION_ARCHIVE_INTERVAL'] = '0'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, db
+import routes  # noqa: F401 (registers the views)
+from models import User, Question, Answer
+
+@pytest.fixture
+def app_context():
+    with app.app_context():
+        yield
+        db.session.remove()
+
+@pytest.fixture
+def user(app_context):
+    name = f"user-{uuid.uuid4().hex[:8]}"
+    user = User(username=name, email=f"{name}@example.com", password_hash=generate_password_hash('secret'))
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+@pytest.fixture
+def client(user):
+    """A test client logged in as `user`"""
+    app.config['WTF_CSRF_ENABLED'] = False
+    client = app.test_client()
+    client.post('/login', data={'username': user.username, 'password': 'secret'})
+    return client
+
+@pytest.fixture
+def question(user):
+    question = Question(title='How do I reverse a list?', description='<p>Looking for the idiomatic way.</p>',
+                        user_id=user.id)
+    db.session.add(question)
+    db.session.commit()
+    return question
+
+@pytest.fixture
+def answer(question, user):
+    answer = Answer(content='<p>Use reversed() or slicing.</p>', question_id=question.id, user_id=user.id)
+    db.session.add(answer)
+    db.session.commit()
+    return answer
@@ -0,0 +1,115 @@
+import threading
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import event
+import ai_jobs
+from app import app, db
+from models import AIJob, Answer, Notification, User
+from ai_jobs import AIJobQueue
+
+@pytest.fixture
+def job_queue(app_context):
+    # Start from an empty queue with no worker threads: the tests work jobs off by hand
+    AIJob.query.delete()
+    db.session.commit()
+    return AIJobQueue(workers=0, max_attempts=3, retry_delay=0)
+
+def jobs_for(question):
+    return AIJob.query.filter_by(question_id=question.id).order_by(AIJob.id).all()
+
+def stellar_answers(question):
+    stellar = User.query.filter_by(username='Stellar').first()
+    return Answer.query.filter_by(question_id=question.id, user_id=stellar.id).count()
+
+def test_job_posts_the_stub_answer_and_notifies(job_queue, question, user):
+    job_queue.enqueue(question.id, question.title, question.description, user.id)
+    assert job_queue.work_one()
+    
+    job = jobs_for(question)[0]
+    assert job.status == 'done'
+    assert stellar_answers(question) == 1
+    assert question.answer_count == 1
+    assert Notification.query.filter_by(user_id=user.id).count() == 1
+    assert not job_queue.work_one()
+
+def test_mentions_before_the_job_starts_share_one_job(job_queue, question, user):
+    for text in ('first', 'second', 'third'):
+        job_queue.enqueue(question.id, question.title, text, user.id)
+    jobs = jobs_for(question)
+    assert len(jobs) == 1
+    assert jobs[0].prompt == 'third'
+
+def test_retry_keeps_the_question_deduplicated(job_queue, question, user, monkeypatch):
+    def broken(title, prompt):
+        raise RuntimeError('model down')
+    monkeypatch.setattr(ai_jobs, 'request_ai_answer', broken)
+    job_queue.enqueue(question.id, question.title, 'first', user.id)
+    job_queue.work_one()
+    
+    job = jobs_for(question)[0]
+    assert (job.status, job.dedupe_key) == ('pending', job_queue.dedupe_key(question.id))
+    job_queue.enqueue(question.id, question.title, 'again', user.id)
+    assert len(jobs_for(question)) == 1
+
+def test_mention_during_a_failing_run_gives_one_answer(job_queue, question, user, monkeypatch):
+    job_queue.enqueue(question.id, question.title, 'first', user.id)
+    job = job_queue.claim_next()
+    # A new mention arrives while the first job is running, which then fails
+    job_queue.enqueue(question.id, question.title, 'second', user.id)
+    job_queue.job_failed(job, RuntimeError('model down'))
+    
+    while job_queue.work_one():
+        pass
+    assert [job.status for job in jobs_for(question)] == ['done', 'done']
+    assert jobs_for(question)[0].last_error.startswith('Superseded')
+    assert stellar_answers(question) == 1
+
+def test_stale_job_is_requeued_once(job_queue, question, user):
+    job_queue.enqueue(question.id, question.title, 'first', user.id)
+    job = job_queue.claim_next()
+    job.started_at = datetime.utcnow() - timedelta(seconds=job_queue.job_timeout + 1)
+    db.session.commit()
+    
+    job_queue.requeue_stale(datetime.utcnow())
+    assert (job.status, job.dedupe_key) == ('pending', job_queue.dedupe_key(question.id))
+    job_queue.enqueue(question.id, question.title, 'again', user.id)
+    assert len(jobs_for(question)) == 1
+
+def test_idle_stale_check_does_not_write(job_queue, app_context):
+    statements = []
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        job_queue.requeue_stale(datetime.utcnow())
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    assert not [statement for statement in statements if statement.lstrip().upper().startswith('UPDATE')]
+
+def test_worker_overtaken_by_a_stale_requeue_does_not_answer_again(job_queue, question, user):
+    job_queue.enqueue(question.id, question.title, 'first', user.id)
+    claimed, resume = threading.Event(), threading.Event()
+    
+    def slow_worker():
+        # Each thread has its own app context, and with it its own session, like a real worker
+        with app.app_context():
+            job = job_queue.claim_next()
+            claimed.set()
+            resume.wait()
+            job_queue.run_job(job)
+    original = threading.Thread(target=slow_worker)
+    original.start()
+    claimed.wait()
+    
+    # The original worker looks dead, so its job is requeued and another worker answers it
+    db.session.execute(db.update(AIJob).where(AIJob.question_id == question.id)
+                         .values(started_at=datetime.utcnow() - timedelta(seconds=job_queue.job_timeout + 1)))
+    db.session.commit()
+    assert job_queue.work_one()
+    
+    resume.set()
+    original.join()
+    db.session.expire_all()
+    assert stellar_answers(question) == 1
+    assert Notification.query.filter_by(user_id=user.id).count() == 1
+    assert [job.status for job in jobs_for(question)] == ['done']
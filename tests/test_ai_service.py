@@ -0,0 +1,88 @@
+import json
+import threading
+import pytest
+import ai_service
+from ai_service import ResponseCache, request_ai_answer, stream_ai_answer, build_prompt
+from llm_backends import StubBackend
+
+class CountingBackend(StubBackend):
+    """Stub backend that counts the calls reaching it"""
+    def __init__(self, token_delay=0.0):
+        super().__init__(token_delay)
+        self.calls = 0
+    
+    def stream(self, prompt):
+        self.calls += 1
+        return super().stream(prompt)
+
+@pytest.fixture
+def backend(monkeypatch):
+    backend = CountingBackend()
+    monkeypatch.setattr(ai_service, '_backend', backend)
+    monkeypatch.setattr(ai_service, 'response_cache', ResponseCache(16, 60, follow_timeout=5))
+    return backend
+
+def test_stream_yields_the_stub_reply_in_chunks(backend):
+    chunks = list(stream_ai_answer('Reverse a list', 'How do I reverse a list?'))
+    assert len(chunks) > 1
+    assert ''.join(chunks) == backend.generate(build_prompt('Reverse a list', 'How do I reverse a list?'))
+
+def test_streamed_answer_is_cached(backend):
+    first = ''.join(stream_ai_answer('Reverse a list', 'How do I reverse a list?'))
+    again = list(stream_ai_answer('reverse a LIST', '<p>How do I reverse a list?</p>'))
+    assert again == [first]
+    assert request_ai_answer('Reverse a list', 'How do I reverse a list?') == first
+    assert backend.calls == 1
+
+def test_identical_requests_share_one_call(backend):
+    backend.token_delay = 0.01
+    answers = []
+    threads = [threading.Thread(target=lambda: answers.append(request_ai_answer('Sort a dict', 'By value?')))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(answers)) == 1
+    assert backend.calls == 1
+
+def test_failed_call_releases_waiters(backend, monkeypatch):
+    def broken(prompt):
+        raise RuntimeError('model down')
+    monkeypatch.setattr(backend, 'stream', broken)
+    with pytest.raises(RuntimeError):
+        request_ai_answer('Parse JSON', 'In Python?')
+    assert ai_service.response_cache._inflight == {}
+
+def test_follower_answers_itself_when_the_leader_stalls(backend, monkeypatch):
+    cache = ResponseCache(16, 60, follow_timeout=0.05)
+    monkeypatch.setattr(ai_service, 'response_cache', cache)
+    prompt = cache.normalize('Merge dicts', 'In one line?')
+    _, flight, leader = cache.begin(prompt)
+    assert leader
+    
+    assert request_ai_answer('Merge dicts', 'In one line?') == \
+        backend.generate(build_prompt('Merge dicts', 'In one line?'))
+    assert ''.join(stream_ai_answer('Merge dicts', 'In one line?'))
+
+def test_failed_semantic_lookup_is_a_miss(backend, monkeypatch):
+    cache = ResponseCache(16, 60, semantic_threshold=0.5, follow_timeout=5)
+    def broken(prompt):
+        raise RuntimeError('no encoder')
+    monkeypatch.setattr(cache, 'embed', broken)
+    monkeypatch.setattr(ai_service, 'response_cache', cache)
+    assert request_ai_answer('Read a file', 'Line by line?')
+    assert cache._inflight == {}
+
+def test_ai_chat_streams_server_sent_events(backend, client):
+    response = client.post('/ai_chat', json={'message': 'How do I reverse a list?', 'stream': True})
+    assert response.mimetype == 'text/event-stream'
+    
+    events = []
+    for block in response.get_data(as_text=True).strip().split('\n\n'):
+        name, data = block.split('\n')
+        events.append((name[len('event: '):], json.loads(data[len('data: '):])))
+    names = [name for name, _ in events]
+    assert names[0] == 'context' and names[-1] == 'done'
+    assert set(names[1:-1]) == {'token'} and len(names) > 3
+    assert ''.join(data['text'] for name, data in events if name == 'token').startswith('This is a **local test reply**')
@@ -0,0 +1,20 @@
+from app import db
+from models import Answer, Question
+import counters
+
+def test_reconcile_repairs_drifted_counters(answer, user):
+    counters.toggle_vote(user.id, answer.id, 'up')
+    question = answer.question
+    question.answer_count = 7
+    answer.upvotes, answer.score = 3, 3
+    db.session.commit()
+    
+    questions, answers, tags, users = counters.reconcile_counters()
+    assert questions >= 1 and answers >= 1
+    db.session.expire_all()
+    question = db.session.get(Question, question.id)
+    answer = db.session.get(Answer, answer.id)
+    assert question.answer_count == Answer.query.filter_by(question_id=question.id).count() == 1
+    assert (answer.upvotes, answer.downvotes, answer.score) == (1, 0, 1)
+    # A second pass finds nothing left to repair for these rows
+    assert counters.reconcile_counters()[:2] == (0, 0)
@@ -0,0 +1,43 @@
+from app import db
+from models import Question
+from fulltext import search_index
+
+def add_question(user, title, description):
+    question = Question(title=title, description=description, user_id=user.id)
+    db.session.add(question)
+    db.session.flush()
+    search_index.update_question(question)
+    db.session.commit()
+    return question
+
+def ranked(query):
+    matches = search_index.matches(query)
+    return [row.question_id for row in db.session.execute(
+        db.select(matches.c.question_id).order_by(matches.c.rank.desc(), matches.c.question_id))]
+
+def test_title_matches_outrank_body_matches(user):
+    body = add_question(user, 'Packaging a library', '<p>How do I publish zygomorphic wheels?</p>')
+    title = add_question(user, 'Zygomorphic wheels for every platform', '<p>Building them in CI.</p>')
+    add_question(user, 'Unrelated', '<p>Nothing to see.</p>')
+    
+    assert ranked('zygomorphic wheels') == [title.id, body.id]
+    # Every word has to match
+    assert ranked('zygomorphic nonexistentword') == []
+
+def test_user_input_is_never_parsed_as_query_syntax(user):
+    question = add_question(user, 'Quokka "quoting" rules', '<p>NEAR OR NOT AND * ^</p>')
+    assert ranked('quokka" OR NOT (') == [question.id]
+    assert ranked('"*^()') == []
+
+def test_snippets_are_escaped_and_highlighted(user):
+    question = add_question(user, 'Escaping', '<p>Why does &lt;script&gt; break my platypus template?</p>')
+    snippet = search_index.snippets('platypus', [question.id])[question.id]
+    assert '<mark>platypus</mark>' in snippet
+    assert '<script>' not in snippet and '&lt;script&gt;' in snippet
+
+def test_deleted_questions_stop_matching(user):
+    question = add_question(user, 'Axolotl regeneration', '<p>Limbs.</p>')
+    search_index.delete_question(question.id)
+    db.session.delete(question)
+    db.session.commit()
+    assert ranked('axolotl') == []
@@ -0,0 +1,42 @@
+from datetime import datetime, timedelta
+import numpy as np
+from metadata_store import MetadataBuilder
+
+START = datetime(2024, 1, 1)
+TAGS = ['python', 'flask', 'numpy']
+
+def row(i):
+    return {'id': i + 1, 'created_at': (START + timedelta(days=i)).isoformat(), 'views': i, 'answer_count': i % 3,
+            'title': f"Question {i}", 'description': 'é' * i, 'author': f"user{i % 4}",
+            'tags': [tag for j, tag in enumerate(TAGS) if i % (j + 2) == 0]}
+
+def store_with_pending(n_base=12, n_pending=5):
+    builder = MetadataBuilder()
+    for i in range(n_base):
+        builder.add(row(i))
+    store = builder.build()
+    for i in range(n_base, n_base + n_pending):
+        store.append(row(i))
+    return store
+
+def expected_mask(rows, tag, created_after):
+    return np.array([(tag is None or tag in info['tags']) and
+                     (created_after is None or datetime.fromisoformat(info['created_at']) >= created_after)
+                     for info in rows])
+
+def test_filters_match_every_row_in_base_and_pending():
+    store = store_with_pending()
+    rows = [row(i) for i in range(len(store))]
+    assert [store.get(i) for i in range(len(store))] == rows
+    for tag in [None, 'missing'] + TAGS:
+        for created_after in [None, START + timedelta(days=7), START + timedelta(days=14, hours=1)]:
+            assert np.array_equal(store.filter_mask(len(store), tag, created_after),
+                                  expected_mask(rows, tag, created_after))
+
+def test_merge_moves_pending_rows_into_columns():
+    store = store_with_pending()
+    merged = store.merged(len(store))
+    assert merged.n_base == len(store) and not merged.pending
+    assert [merged.get(i) for i in range(len(store))] == [store.get(i) for i in range(len(store))]
+    assert np.array_equal(merged.filter_mask(len(store), 'flask'), store.filter_mask(len(store), 'flask'))
+    assert merged.ids().tolist() == list(range(1, len(store) + 1))
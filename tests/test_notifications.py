@@ -0,0 +1,81 @@
+import json
+import time
+import threading
+from datetime import timedelta
+from app import app, db
+from models import Notification, NotificationArchive, User
+from notifications import NotificationArchiver, notification_hub, notify
+
+def unread(user):
+    return db.session.scalar(db.select(User.unread_notifications).where(User.id == user.id))
+
+def test_events_are_published_only_once_committed(user):
+    subscription = notification_hub.subscribe(user.id)
+    try:
+        notify(user.id, 'Rolled back', '/question/1')
+        db.session.rollback()
+        assert subscription.empty() and unread(user) == 0
+        
+        notify(user.id, 'Kept', '/question/1')
+        assert subscription.empty()
+        db.session.commit()
+        event, data = subscription.get_nowait()
+        assert (event, data['message'], data['unread']) == ('notification', 'Kept', 1)
+        assert unread(user) == 1
+    finally:
+        notification_hub.unsubscribe(user.id, subscription)
+    assert notification_hub.connections() == 0
+
+def test_stream_is_a_long_poll_that_ends_on_its_own(client, user, monkeypatch):
+    monkeypatch.setattr(notification_hub, 'stream_timeout', 0.5)
+    user_id = user.id
+    
+    def notify_later():
+        time.sleep(0.1)
+        with app.app_context():
+            notify(user_id, 'Pushed', '/question/1')
+            db.session.commit()
+    thread = threading.Thread(target=notify_later)
+    thread.start()
+    started = time.monotonic()
+    body = client.get('/notifications/stream').get_data(as_text=True)
+    thread.join()
+    
+    assert time.monotonic() - started < 5
+    events = [(block.split('\n')[0], json.loads(block.split('data: ', 1)[1]))
+              for block in body.strip().split('\n\n')]
+    assert events == [('event: unread', {'unread': 0}),
+                      ('event: notification', {'message': 'Pushed', 'link': '/question/1',
+                                               'created_at': events[1][1]['created_at'], 'unread': 1})]
+    assert notification_hub.connections() == 0
+
+def test_mark_read_up_to_the_newest_seen_leaves_later_ones_unread(client, user):
+    notifications = [notify(user.id, f"Message {i}") for i in range(25)]
+    db.session.commit()
+    
+    pages = [client.get('/notifications').get_json()]
+    pages.append(client.get(f"/notifications?cursor={pages[0]['next_cursor']}").get_json())
+    ids = [n['id'] for page in pages for n in page['notifications']]
+    assert ids == [n.id for n in reversed(notifications)] and pages[1]['next_cursor'] is None
+    
+    # A notification arriving after the page was drawn is not marked
+    notify(user.id, 'Arrived later')
+    db.session.commit()
+    assert client.post('/notifications/read', json={'up_to': ids[0]}).get_json() == {'unread': 1}
+    assert client.post('/notifications/read', json={'up_to': 'x'}).status_code == 400
+    assert client.post('/notifications/read').get_json() == {'unread': 0}
+    assert unread(user) == 0
+
+def test_archiver_moves_only_old_read_notifications(user):
+    archiver = NotificationArchiver(retention_days=30, interval=0, batch_size=2)
+    old, old_unread, recent = (notify(user.id, message) for message in ('old', 'old unread', 'recent'))
+    db.session.commit()
+    for notification in (old, old_unread):
+        notification.created_at -= timedelta(days=31)
+    old.is_read = recent.is_read = True
+    db.session.commit()
+    
+    archiver.archive()
+    left = {n.message for n in Notification.query.filter_by(user_id=user.id)}
+    archived = {n.message for n in NotificationArchive.query.filter_by(user_id=user.id)}
+    assert (left, archived) == ({'old unread', 'recent'}, {'old'})
@@ -0,0 +1,49 @@
+from datetime import datetime
+import numpy as np
+import pytest
+from app import db
+from models import Question
+from pagination import SORT_KEYS, keyset_paginate, paginate_ranked
+
+@pytest.fixture
+def feed(user):
+    # Few distinct key values, so most page boundaries fall inside a run of ties
+    created_at = datetime(2024, 1, 1)
+    for i in range(23):
+        db.session.add(Question(title=f"Question {i}", description='<p>Body</p>', user_id=user.id,
+                                created_at=created_at if i % 2 else datetime(2024, 1, 1 + i % 5),
+                                views=i % 3, answer_count=i % 4))
+    db.session.commit()
+    return Question.query.filter_by(user_id=user.id)
+
+def walk(query, sort, per_page=4):
+    """Follow next cursors from the first page to the last, then prev cursors back"""
+    pages = [keyset_paginate(query, sort, per_page=per_page)]
+    while pages[-1].has_next:
+        pages.append(keyset_paginate(query, sort, pages[-1].next_cursor, per_page))
+    back = [pages[-1]]
+    while back[-1].has_prev:
+        back.append(keyset_paginate(query, sort, back[-1].prev_cursor, per_page))
+    return pages, back[::-1]
+
+@pytest.mark.parametrize('sort', sorted(SORT_KEYS))
+def test_cursor_walk_visits_every_row_once(feed, sort):
+    expected = [question.id for question in feed.order_by(*[column.desc() for column in SORT_KEYS[sort]])]
+    forward, backward = walk(feed, sort)
+    
+    assert [question.id for page in forward for question in page.items] == expected
+    assert [[question.id for question in page.items] for page in backward] == \
+           [[question.id for question in page.items] for page in forward]
+    assert not forward[0].has_prev and len(forward) == 6
+
+def test_ranked_pages_follow_the_same_cursors():
+    ids = np.array([9, 4, 7, 2, 8, 1, 5])
+    scores = np.array([0.9, 0.5, 0.5, 0.5, 0.3, 0.3, 0.1])
+    order = np.lexsort((-ids, -scores))
+    ids, scores = ids[order], scores[order]
+    
+    pages = [paginate_ranked('relevance', ids, scores, per_page=3)]
+    while pages[-1].has_next:
+        pages.append(paginate_ranked('relevance', ids, scores, pages[-1].next_cursor, per_page=3))
+    assert [item for page in pages for item in page.items] == ids.tolist()
+    assert paginate_ranked('relevance', ids, scores, pages[-1].prev_cursor, per_page=3).items == pages[-2].items
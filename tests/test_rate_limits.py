@@ -0,0 +1,61 @@
+import uuid
+import threading
+from app import app, db
+from rate_limits import DatabaseBucketStore, MemoryBucketStore
+
+def test_database_buckets_never_double_spend(app_context):
+    store = DatabaseBucketStore()
+    key = f"test:{uuid.uuid4().hex}"
+    admitted = []
+    
+    def take_many():
+        with app.app_context():
+            for _ in range(40):
+                allowed, _ = store.take(key, 50, 1e-9)
+                if allowed:
+                    admitted.append(True)
+            db.session.remove()
+    threads = [threading.Thread(target=take_many) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert len(admitted) == 50
+    allowed, retry_after = store.take(key, 50, 1 / 60)
+    assert not allowed and 0 < retry_after <= 60
+
+def test_database_bucket_refund_is_capped(app_context):
+    store = DatabaseBucketStore()
+    key = f"test:{uuid.uuid4().hex}"
+    assert store.take(key, 2, 1.0) == (True, 0.0)
+    assert store.take(key, 2, 1.0, cost=-5.0) == (True, 0.0)
+    assert [store.take(key, 2, 1e-9)[0] for _ in range(3)] == [True, True, False]
+
+def test_memory_prune_judges_each_bucket_by_its_own_limit():
+    store = MemoryBucketStore()
+    store.max_keys = 2
+    store.take('slow', 5, 1e-6)
+    store.take('fast', 5, 1e9)
+    store.take('other', 5, 1.0)
+    # 'fast' has refilled and is dropped; 'slow' is still spending down its own bucket
+    assert set(store._buckets) == {'slow', 'other'}
+
+def test_memory_prune_is_amortized_past_max_keys(monkeypatch):
+    store = MemoryBucketStore()
+    store.max_keys = 10
+    prune = store.prune
+    prunes = []
+    monkeypatch.setattr(store, 'prune', lambda now: prunes.append(now) or prune(now))
+    # None of these buckets refill, so every prune keeps them all
+    for i in range(1000):
+        store.take(f"slow:{i}", 5, 1e-9)
+    assert len(store._buckets) == 1000
+    assert len(prunes) == 7
+    
+    # Once the store doubles from what the last prune kept, the full buckets are dropped
+    for i in range(600):
+        store.take(f"fast:{i}", 5, 1e9)
+    assert len(prunes) == 8
+    assert sum(key.startswith('slow:') for key in store._buckets) == 1000
+    assert len(store._buckets) < 1100
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+from scipy import sparse
+from search_backends import ExactIndex, MaxScoreIndex
+
+def top(scores, k):
+    scores = scores.toarray().ravel()
+    best = np.argsort(-scores, kind='stable')[:k]
+    return [int(row) for row in best if scores[row] > 0]
+
+@pytest.fixture
+def matrix():
+    # Skewed term weights, so some terms can be skipped once the top k is settled
+    rng = np.random.default_rng(7)
+    matrix = sparse.random(400, 60, density=0.08, format='csr', random_state=rng)
+    matrix.data **= 3
+    return matrix
+
+def test_maxscore_matches_exact_scoring(matrix):
+    exact = ExactIndex(matrix)
+    maxscore = MaxScoreIndex(matrix)
+    queries = sparse.random(20, 60, density=0.1, format='csr', random_state=np.random.default_rng(3))
+    for k in (1, 5, 20):
+        exact_scores = exact.score(queries, k)
+        pruned_scores = maxscore.score(queries, k)
+        for i in range(queries.shape[0]):
+            assert top(pruned_scores[i], k) == top(exact_scores[i], k)
+            # Candidate rows carry their full score, not a partial sum
+            rows = pruned_scores[i].indices
+            assert np.allclose(pruned_scores[i].data, exact_scores[i].toarray().ravel()[rows])
+    # Small top-ks skip part of the posting lists
+    assert maxscore.score(queries, 1).nnz < exact.score(queries, 1).nnz
+
+def test_excluded_rows_do_not_hold_back_the_threshold(matrix):
+    maxscore = MaxScoreIndex(matrix)
+    query = matrix[:1]
+    exact_scores = ExactIndex(matrix).score(query, 5).toarray().ravel()
+    excluded = np.array(top(sparse.csr_matrix(exact_scores), 5))
+    exact_scores[excluded] = 0
+    scores = maxscore.score(query, 5, excluded_rows=excluded)
+    kept = scores.toarray().ravel()
+    kept[excluded] = 0
+    assert top(sparse.csr_matrix(kept), 5) == top(sparse.csr_matrix(exact_scores), 5)
+
+def test_prune_factor_below_one_is_rejected(matrix):
+    with pytest.raises(ValueError):
+        MaxScoreIndex(matrix, prune_factor=0.5)
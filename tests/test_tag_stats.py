@@ -0,0 +1,25 @@
+import uuid
+from app import db
+from models import Tag
+import counters
+
+def test_popular_tags_refresh_only_after_a_commit(app_context, monkeypatch):
+    monkeypatch.setattr(counters.tag_stats, 'ttl', 3600)
+    tag = Tag(name=f"tag-{uuid.uuid4().hex[:8]}", question_count=10 ** 6)
+    db.session.add(tag)
+    db.session.commit()
+    counters.tag_stats.invalidate()
+    assert (tag.name, 10 ** 6) in counters.tag_stats.top()
+    
+    # A rolled back change leaves the cached list, and nothing stale behind
+    counters.tags_changed([], [tag.id])
+    assert (tag.name, 10 ** 6) in counters.tag_stats.top()
+    db.session.rollback()
+    assert 'tag_stats_stale' not in db.session.info
+    
+    counters.tags_changed([], [tag.id])
+    db.session.commit()
+    assert (tag.name, 10 ** 6 + 1) in counters.tag_stats.top()
+    counters.tags_changed([tag.id], [])
+    db.session.commit()
+    assert (tag.name, 10 ** 6) in counters.tag_stats.top()
@@ -0,0 +1,44 @@
+import uuid
+from app import db
+from models import User
+import routes
+from user_directory import UserDirectory
+
+def add_user(name):
+    user = User(username=name, email=f"{name}@example.com", password_hash='x')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+def test_prefix_search_is_case_insensitive_and_limited(app_context):
+    prefix = f"Mention{uuid.uuid4().hex[:6]}"
+    names = [f"{prefix}{suffix}" for suffix in ('b', 'A', 'c', 'AA')]
+    for name in names:
+        add_user(name)
+    add_user(f"x{prefix}")
+    directory = UserDirectory(refresh_interval=3600)
+    
+    found = [username for username, role in directory.search(prefix.lower(), limit=10)]
+    assert found == sorted(names, key=str.lower)
+    assert len(directory.search(prefix, limit=2)) == 2
+    assert directory.search(f"{prefix}zz") == []
+
+def test_new_users_appear_once_whether_added_or_refreshed(app_context):
+    prefix = f"fresh{uuid.uuid4().hex[:6]}"
+    directory = UserDirectory(refresh_interval=3600)
+    directory.refresh(force=True)
+    
+    registered = add_user(f"{prefix}-registered")
+    directory.add(registered)
+    # Created by another process: only a refresh finds it
+    add_user(f"{prefix}-elsewhere")
+    assert directory.search(prefix) == [(registered.username, 'user')]
+    directory.refresh(force=True)
+    assert [username for username, role in directory.search(prefix)] == \
+           [f"{prefix}-elsewhere", registered.username]
+
+def test_mention_lookup_endpoint(client, user, monkeypatch):
+    monkeypatch.setattr(routes, 'user_directory', UserDirectory())
+    users = client.get(f"/api/users?prefix=@{user.username.upper()}&limit=500").get_json()
+    assert users == [{'username': user.username, 'role': user.role}]
+    assert client.get('/api/users?prefix=').get_json() == []
@@ -0,0 +1,155 @@
+import os
+import json
+import pytest
+from app import db
+from models import Question
+from index_store import IndexFormatError, current_build, read_index
+from vector_service import VectorDatabase
+
+QUERIES = ['kubernetes pods', 'haskell monads', 'docker volumes', 'flask blueprints', 'numpy broadcasting']
+
+@pytest.fixture(params=['tfidf', 'hashing'])
+def index_dir(request, tmp_path, monkeypatch, app_context):
+    monkeypatch.setenv('VECTOR_INDEX_MODE', request.param)
+    return str(tmp_path / 'index')
+
+def add_question(user, topic):
+    question = Question(title=f"How do I use {topic}?", description=f"<p>A question about {topic}.</p>",
+                        user_id=user.id)
+    db.session.add(question)
+    db.session.commit()
+    return question
+
+def edit_question(question, topic):
+    question.title = f"How do I use {topic}?"
+    question.description = f"<p>A question about {topic}.</p>"
+    db.session.commit()
+
+def matches(vector_db, query):
+    return [(match['id'], round(match['similarity'], 6))
+            for match in vector_db.search_similar(query, top_k=50, min_similarity=0.0)]
+
+def results(vector_db):
+    return {query: sorted(match['id'] for match in vector_db.search_similar(query, top_k=50, min_similarity=0.0))
+            for query in QUERIES}
+
+def fresh_results(tmp_path):
+    rebuilt = VectorDatabase(index_dir=str(tmp_path / 'rebuilt'))
+    rebuilt.build_index()
+    return results(rebuilt)
+
+@pytest.fixture
+def questions(user):
+    # A fitted vocabulary only knows the words it was fitted on, so the first
+    # build sees every topic the tests later write; which questions match a
+    # query is then the same incrementally as after a rebuild, in both modes
+    add_question(user, 'kubernetes pods and haskell monads')
+    return [add_question(user, topic) for topic in ('docker volumes', 'flask blueprints', 'numpy broadcasting')]
+
+def test_incremental_writes_match_a_rebuild(index_dir, tmp_path, questions, user):
+    vector_db = VectorDatabase(index_dir=index_dir)
+    vector_db.build_index()
+    
+    edit_question(questions[0], 'kubernetes pods')
+    vector_db.update_question(questions[0].id)
+    question_id = questions[1].id
+    db.session.delete(questions[1])
+    db.session.commit()
+    vector_db.delete_question(question_id)
+    vector_db.update_question(add_question(user, 'haskell monads').id)
+    
+    assert results(vector_db) == fresh_results(tmp_path)
+    assert question_id not in results(vector_db)['flask blueprints']
+
+def test_reloaded_index_replays_the_journal(index_dir, tmp_path, questions):
+    writer = VectorDatabase(index_dir=index_dir)
+    writer.build_index()
+    edit_question(questions[2], 'haskell monads')
+    writer.update_question(questions[2].id)
+    
+    restarted = VectorDatabase(index_dir=index_dir)
+    assert restarted.load_index()
+    assert results(restarted) == results(writer) == fresh_results(tmp_path)
+
+def test_peer_process_sees_incremental_writes(index_dir, tmp_path, questions):
+    writer = VectorDatabase(index_dir=index_dir)
+    writer.build_index()
+    peer = VectorDatabase(index_dir=index_dir)
+    peer.load_index()
+    
+    edit_question(questions[0], 'kubernetes pods')
+    writer.update_question(questions[0].id)
+    question_id = questions[1].id
+    db.session.delete(questions[1])
+    db.session.commit()
+    writer.delete_question(question_id)
+    
+    assert peer.reload_if_changed()
+    assert results(peer) == fresh_results(tmp_path)
+    # A process does not re-apply its own journaled writes
+    assert not writer.reload_if_changed()
+
+def test_write_during_a_peer_build_survives_its_save(index_dir, tmp_path, questions):
+    builder = VectorDatabase(index_dir=index_dir)
+    builder.build_index()
+    peer = VectorDatabase(index_dir=index_dir)
+    peer.load_index()
+    
+    build_snapshot = builder.build_snapshot
+    def build_then_write():
+        # The peer's change commits after the build has read the database
+        snapshot = build_snapshot()
+        edit_question(questions[2], 'haskell monads')
+        peer.update_question(questions[2].id)
+        return snapshot
+    builder.build_snapshot = build_then_write
+    builder.build_index()
+    
+    expected = fresh_results(tmp_path)
+    restarted = VectorDatabase(index_dir=index_dir)
+    assert restarted.load_index()
+    assert results(restarted) == expected
+    builder.reload_if_changed()
+    assert results(builder) == expected
+
+def test_saved_index_round_trips(index_dir, questions):
+    writer = VectorDatabase(index_dir=index_dir)
+    writer.build_index()
+    name, arrays, documents, attributes = read_index(index_dir)
+    assert name == current_build(index_dir) and attributes['encoder'] == writer.snapshot.encoder.settings()
+    
+    restarted = VectorDatabase(index_dir=index_dir)
+    assert restarted.load_index()
+    for query in QUERIES:
+        assert matches(restarted, query) == matches(writer, query)
+    
+    # Writes after the save come back from the journal with the same scores
+    edit_question(questions[1], 'kubernetes pods')
+    writer.update_question(questions[1].id)
+    restarted = VectorDatabase(index_dir=index_dir)
+    assert restarted.load_index()
+    for query in QUERIES:
+        assert matches(restarted, query) == matches(writer, query)
+
+def test_corrupt_or_foreign_builds_are_rejected(index_dir, questions):
+    VectorDatabase(index_dir=index_dir).build_index()
+    build_dir = os.path.join(index_dir, 'builds', current_build(index_dir))
+    
+    # Flip a byte without changing the size: only the checksum catches it
+    with open(os.path.join(build_dir, 'data.bin'), 'r+b') as f:
+        byte = f.read(1)
+        f.seek(0)
+        f.write(bytes([byte[0] ^ 0xff]))
+    with pytest.raises(IndexFormatError, match='Checksum'):
+        read_index(index_dir)
+    read_index(index_dir, verify=False)
+    assert not VectorDatabase(index_dir=index_dir).load_index()
+    
+    header_path = os.path.join(build_dir, 'header.json')
+    with open(header_path) as f:
+        header = json.load(f)
+    header['version'] += 1
+    with open(header_path, 'w') as f:
+        json.dump(header, f)
+    with pytest.raises(IndexFormatError, match='version'):
+        read_index(index_dir, verify=False)
@@ -0,0 +1,23 @@
+from app import db
+from models import Question
+from counters import ViewCounter
+
+def test_views_are_deduplicated_and_flushed_in_one_batch(question):
+    counter = ViewCounter(flush_interval=3600, dedupe_window=600)
+    question.views = 5
+    db.session.commit()
+    updated_at = question.updated_at
+    
+    assert counter.record(question.id, 'user:1')
+    assert not counter.record(question.id, 'user:1')
+    assert counter.record(question.id, 'ip:10.0.0.1', 'Mozilla/5.0')
+    assert not counter.record(question.id, 'ip:10.0.0.2', 'Googlebot/2.1')
+    assert counter.pending(question.id) == 2
+    
+    assert counter.flush() == 1
+    assert counter.pending(question.id) == 0 and counter.flush() == 0
+    db.session.expire_all()
+    question = db.session.get(Question, question.id)
+    assert question.views == 7
+    # A view is not an edit
+    assert question.updated_at == updated_at
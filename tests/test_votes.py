@@ -0,0 +1,50 @@
+import random
+import threading
+from app import app, db
+from models import Answer, User, Vote
+import counters
+import routes
+from vector_service import PassageDatabase
+
+def test_concurrent_votes_keep_the_counters_exact(answer):
+    voters = []
+    for i in range(6):
+        voter = User(username=f"voter-{answer.id}-{i}", email=f"voter-{answer.id}-{i}@example.com", password_hash='x')
+        db.session.add(voter)
+        voters.append(voter)
+    db.session.commit()
+    voter_ids = [voter.id for voter in voters]
+    
+    def click(voter_id, seed):
+        clicks = random.Random(seed)
+        with app.app_context():
+            for _ in range(10):
+                counters.toggle_vote(voter_id, answer.id, clicks.choice(['up', 'down']), attempts=20)
+    threads = [threading.Thread(target=click, args=(voter_id, seed))
+               for seed, voter_id in enumerate(voter_ids + voter_ids)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    db.session.expire_all()
+    votes = Vote.query.filter_by(answer_id=answer.id).all()
+    upvotes = sum(vote.vote_type == 'up' for vote in votes)
+    downvotes = sum(vote.vote_type == 'down' for vote in votes)
+    answer = db.session.get(Answer, answer.id)
+    assert (answer.upvotes, answer.downvotes, answer.score) == (upvotes, downvotes, upvotes - downvotes)
+    assert len(votes) == len({vote.user_id for vote in votes})
+
+def test_clicking_the_same_vote_withdraws_it(answer, user):
+    assert counters.toggle_vote(user.id, answer.id, 'up') == ('up', (1, 1, 0))
+    assert counters.toggle_vote(user.id, answer.id, 'down') == ('down', (-1, 0, 1))
+    assert counters.toggle_vote(user.id, answer.id, 'down') == (None, (0, 0, 0))
+
+def test_votes_refresh_the_chat_passage_scores(client, answer, tmp_path, monkeypatch):
+    passage_db = PassageDatabase(index_dir=str(tmp_path / 'passages'))
+    passage_db.build_index()
+    monkeypatch.setattr(routes, 'passage_db', passage_db)
+    client.post(f"/vote/{answer.id}/up")
+    passages = [passage for passage in passage_db.search_similar('reverse list reversed slicing', top_k=50)
+                if passage['answer_id'] == answer.id]
+    assert passages and all(passage['score'] == 1 for passage in passages)
@@ -0,0 +1,71 @@
+import os
+import time
+import bisect
+import threading
+from app import db
+from models import User
+
+MAX_PREFIX_RESULTS = 20  # Most users a typeahead lookup may ask for
+
+class UserDirectory:
+    """Usernames kept sorted in memory for @mention typeahead.
+    
+    A prefix lookup is two binary searches over the sorted lowercase
+    names, so it costs the same however many users there are. Users are
+    never renamed or deleted, so the directory only has to grow: new
+    registrations are added directly, and users created by other
+    processes are read incrementally (id > the highest id seen) at most
+    every `refresh_interval` seconds.
+    """
+    def __init__(self, refresh_interval=None):
+        self.refresh_interval = refresh_interval if refresh_interval is not None else \
+            float(os.environ.get('USER_DIRECTORY_REFRESH', 30))
+        self._keys = []     # Lowercase usernames, sorted
+        self._entries = []  # (username, role) in the same order
+        self._max_id = 0
+        self._refreshed_at = None
+        self._lock = threading.Lock()
+    
+    def search(self, prefix, limit=10):
+        """Return up to `limit` (username, role) pairs whose username starts with `prefix`, case-insensitively"""
+        self.refresh()
+        prefix = prefix.lower()
+        with self._lock:
+            start = bisect.bisect_left(self._keys, prefix)
+            # Every name with the prefix sorts before prefix + the highest code point
+            end = bisect.bisect_left(self._keys, prefix + '\U0010ffff', start, min(start + limit, len(self._keys)))
+            return self._entries[start:end]
+    
+    def refresh(self, force=False):
+        """Load users added since the last refresh, if it is due"""
+        if not force and self._refreshed_at is not None and \
+                time.monotonic() - self._refreshed_at < self.refresh_interval:
+            return
+        rows = db.session.execute(
+            db.select(User.id, User.username, User.role).where(User.id > self._max_id).order_by(User.id)
+        ).all()
+        with self._lock:
+            for user_id, username, role in rows:
+                self._insert(username, role)
+                self._max_id = user_id
+            self._refreshed_at = time.monotonic()
+    
+    def add(self, user):
+        """Add a newly committed user without waiting for the next refresh"""
+        # The highest id seen is left alone: users other processes created meanwhile may have lower ids
+        with self._lock:
+            self._insert(user.username, user.role)
+    
+    def _insert(self, username, role):
+        key = username.lower()
+        index = bisect.bisect_left(self._keys, key)
+        # The same user can arrive both from add() and from a refresh
+        while index < len(self._keys) and self._keys[index] == key:
+            if self._entries[index][0] == username:
+                return
+            index += 1
+        self._keys.insert(index, key)
+        self._entries.insert(index, (username, role))
+
+# Global instance
+user_directory = UserDirectory()
@@ -0,0 +1,163 @@
+import itertools
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer, HashingVectorizer
+from sklearn.preprocessing import normalize
+
+class TfidfEncoder:
+    """TF-IDF over a vocabulary fitted to the whole corpus.
+    
+    Rows encoded after the fit reuse its vocabulary and idf weights, so the
+    index drifts as the forum grows and needs periodic refits.
+    """
+    mode = 'tfidf'
+    drifts = True
+    
+    def __init__(self, vectorizer=None):
+        self.vectorizer = vectorizer or TfidfVectorizer(
+            max_features=5000,
+            stop_words='english',
+            ngram_range=(1, 2)
+        )
+    
+    def fit_transform(self, documents, chunk_size):
+        """Fit a fresh encoder to the documents, returning (encoder, matrix)"""
+        encoder = TfidfEncoder()
+        return encoder, encoder.vectorizer.fit_transform(documents)
+    
+    def transform(self, documents):
+        """Encode documents as stored, L2-normalized rows"""
+        return self.vectorizer.transform(documents)
+    
+    def transform_queries(self, queries):
+        return self.vectorizer.transform(queries)
+    
+    @property
+    def space(self):
+        """Identifies the vector space: rows from encoders with equal spaces are comparable"""
+        return self.vectorizer
+    
+    def added(self, vectors):
+        return self
+    
+    def removed(self, vectors):
+        return self
+    
+    def settings(self):
+        params = self.vectorizer.get_params()
+        return {
+            'mode': self.mode,
+            'max_features': params['max_features'],
+            'stop_words': params['stop_words'],
+            'ngram_range': list(params['ngram_range'])
+        }
+    
+    def state(self):
+        """Return (arrays, documents, attributes) describing the fitted encoder"""
+        vocabulary = {term: int(index) for term, index in self.vectorizer.vocabulary_.items()}
+        return {'idf': self.vectorizer.idf_}, {'vocabulary': vocabulary}, {}
+    
+    def restored(self, arrays, documents, attributes):
+        """Return a fitted copy of this encoder from a saved state"""
+        encoder = TfidfEncoder()
+        encoder.vectorizer.vocabulary_ = documents['vocabulary']
+        encoder.vectorizer.idf_ = arrays['idf']
+        return encoder
+
+class HashingEncoder:
+    """Feature hashing with online document frequencies.
+    
+    There is no vocabulary to fit: documents are hashed into a fixed number
+    of features and stored as L2-normalized term frequencies, while document
+    frequencies are kept as running counts. Queries are weighted with the
+    current idf at search time, so adding a question is O(1) in the corpus
+    size and the index never needs a refit for drift.
+    """
+    mode = 'hashing'
+    drifts = False
+    
+    def __init__(self, n_features=2 ** 18, document_frequency=None, n_documents=0):
+        self.hasher = HashingVectorizer(
+            n_features=n_features,
+            stop_words='english',
+            ngram_range=(1, 2),
+            alternate_sign=False,
+            norm='l2'
+        )
+        self.n_features = n_features
+        self.document_frequency = document_frequency if document_frequency is not None else \
+            np.zeros(n_features, dtype=np.int32)
+        self.n_documents = n_documents
+    
+    def fit_transform(self, documents, chunk_size):
+        """Hash documents chunk by chunk, counting document frequencies as they stream past"""
+        document_frequency = np.zeros(self.n_features, dtype=np.int32)
+        n_documents = 0
+        chunks = []
+        documents = iter(documents)
+        while True:
+            batch = list(itertools.islice(documents, chunk_size))
+            if not batch:
+                break
+            rows = self.hasher.transform(batch)
+            document_frequency += np.bincount(rows.indices, minlength=self.n_features).astype(np.int32)
+            n_documents += rows.shape[0]
+            chunks.append(rows)
+        if not chunks:
+            raise ValueError("No documents to encode")
+        encoder = HashingEncoder(self.n_features, document_frequency, n_documents)
+        return encoder, sparse.vstack(chunks, format='csr')
+    
+    def transform(self, documents):
+        """Encode documents as stored, L2-normalized term frequency rows"""
+        return self.hasher.transform(documents)
+    
+    def transform_queries(self, queries):
+        """Weight query terms by the current idf, then L2-normalize"""
+        vectors = self.hasher.transform(queries)
+        idf = np.log((1 + self.n_documents) / (1 + self.document_frequency[vectors.indices])) + 1
+        vectors.data *= idf
+        return normalize(vectors)
+    
+    @property
+    def space(self):
+        # Hashed features do not depend on the corpus
+        return (self.mode, self.n_features)
+    
+    def counted(self, vectors, delta):
+        # Each stored row holds a term at most once, so counting indices counts documents
+        counts = np.bincount(vectors.indices, minlength=self.n_features).astype(np.int32)
+        document_frequency = self.document_frequency + delta * counts
+        return HashingEncoder(self.n_features, document_frequency, self.n_documents + delta * vectors.shape[0])
+    
+    def added(self, vectors):
+        """Return an encoder whose statistics include newly stored rows"""
+        return self.counted(vectors, 1)
+    
+    def removed(self, vectors):
+        """Return an encoder whose statistics no longer include stored rows"""
+        return self.counted(vectors, -1)
+    
+    def settings(self):
+        return {
+            'mode': self.mode,
+            'n_features': self.n_features,
+            'stop_words': 'english',
+            'ngram_range': [1, 2]
+        }
+    
+    def state(self):
+        return {'document_frequency': self.document_frequency}, {}, {'n_documents': self.n_documents}
+    
+    def restored(self, arrays, documents, attributes):
+        # Copy out of the memory map: the counts are updated on every write
+        return HashingEncoder(self.n_features, np.array(arrays['document_frequency']),
+                              attributes['n_documents'])
+
+def create_encoder(mode, n_features=2 ** 18):
+    """Return an unfitted encoder for an index mode ('tfidf' or 'hashing')"""
+    if mode == 'tfidf':
+        return TfidfEncoder()
+    if mode == 'hashing':
+        return HashingEncoder(n_features)
+    raise ValueError(f"Unknown vector index mode: {mode}")
@@ -1,24 +1,190 @@
 import json
 import re
-import pickle
 import os
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+import time
+import logging
+import threading
+import itertools
+from collections import OrderedDict
+from scipy import sparse
 import numpy as np
-from models import Question, Answer
-from app import db
+from models import User, Question, Answer, Tag, question_tags
+from app import app, db
+from index_store import IndexFormatError, IndexJournal, build_attributes, current_build, read_index, write_index
+from search_backends import create_index
+from vector_encoders import create_encoder
+from metadata_store import MetadataBuilder, MetadataStore, QUESTION_SCHEMA, PASSAGE_SCHEMA
+
+MIN_SIMILARITY = 0.1  # Matches below this are not worth showing
+BATCH_SIZE = 256  # Queries scored per sparse product in batched search
+DESCRIPTION_CHARS = 200  # Only a snippet of each description is kept in the index
+PASSAGE_CHARS = 400  # Target length of an answer passage
+PASSAGE_CANDIDATES = 20  # Passages retrieved before re-ranking and packing for chat
+ACCEPTED_BOOST = 0.2  # Rank bonus for passages from an accepted answer
+SCORE_BOOST = 0.02  # Rank bonus per answer vote, up to MAX_SCORE_BOOST votes
+MAX_SCORE_BOOST = 10
+
+class IndexSnapshot:
+    """A published, read-only view of the vector index.
+    
+    Readers grab the current snapshot once and use only that object, so a
+    rebuild or incremental write can never show them a half-updated index.
+    `metadata` is shared with later snapshots of the same fit and only ever
+    appended to, which is safe because rows past `n_rows` are ignored.
+    """
+    def __init__(self, encoder, question_vectors, delta_vectors, metadata,
+                 tombstones=frozenset(), rows_since_fit=0):
+        self.encoder = encoder
+        self.question_vectors = question_vectors  # Base segment, as produced by the last fit
+        self.delta_vectors = delta_vectors  # Rows added or replaced since the last merge
+        self.metadata = metadata  # MetadataStore, row-aligned with base rows followed by delta rows
+        self.tombstones = frozenset(tombstones)  # Rows whose question was edited or deleted
+        self.tombstone_rows = np.fromiter(self.tombstones, dtype=np.int64, count=len(self.tombstones))
+        self.rows_since_fit = rows_since_fit
+        self.search_index = None  # Built over the base segment when the snapshot is published
+        self.generation = 0
+    
+    @property
+    def n_rows(self):
+        rows = self.question_vectors.shape[0]
+        if self.delta_vectors is not None:
+            rows += self.delta_vectors.shape[0]
+        return rows
+    
+    def row_vector(self, row):
+        """Return the stored vector for a row of either segment"""
+        base_rows = self.question_vectors.shape[0]
+        if row < base_rows:
+            return self.question_vectors[row]
+        return self.delta_vectors[row - base_rows]
+    
+    def row_vectors(self, rows):
+        return sparse.vstack([self.row_vector(row) for row in rows], format='csr')
+    
+    def replace(self, **changes):
+        """Return a copy of this snapshot with some fields changed"""
+        fields = {
+            'encoder': self.encoder,
+            'question_vectors': self.question_vectors,
+            'delta_vectors': self.delta_vectors,
+            'metadata': self.metadata,
+            'tombstones': self.tombstones,
+            'rows_since_fit': self.rows_since_fit
+        }
+        fields.update(changes)
+        snapshot = IndexSnapshot(**fields)
+        if 'question_vectors' not in changes:
+            snapshot.search_index = self.search_index
+        return snapshot
+
+class QueryCache:
+    """Bounded LRU cache of search results keyed on (normalized query, index generation).
+    
+    Entries for older generations can never be hit again; the index also
+    clears the cache whenever it publishes a new snapshot so they do not
+    linger until evicted.
+    """
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+    
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return None
+    
+    def put(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def clear(self):
+        with self._lock:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+    
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
 
 class VectorDatabase:
-    def __init__(self):
-        self.vectorizer = TfidfVectorizer(
-            max_features=5000,
-            stop_words='english',
-            ngram_range=(1, 2)
-        )
-        self.question_vectors = None
-        self.question_data = []
-        self.data_file = 'vector_data.pkl'
+    schema = QUESTION_SCHEMA
+    
+    def __init__(self, refit_drift_ratio=None, refit_tombstone_ratio=None, delta_merge_rows=None,
+                 rebuild_debounce=None, index_dir=None):
+        self.snapshot = None
+        self.generation = 0
+        self.id_to_row = {}  # Writer-side map of question id to its live rows, for the current snapshot lineage
+        self.index_dir = index_dir or os.environ.get('VECTOR_INDEX_DIR', 'vector_index')
+        self.journal = IndexJournal(self.index_dir)
+        self.journal_position = None  # How far into the journal the live snapshot has caught up
+        self.loaded_build = None  # On-disk build the current snapshot lineage came from
+        self.verify_index = os.environ.get('VECTOR_INDEX_VERIFY', '1') != '0'
+        
+        # Incremental maintenance thresholds
+        self.refit_drift_ratio = refit_drift_ratio if refit_drift_ratio is not None else \
+            float(os.environ.get('VECTOR_REFIT_DRIFT_RATIO', 0.2))
+        self.refit_tombstone_ratio = refit_tombstone_ratio if refit_tombstone_ratio is not None else \
+            float(os.environ.get('VECTOR_REFIT_TOMBSTONE_RATIO', 0.2))
+        self.delta_merge_rows = delta_merge_rows if delta_merge_rows is not None else \
+            int(os.environ.get('VECTOR_DELTA_MERGE_ROWS', 1024))
+        self.rebuild_debounce = rebuild_debounce if rebuild_debounce is not None else \
+            float(os.environ.get('VECTOR_REBUILD_DEBOUNCE', 2.0))
+        self.load_chunk_size = int(os.environ.get('VECTOR_LOAD_CHUNK_SIZE', 1000))
+        
+        # 'tfidf' fits a vocabulary to the corpus; 'hashing' needs no fit and never drifts
+        self.index_mode = os.environ.get('VECTOR_INDEX_MODE', 'tfidf')
+        self.hashing_features = int(os.environ.get('VECTOR_HASHING_FEATURES', 2 ** 18))
+        self.reload_interval = float(os.environ.get('VECTOR_INDEX_RELOAD_INTERVAL', 30))
+        
+        # Search backend over the base segment: 'exact' (brute force) or 'maxscore'
+        self.search_backend = os.environ.get('VECTOR_SEARCH_BACKEND', 'exact')
+        self.prune_factor = float(os.environ.get('VECTOR_SEARCH_PRUNE_FACTOR', 1.0))
+        
+        # Chat lookups repeat a lot; cache them per index generation
+        self.context_cache = QueryCache(int(os.environ.get('VECTOR_CONTEXT_CACHE_SIZE', 1024)))
         
+        # Writers (incremental updates, publishing a build) are serialized;
+        # readers never take any of these locks.
+        self._write_lock = threading.RLock()
+        self._build_lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._building = False
+        self._pending_ids = set()
+        
+        # Background builder state
+        self._rebuild_event = threading.Event()
+        self._last_rebuild_request = 0.0
+        self._builder_thread = None
+        self._builder_lock = threading.Lock()
+    
+    def create_encoder(self):
+        return create_encoder(self.index_mode, n_features=self.hashing_features)
+    
     def clean_html(self, text):
         """Remove HTML tags from text"""
         return re.sub(r'<[^>]+>', '', text)
@@ -29,114 +195,517 @@ class VectorDatabase:
         text = re.sub(r'[^\w\s]', ' ', text)
         return text.lower().strip()
     
-    def build_index(self):
-        """Build or rebuild the vector index from all questions and answers"""
-        questions = Question.query.all()
+    def question_document(self, row, answer_count, tags):
+        """Return the processed document and stored metadata for a question row"""
+        # Combine question title and description
+        question_text = f"{row.title} {row.description}"
+        processed_text = self.preprocess_text(question_text)
         
-        # Prepare data for vectorization
-        documents = []
-        question_data = []
+        description = self.clean_html(row.description)
+        if len(description) > DESCRIPTION_CHARS:
+            description = description[:DESCRIPTION_CHARS] + '...'
         
-        for question in questions:
-            # Combine question title and description
-            question_text = f"{question.title} {question.description}"
-            processed_text = self.preprocess_text(question_text)
-            
-            # Get all answers for this question
-            answers = Answer.query.filter_by(question_id=question.id).all()
-            answer_texts = []
-            for answer in answers:
-                clean_answer = self.clean_html(answer.content)
-                answer_texts.append(clean_answer)
-            
-            # Store question data
-            question_info = {
-                'id': question.id,
-                'title': question.title,
-                'description': self.clean_html(question.description),
-                'author': question.author.username,
-                'created_at': question.created_at.isoformat(),
-                'tags': [tag.name for tag in question.tags],
-                'answers': answer_texts,
-                'answer_count': len(answer_texts),
-                'views': question.views
-            }
-            
-            question_data.append(question_info)
-            documents.append(processed_text)
+        question_info = {
+            'id': row.id,
+            'title': row.title,
+            'description': description,
+            'author': row.username,
+            'created_at': row.created_at.isoformat(),
+            'tags': tags,
+            'answer_count': answer_count,
+            'views': row.views or 0
+        }
+        return processed_text, question_info
+    
+    def iter_corpus(self, question_ids=None):
+        """Stream (document, metadata) pairs for questions in id order.
+        
+        Questions (with their author and stored answer count) and tags are
+        read with two set-based queries ordered by question id and fetched in
+        chunks; the streams are merged as they go, so neither ORM objects nor
+        the whole corpus are ever held in memory at once.
+        """
+        questions = db.select(Question.id, Question.title, Question.description,
+                              Question.created_at, Question.views, Question.answer_count, User.username) \
+                      .join(User, User.id == Question.user_id) \
+                      .order_by(Question.id)
+        tags = db.select(question_tags.c.question_id, Tag.name) \
+                 .join(Tag, Tag.id == question_tags.c.tag_id) \
+                 .order_by(question_tags.c.question_id, Tag.id)
         
-        if documents:
-            # Create vectors
-            self.question_vectors = self.vectorizer.fit_transform(documents)
-            self.question_data = question_data
+        if question_ids is not None:
+            questions = questions.where(Question.id.in_(question_ids))
+            tags = tags.where(question_tags.c.question_id.in_(question_ids))
+        
+        tags_for = self._grouped_lookup(tags)
+        
+        for row in self._stream(questions):
+            yield self.question_document(row, row.answer_count, tags_for(row.id))
+    
+    def _stream(self, statement):
+        return db.session.execute(statement.execution_options(yield_per=self.load_chunk_size))
+    
+    def _grouped_lookup(self, statement):
+        """Return a function giving the values for each question id, read from a stream
+        ordered by question id. Ids must be requested in ascending order."""
+        groups = ((question_id, [row[1] for row in rows])
+                  for question_id, rows in itertools.groupby(self._stream(statement), key=lambda row: row[0]))
+        current = next(groups, None)
+        
+        def values_for(question_id):
+            nonlocal current
+            while current is not None and current[0] < question_id:
+                current = next(groups, None)
+            if current is not None and current[0] == question_id:
+                return current[1]
+            return []
+        return values_for
+    
+    def build_snapshot(self):
+        """Encode the whole corpus with a fresh encoder without touching the live index"""
+        metadata = MetadataBuilder(self.schema)
+        
+        def documents():
+            for processed_text, question_info in self.iter_corpus():
+                metadata.add(question_info)
+                yield processed_text
+        
+        # Create vectors, streaming documents straight into the encoder
+        try:
+            encoder, question_vectors = self.create_encoder().fit_transform(documents(), self.load_chunk_size)
+        except ValueError:
+            if not len(metadata):
+                return None
+            raise
+        return IndexSnapshot(encoder, question_vectors, None, metadata.build())
+    
+    def build_index(self):
+        """Build or rebuild the vector index and publish it with a single swap"""
+        with self._build_lock:
+            with self._write_lock:
+                self._building = True
+                self._pending_ids = set()
+                # Changes from here on may be missing from the build; they land in this segment or later
+                journal_segment = self.journal.start_segment()
+            try:
+                snapshot = self.build_snapshot()
+                if snapshot is None:
+                    return False
+                
+                with self._write_lock:
+                    self.id_to_row = self.row_map(snapshot)
+                    # Catch up on writes that landed while the build was running; other
+                    # processes' writes are picked up from the journal by the next tail
+                    for question_id in sorted(self._pending_ids):
+                        snapshot = self.sync_question(snapshot, question_id)
+                    self.publish(snapshot)
+                    self.journal_position = (journal_segment, 0)
+                
+                # Save to file
+                self.save_index(snapshot, journal_segment)
+                return True
+            finally:
+                with self._write_lock:
+                    self._building = False
+                    self._pending_ids = set()
+    
+    def publish(self, snapshot):
+        """Atomically make a snapshot the one readers see"""
+        with self._write_lock:
+            if snapshot.search_index is None:
+                snapshot.search_index = create_index(self.search_backend, snapshot.question_vectors,
+                                                     prune_factor=self.prune_factor)
+            self.generation += 1
+            snapshot.generation = self.generation
+            self.snapshot = snapshot
+        self.context_cache.clear()
+    
+    def request_rebuild(self):
+        """Ask the background builder for a rebuild; bursts of requests are coalesced"""
+        self._last_rebuild_request = time.monotonic()
+        self._rebuild_event.set()
+        self.start_builder()
+    
+    def start_builder(self):
+        with self._builder_lock:
+            if self._builder_thread is None or not self._builder_thread.is_alive():
+                self._builder_thread = threading.Thread(target=self._builder_loop,
+                                                        name=f"{os.path.basename(self.index_dir)}-builder")
+                self._builder_thread.daemon = True
+                self._builder_thread.start()
+    
+    def _builder_loop(self):
+        while True:
+            if not self._rebuild_event.wait(timeout=self.reload_interval):
+                # Idle: pick up a build another worker has published
+                self._run_in_app(self.reload_if_changed)
+                continue
             
-            # Save to file
-            self.save_index()
+            # Debounce: wait until requests have stopped arriving for a moment
+            while True:
+                idle = time.monotonic() - self._last_rebuild_request
+                if idle >= self.rebuild_debounce:
+                    break
+                time.sleep(self.rebuild_debounce - idle)
+            self._rebuild_event.clear()
             
-            return True
-        return False
+            self._run_in_app(self.build_index)
     
-    def save_index(self):
-        """Save the vector index to disk"""
-        data = {
-            'vectorizer': self.vectorizer,
-            'question_vectors': self.question_vectors,
-            'question_data': self.question_data
+    def _run_in_app(self, task):
+        try:
+            with app.app_context():
+                task()
+        except Exception as e:
+            logging.error(f"Error maintaining vector index: {e}")
+    
+    def reload_if_changed(self):
+        """Load the on-disk build if another process has published a newer one, else apply their journaled writes"""
+        build = current_build(self.index_dir)
+        if build is not None and build != self.loaded_build:
+            return self.load_index()
+        return self.tail_journal()
+    
+    def save_index(self, snapshot=None, journal_segment=None):
+        """Save the vector index to disk in the memory-mappable format.
+        
+        `journal_segment` is the first journal segment the snapshot may be
+        missing changes from; loading the build replays from there.
+        """
+        snapshot = snapshot or self.snapshot
+        if snapshot is None:
+            return
+        if journal_segment is None:
+            journal_segment = self.journal_position[0] if self.journal_position else 0
+        current = build_attributes(self.index_dir).get(current_build(self.index_dir))
+        if current is not None and current.get('journal_segment', 0) > journal_segment:
+            # Another process published a build that started later; ours would be older
+            logging.info("Not saving vector index: a newer build is already on disk")
+            return
+        snapshot = self.merged(snapshot)
+        matrix = snapshot.question_vectors
+        encoder_arrays, encoder_documents, encoder_attributes = snapshot.encoder.state()
+        
+        arrays = {
+            'data': matrix.data,
+            'indices': matrix.indices,
+            'indptr': matrix.indptr,
+            'tombstones': snapshot.tombstone_rows,
+            **encoder_arrays
         }
-        with open(self.data_file, 'wb') as f:
-            pickle.dump(data, f)
+        arrays.update(snapshot.metadata.arrays())
+        documents = encoder_documents
+        attributes = {
+            'shape': list(matrix.shape),
+            'rows_since_fit': snapshot.rows_since_fit,
+            'journal_segment': journal_segment,
+            'encoder': snapshot.encoder.settings(),
+            **encoder_attributes
+        }
+        os.makedirs(self.index_dir, exist_ok=True)
+        self.loaded_build = write_index(self.index_dir, arrays, documents, attributes)
+        
+        # Keep every segment a build still on disk would replay, including one
+        # a slower build started earlier may yet make current
+        kept = [build.get('journal_segment', 0) for build in build_attributes(self.index_dir).values()]
+        self.journal.discard_before(min(kept + [journal_segment]))
+        for path in self.legacy_journal_files():
+            if os.path.exists(path):
+                os.remove(path)
+    
+    def read_snapshot(self):
+        """Open the current on-disk build as a snapshot backed by memory maps"""
+        build, arrays, documents, attributes = read_index(self.index_dir, verify=self.verify_index)
+        
+        encoder = self.create_encoder()
+        if attributes.get('encoder') != encoder.settings():
+            raise IndexFormatError("Index was built with a different index mode or encoder settings")
+        encoder = encoder.restored(arrays, documents, attributes)
+        
+        question_vectors = sparse.csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']),
+                                             shape=tuple(attributes['shape']), copy=False)
+        metadata = MetadataStore.from_arrays(arrays, self.schema)
+        if len(metadata) != question_vectors.shape[0]:
+            raise IndexFormatError("Index metadata does not match the vector matrix")
+        
+        snapshot = IndexSnapshot(encoder, question_vectors, None, metadata,
+                                 arrays['tombstones'].tolist(), attributes['rows_since_fit'])
+        return build, snapshot, attributes.get('journal_segment', 0)
     
     def load_index(self):
         """Load the vector index from disk"""
-        if os.path.exists(self.data_file):
-            try:
-                with open(self.data_file, 'rb') as f:
-                    data = pickle.load(f)
-                self.vectorizer = data['vectorizer']
-                self.question_vectors = data['question_vectors']
-                self.question_data = data['question_data']
-                return True
-            except:
+        try:
+            build, snapshot, journal_segment = self.read_snapshot()
+        except (IndexFormatError, OSError, KeyError, ValueError) as e:
+            logging.warning(f"Vector index on disk is unusable, it will be rebuilt: {e}")
+            return False
+        
+        with self._write_lock:
+            self.id_to_row = self.row_map(snapshot)
+            self.loaded_build = build
+            self.publish(self.replay_journal(snapshot, journal_segment))
+        if self.needs_refit(self.snapshot):
+            self.request_rebuild()
+        return True
+    
+    def row_map(self, snapshot):
+        """Map question ids to their live rows in a snapshot"""
+        id_to_row = {}
+        for row, question_id in enumerate(snapshot.metadata.ids()[:snapshot.n_rows].tolist()):
+            if row not in snapshot.tombstones:
+                id_to_row.setdefault(question_id, []).append(row)
+        return id_to_row
+    
+    def legacy_journal_files(self):
+        """Journals written before the journal was split into segments"""
+        journal_file = os.path.join(self.index_dir, 'journal.log')
+        return [f"{journal_file}.saving", journal_file]
+    
+    def replay_journal(self, snapshot, journal_segment):
+        """Re-apply every journaled update from a build's first journal segment on"""
+        question_ids = set()
+        for path in self.legacy_journal_files():
+            if os.path.exists(path):
+                with open(path) as f:
+                    question_ids.update(int(line) for line in f if line.strip())
+        entries, self.journal_position = self.journal.read((journal_segment, 0))
+        question_ids.update(question_id for _, question_id in entries)
+        for question_id in sorted(question_ids):
+            snapshot = self.sync_question(snapshot, question_id)
+        return snapshot
+    
+    def tail_journal(self):
+        """Apply writes other processes have journaled since we last looked"""
+        with self._write_lock:
+            if self.snapshot is None or self.journal_position is None:
                 return False
-        return False
+            entries, self.journal_position = self.journal.read(self.journal_position)
+            question_ids = {question_id for writer, question_id in entries if writer != self.journal.writer}
+            if not question_ids:
+                return False
+            snapshot = self.snapshot
+            for question_id in sorted(question_ids):
+                snapshot = self.sync_question(snapshot, question_id)
+            if self._building:
+                self._pending_ids.update(question_ids)
+            self.publish(snapshot)
+        
+        if self.needs_refit(snapshot):
+            self.request_rebuild()
+        return True
+    
+    def append_journal(self, question_id):
+        """Record a changed question for restarted and peer processes to catch up on"""
+        self.journal.append(question_id)
+    
+    def merged(self, snapshot):
+        """Return a snapshot with the delta segment folded into the base matrix"""
+        if snapshot.delta_vectors is None:
+            return snapshot
+        return snapshot.replace(
+            question_vectors=sparse.vstack([snapshot.question_vectors, snapshot.delta_vectors], format='csr'),
+            delta_vectors=None,
+            metadata=snapshot.metadata.merged(snapshot.n_rows)
+        )
+    
+    def with_rows(self, snapshot, question_id, vectors, infos):
+        """Return a snapshot with rows added to the delta segment, tombstoning the question's previous rows"""
+        tombstones = snapshot.tombstones
+        encoder = snapshot.encoder.added(vectors)
+        old_rows = self.id_to_row.get(question_id)
+        if old_rows:
+            tombstones = tombstones | set(old_rows)
+            encoder = encoder.removed(snapshot.row_vectors(old_rows))
+        
+        delta_vectors = vectors if snapshot.delta_vectors is None else \
+            sparse.vstack([snapshot.delta_vectors, vectors], format='csr')
+        self.id_to_row[question_id] = list(range(snapshot.n_rows, snapshot.n_rows + vectors.shape[0]))
+        for info in infos:
+            snapshot.metadata.append(info)
+        snapshot = snapshot.replace(encoder=encoder, delta_vectors=delta_vectors, tombstones=tombstones,
+                                    rows_since_fit=snapshot.rows_since_fit + vectors.shape[0])
+        
+        # Keep the delta small so appends stay cheap; merging is amortized over many writes
+        if delta_vectors.shape[0] >= self.delta_merge_rows:
+            snapshot = self.merged(snapshot)
+        return snapshot
+    
+    def without_question(self, snapshot, question_id):
+        """Return a snapshot with a question's rows tombstoned"""
+        rows = self.id_to_row.pop(question_id, None)
+        if not rows:
+            return snapshot
+        return snapshot.replace(encoder=snapshot.encoder.removed(snapshot.row_vectors(rows)),
+                                tombstones=snapshot.tombstones | set(rows))
+    
+    def sync_question(self, snapshot, question_id):
+        """Bring a single question's rows in line with the database"""
+        documents = list(self.iter_corpus(question_ids=[question_id]))
+        if not documents:
+            return self.without_question(snapshot, question_id)
+        
+        vectors = snapshot.encoder.transform([processed_text for processed_text, _ in documents])
+        return self.with_rows(snapshot, question_id, vectors, [info for _, info in documents])
+    
+    def needs_refit(self, snapshot):
+        """Check whether drift or tombstones warrant a full refit"""
+        total_rows = snapshot.n_rows
+        if total_rows == 0:
+            return True
+        if len(snapshot.tombstones) / total_rows > self.refit_tombstone_ratio:
+            return True
+        # Hashed indexes keep their statistics current, so only tombstones matter there
+        live_rows = max(total_rows - len(snapshot.tombstones), 1)
+        return snapshot.encoder.drifts and snapshot.rows_since_fit / live_rows > self.refit_drift_ratio
+    
+    def ensure_index(self, block=True):
+        """Make sure an index is published, loading it or scheduling a build if needed.
+        
+        With block=False this never waits: if another thread is already
+        loading, or there is nothing on disk yet, it returns False at once.
+        """
+        if self.snapshot is not None:
+            return True
+        if not self._load_lock.acquire(blocking=block):
+            return False
+        try:
+            if self.snapshot is None and not self.load_index():
+                self.request_rebuild()
+                return False
+            self.start_builder()
+            return True
+        finally:
+            self._load_lock.release()
     
-    def search_similar(self, query, top_k=5):
-        """Search for similar questions using vector similarity"""
-        if self.question_vectors is None:
-            if not self.load_index():
-                if not self.build_index():
-                    return []
+    def similarity_rows(self, snapshot, query_vectors, top_k, min_similarity):
+        """Score queries against the index, returning a sparse (queries x rows) matrix.
         
-        # Process query
-        processed_query = self.preprocess_text(query)
-        query_vector = self.vectorizer.transform([processed_query])
+        TF-IDF rows are already L2-normalized, so cosine similarity is a plain
+        sparse product. The base segment goes through the configured search
+        backend; the small delta segment is always scored exactly.
+        """
+        scores = snapshot.search_index.score(query_vectors, top_k, min_similarity, snapshot.tombstone_rows)
+        if snapshot.delta_vectors is not None:
+            scores = sparse.hstack([scores, (snapshot.delta_vectors @ query_vectors.T).T], format='csr')
+        return scores
+    
+    def top_rows(self, snapshot, rows, scores, top_k, min_similarity):
+        """Pick the best `top_k` live rows above the threshold, best first"""
+        keep = scores > min_similarity
+        if len(snapshot.tombstone_rows):
+            keep &= ~np.isin(rows, snapshot.tombstone_rows)
+        rows, scores = rows[keep], scores[keep]
+        
+        if len(scores) > top_k:
+            best = np.argpartition(-scores, top_k - 1)[:top_k]
+            rows, scores = rows[best], scores[best]
+        order = np.argsort(-scores, kind='stable')
+        return rows[order], scores[order]
+    
+    def project(self, snapshot, rows, scores, fields):
+        """Build result dicts holding only the requested metadata fields"""
+        results = []
+        for row, score in zip(rows.tolist(), scores.tolist()):
+            result = snapshot.metadata.get(row, fields)
+            result['similarity'] = score
+            results.append(result)
+        return results
+    
+    def search_similar(self, query, top_k=5, fields=None, min_similarity=MIN_SIMILARITY):
+        """Search for similar questions using vector similarity.
         
-        # Calculate similarities
-        similarities = cosine_similarity(query_vector, self.question_vectors)[0]
+        `fields` limits which metadata fields each result carries; by default
+        every stored field is returned.
+        """
+        return self.search_similar_batch([query], top_k, fields, min_similarity)[0]
+    
+    def search_similar_batch(self, queries, top_k=5, fields=None, min_similarity=MIN_SIMILARITY):
+        """Search for many queries at once, returning one result list per query.
         
-        # Get top results
-        top_indices = np.argsort(similarities)[::-1][:top_k]
+        Queries are vectorized together and scored BATCH_SIZE at a time with a
+        single sparse product each, which is far cheaper than one call per query
+        for offline jobs such as duplicate detection.
+        """
+        if not queries or not self.ensure_index(block=False):
+            return [[] for _ in queries]
+        snapshot = self.snapshot
         
         results = []
-        for idx in top_indices:
-            if similarities[idx] > 0.1:  # Minimum similarity threshold
-                result = self.question_data[idx].copy()
-                result['similarity'] = float(similarities[idx])
-                results.append(result)
+        for start in range(0, len(queries), BATCH_SIZE):
+            batch = [self.preprocess_text(query) for query in queries[start:start + BATCH_SIZE]]
+            scores = self.similarity_rows(snapshot, snapshot.encoder.transform_queries(batch), top_k, min_similarity)
+            
+            for i in range(len(batch)):
+                row_scores = slice(scores.indptr[i], scores.indptr[i + 1])
+                rows, similarities = self.top_rows(snapshot, scores.indices[row_scores],
+                                                   scores.data[row_scores], top_k, min_similarity)
+                results.append(self.project(snapshot, rows, similarities, fields))
         
         return results
     
+    def ranked_matches(self, query, tag=None, created_after=None, min_similarity=MIN_SIMILARITY):
+        """Rank every question matching a query and the filters, returning (ids, similarities) best first.
+        
+        The filters are pushed down into the index rather than applied to a
+        top-k: the backend scores all candidate rows (those sharing a term
+        with the query), and a row mask built from the metadata columns drops
+        the ones outside the tag or date range before ranking. The cost
+        follows the query's terms, not how selective the filters are.
+        """
+        empty = np.empty(0, dtype=np.int64), np.empty(0)
+        if not self.ensure_index(block=False):
+            return empty
+        snapshot = self.snapshot
+        query_vectors = snapshot.encoder.transform_queries([self.preprocess_text(query)])
+        scores = self.similarity_rows(snapshot, query_vectors, snapshot.n_rows, min_similarity)
+        rows, similarities = scores.indices, scores.data
+        
+        keep = snapshot.metadata.filter_mask(snapshot.n_rows, tag, created_after)
+        keep[snapshot.tombstone_rows] = False
+        selected = keep[rows] & (similarities > min_similarity)
+        rows, similarities = rows[selected], similarities[selected]
+        if not len(rows):
+            return empty
+        
+        ids = snapshot.metadata.numeric_values(snapshot.metadata.schema.key, rows)
+        # Best similarity first, ties broken by the higher id, matching the keyset cursor order
+        order = np.lexsort((-ids, -similarities))
+        return ids[order], similarities[order]
+    
+    def embed(self, text):
+        """Return (space, vector) for comparing free text outside the index, or None before an index is loaded"""
+        snapshot = self.snapshot
+        if snapshot is None:
+            return None
+        return snapshot.encoder.space, snapshot.encoder.transform([self.preprocess_text(text)])
+    
+    def normalize_query(self, query):
+        """Collapse a query to the form used for cache keys"""
+        return ' '.join(self.preprocess_text(query).split())
+    
     def get_context_for_chat(self, query, max_context=3):
-        """Get relevant context for AI chat"""
-        similar_questions = self.search_similar(query, top_k=max_context)
+        """Get relevant context for AI chat, served from the cache when possible"""
+        snapshot = self.snapshot
+        if snapshot is None:
+            return self.build_chat_context(query, max_context)
         
+        key = (self.normalize_query(query), max_context, snapshot.generation)
+        context = self.context_cache.get(key)
+        if context is None:
+            context = self.build_chat_context(query, max_context)
+            self.context_cache.put(key, context)
+        return [dict(item) for item in context]
+    
+    def build_chat_context(self, query, max_context):
+        similar_questions = self.search_similar(query, top_k=max_context,
+                                                fields=('id', 'title', 'description'))
+        
+        # Answer text comes from the passage index, which ranks it against the query
         context = []
         for q in similar_questions:
             context_item = {
                 'question_id': q['id'],
                 'title': q['title'],
-                'description': q['description'][:200] + '...' if len(q['description']) > 200 else q['description'],
-                'answers': q['answers'][:2],  # Include top 2 answers
+                'description': q['description'],
                 'link': f"/question/{q['id']}",
                 'similarity': q['similarity']
             }
@@ -144,17 +713,123 @@ class VectorDatabase:
         
         return context
     
+    def apply_write(self, question_id, change):
+        """Publish a single incremental change and schedule a refit if it is due"""
+        with self._write_lock:
+            snapshot = change(self.snapshot, question_id)
+            if snapshot is self.snapshot:
+                return
+            if self._building:
+                self._pending_ids.add(question_id)
+            self.publish(snapshot)
+            self.append_journal(question_id)
+        
+        if self.needs_refit(snapshot):
+            self.request_rebuild()
+    
     def update_question(self, question_id):
-        """Update a single question in the index"""
-        # For simplicity, rebuild the entire index
-        # In production, you'd want incremental updates
-        self.build_index()
+        """Add or replace a single question in the index"""
+        if not self.ensure_index():
+            # No index yet; the scheduled build picks the question up
+            return
+        self.apply_write(question_id, self.sync_question)
     
     def delete_question(self, question_id):
         """Remove a question from the index"""
-        # For simplicity, rebuild the entire index
-        # In production, you'd want incremental updates
-        self.build_index()
+        if not self.ensure_index():
+            return
+        self.apply_write(question_id, self.without_question)
+
+class PassageDatabase(VectorDatabase):
+    """Index over answer passages, for feeding chat the best few paragraphs.
+    
+    Answers are split into passages of about PASSAGE_CHARS characters and
+    each passage is indexed with its question's title, so one question owns
+    several rows. Writes still go by question id: syncing a question
+    replaces all of its passages.
+    """
+    schema = PASSAGE_SCHEMA
+    
+    def __init__(self, **kwargs):
+        kwargs.setdefault('index_dir', os.environ.get('PASSAGE_INDEX_DIR', 'passage_index'))
+        super().__init__(**kwargs)
+        self.context_chars = int(os.environ.get('CHAT_CONTEXT_CHARS', 1500))
+    
+    def split_passages(self, text):
+        """Split answer text into passages of roughly PASSAGE_CHARS, breaking between words"""
+        passages = []
+        current = []
+        length = 0
+        for word in self.clean_html(text).split():
+            if current and length + len(word) + 1 > PASSAGE_CHARS:
+                passages.append(' '.join(current))
+                current, length = [], 0
+            current.append(word)
+            length += len(word) + 1
+        if current:
+            passages.append(' '.join(current))
+        return passages
+    
+    def iter_corpus(self, question_ids=None):
+        """Stream (document, metadata) pairs for answer passages in question id order"""
+        answers = db.select(Answer.id, Answer.question_id, Answer.content, Answer.score,
+                            Answer.is_accepted, Question.title) \
+                    .join(Question, Question.id == Answer.question_id) \
+                    .order_by(Answer.question_id, Answer.id)
+        if question_ids is not None:
+            answers = answers.where(Answer.question_id.in_(question_ids))
+        
+        for row in self._stream(answers):
+            for passage in self.split_passages(row.content):
+                passage_info = {
+                    'question_id': row.question_id,
+                    'answer_id': row.id,
+                    'score': row.score or 0,
+                    'is_accepted': bool(row.is_accepted),
+                    'title': row.title,
+                    'content': passage
+                }
+                yield self.preprocess_text(f"{row.title} {passage}"), passage_info
+    
+    def passage_rank(self, passage):
+        """Order passages by similarity, nudged up for accepted and well-voted answers"""
+        boost = 1.0 + min(max(passage['score'], 0), MAX_SCORE_BOOST) * SCORE_BOOST
+        if passage['is_accepted']:
+            boost += ACCEPTED_BOOST
+        return passage['similarity'] * boost
+    
+    def get_passages_for_chat(self, query, max_chars=None, per_question=2):
+        """Get the most relevant answer passages that fit in a character budget"""
+        max_chars = max_chars or self.context_chars
+        snapshot = self.snapshot
+        if snapshot is None:
+            return self.build_passages(query, max_chars, per_question)
+        
+        key = (self.normalize_query(query), max_chars, per_question, snapshot.generation)
+        passages = self.context_cache.get(key)
+        if passages is None:
+            passages = self.build_passages(query, max_chars, per_question)
+            self.context_cache.put(key, passages)
+        return [dict(passage) for passage in passages]
+    
+    def build_passages(self, query, max_chars, per_question):
+        candidates = self.search_similar(query, top_k=PASSAGE_CANDIDATES)
+        candidates.sort(key=self.passage_rank, reverse=True)
+        
+        # Greedily pack the best passages, skipping any that would overrun the budget
+        passages = []
+        used = 0
+        taken = {}
+        for passage in candidates:
+            question_id = passage['question_id']
+            if taken.get(question_id, 0) >= per_question or used + len(passage['content']) > max_chars:
+                continue
+            taken[question_id] = taken.get(question_id, 0) + 1
+            used += len(passage['content'])
+            passage['link'] = f"/question/{question_id}"
+            passages.append(passage)
+        return passages
 
-# Global instance
-vector_db = VectorDatabase()
\ No newline at end of file
+# Global instances
+vector_db = VectorDatabase()
+passage_db = PassageDatabase()